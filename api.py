@@ -1,24 +1,130 @@
 from __future__ import annotations
 
-from typing import Literal
+import asyncio
+import gc
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Literal, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
-from cwu_time_simulation import LayeredParams, LossInput, TankParams, compare_models
+from cwu_time_simulation import (
+    DEFAULT_AUDIT_PEAKS,
+    ENGINE_VERSION,
+    RECORD_SUMMARY,
+    ComparisonResult,
+    CostParams,
+    LayeredParams,
+    LossInput,
+    TankParams,
+    build_profile_24h,
+    compare_models,
+)
+from cwu_admission import AdmissionConfig, AdmissionController, AdmissionRejected
+from cwu_backends import default_backend, get_backend
+from cwu_cache import ResultCache, cache_key, cached_compare_models
+from cwu_jobs import STATUS_DONE, STATUS_FAILED, JobRunner, JobStore
+from cwu_report import MEDIA_TYPES, ReportRenderer, report_data, report_digest
+from cwu_singleflight import SingleFlight, cancel_checker
+from cwu_traffic import TrafficLog, TrafficRecorder
+
+
+# Kolejka zadań długich (audyty roczne, przeglądy, Monte Carlo) – wznawiana przy starcie
+_job_runner: Optional[JobRunner] = None
+
+
+def _jobs() -> JobRunner:
+    global _job_runner
+    if _job_runner is None:
+        _job_runner = JobRunner(JobStore(), workers=int(os.environ.get("CWU_JOB_WORKERS", "0")) or None)
+        _job_runner.start()
+    return _job_runner
+
+
+# Trwały cache wyników wspólny dla workerów (CWU_CACHE_DB="" wyłącza)
+_result_cache: Optional[ResultCache] = None
+
+
+def _results_cache() -> Optional[ResultCache]:
+    global _result_cache
+    if _result_cache is None and os.environ.get("CWU_CACHE_DB", None) != "":
+        _result_cache = ResultCache()
+    return _result_cache
+
+
+# Identyczne równoległe żądania liczone raz (w obrębie procesu workera)
+_inflight: SingleFlight = SingleFlight()
+
+
+# Kontrola przyjęć obliczeń (CWU_MAX_CONCURRENT / CWU_MAX_QUEUE / CWU_QUEUE_TIMEOUT_S; 0 wyłącza)
+_admission_config: Optional[AdmissionConfig] = AdmissionConfig.from_env()
+_admission: Optional[AdmissionController] = (
+    AdmissionController(_admission_config) if _admission_config is not None else None
+)
+
+
+# Raporty HTML/PDF: osobna pula procesów, żeby rysowanie nie zajmowało wątków obliczeń
+_report_renderer: Optional[ReportRenderer] = None
+
+
+def _reports() -> ReportRenderer:
+    global _report_renderer
+    if _report_renderer is None:
+        _report_renderer = ReportRenderer(workers=int(os.environ.get("CWU_REPORT_WORKERS", "1")))
+    return _report_renderer
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    _jobs()
+    _results_cache()
+    # Bez preload każdy worker rozgrzewa się sam, w tle; /readyz zgłasza gotowość dopiero potem.
+    # Po preload zostaje jedno obliczenie w wątku puli workera: wątki (i ich areny malloc)
+    # nie przechodzą przez fork, a bez tego pierwsze żądanie było ok. 2× wolniejsze.
+    warm = None
+    if _ready.is_set():
+        await run_in_threadpool(compare_models, **_engine_inputs(_WARMUP_PAYLOADS[0]))
+    else:
+        warm = asyncio.create_task(run_in_threadpool(warm_up))
+    try:
+        yield
+    finally:
+        if warm is not None and not warm.done():
+            warm.cancel()
+        if _job_runner is not None:
+            _job_runner.shutdown(wait=False)
+        if _report_renderer is not None:
+            _report_renderer.shutdown()
+        if _traffic_log is not None:
+            _traffic_log.close()
 
 
 # CORS middleware
-app = FastAPI(title="CWU – silnik decyzji mocy zamówionej", version="1.0")
+app = FastAPI(title="CWU – silnik decyzji mocy zamówionej", version="1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:3001"],
-    allow_methods=["POST"],
+    allow_methods=["GET", "POST"],
     allow_headers=["Content-Type"],
+    expose_headers=["Retry-After"],
 )
 
 
+@app.exception_handler(AdmissionRejected)
+async def _admission_rejected(_request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after_s)},
+    )
+
+
 class CWUInput(BaseModel):
     V_tank_l: int = Field(..., ge=1)
     T_set_C: float
@@ -26,6 +132,21 @@ class CWUInput(BaseModel):
     loss_kw: float = Field(..., ge=0)
     cost_kw_month: float = Field(..., ge=0)
     horizon_years: int = Field(..., ge=1)
+    # Limit czasu szukania Pzam [s]; po przekroczeniu wynik jest bezpieczną górną granicą (approximate=True)
+    time_budget_s: Optional[float] = Field(None, gt=0)
+    # Powtarzalna doba (stan okresowy zasobnika) zamiast startu od pełnego zasobnika
+    cyclic: bool = False
+
+
+# Zapis ruchu do odtwarzania (cwu_traffic.py) – tylko jawnie: CWU_TRAFFIC_LOG=ruch.jsonl
+_traffic_log: Optional[TrafficLog] = TrafficLog(os.environ["CWU_TRAFFIC_LOG"]) if os.environ.get("CWU_TRAFFIC_LOG") else None
+if _traffic_log is not None:
+    app.add_middleware(
+        TrafficRecorder,
+        log=_traffic_log,
+        fields=tuple(CWUInput.model_fields),
+        sample_rate=float(os.environ.get("CWU_TRAFFIC_SAMPLE", "1")),
+    )
 
 
 class CWUResponse(BaseModel):
@@ -37,7 +158,31 @@ class CWUResponse(BaseModel):
     cost_year: float
     cost_horizon: float
     decision: str
-    level: Literal["A", "B", "C"]
+    # None – wynik przybliżony (limit czasu): poziomu i kosztów nie ustala się, ΔP podane jako zakres
+    level: Optional[Literal["A", "B", "C"]]
+    approximate: bool = False
+    delta_P_min: Optional[float] = None
+    delta_P_max: Optional[float] = None
+
+
+# Domyślny limit czasu obliczeń dla endpointu (SLO); nadpisywany przez `time_budget_s` w żądaniu.
+_DEFAULT_TIME_BUDGET_S = float(os.environ["CWU_TIME_BUDGET_S"]) if os.environ.get("CWU_TIME_BUDGET_S") else None
+
+
+class JobSubmit(BaseModel):
+    kind: Literal["audit", "sweep", "monte_carlo", "sizing_curve", "comfort_curve"]
+    params: dict[str, Any]
+
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "done", "failed"]
+    progress: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    updated_at: float
 
 
 def _default_demand_profile_24h_lpm(dt_s: int) -> list[float]:
@@ -49,46 +194,112 @@ def _default_demand_profile_24h_lpm(dt_s: int) -> list[float]:
     To jest profil „audytowy demonstracyjny”: dwa krótkie piki rano i wieczorem.
     """
 
-    if dt_s <= 0:
-        raise ValueError("dt_s must be > 0")
-
-    steps = int((24 * 3600) / dt_s)
-    prof = [0.0] * steps
+    return build_profile_24h(dt_s=dt_s, peaks=DEFAULT_AUDIT_PEAKS)
 
-    def set_peak(start_min: int, duration_min: int, lpm: float) -> None:
-        start_i = int((start_min * 60) / dt_s)
-        end_i = int(((start_min + duration_min) * 60) / dt_s)
-        for i in range(max(0, start_i), min(steps, end_i)):
-            prof[i] = float(lpm)
 
-    set_peak(start_min=7 * 60, duration_min=20, lpm=60.0)
-    set_peak(start_min=19 * 60, duration_min=20, lpm=50.0)
+# Wspólny stan tylko do odczytu: budowany raz przy imporcie modułu, a nie na żądanie.
+# Przy `gunicorn --preload` import następuje przed forkiem workerów (współdzielenie copy-on-write).
+_API_DT_S = 60
+_DEFAULT_PROFILE_LPM: tuple[float, ...] = tuple(_default_demand_profile_24h_lpm(dt_s=_API_DT_S))
 
-    return prof
 
-
-@app.post("/api/cwu/moc-zamowiona", response_model=CWUResponse)
-def cwu_moc_zamowiona(payload: CWUInput) -> CWUResponse:
+def _engine_inputs(payload: CWUInput) -> dict[str, Any]:
+    """Wejścia `compare_models` z modelu API (bez kosztów – te liczone są poza silnikiem)."""
     tank = TankParams(
         volume_l=float(payload.V_tank_l),
         T_init_C=float(payload.T_set_C),
         T_set_C=float(payload.T_set_C),
         T_cold_C=10.0,
         T_min_C=float(payload.T_min_C),
-        dt_s=60,
+        dt_s=_API_DT_S,
     )
-
-    loss_input = LossInput(loss_kw=float(payload.loss_kw))
-    demand_lpm = _default_demand_profile_24h_lpm(dt_s=tank.dt_s)
-
-    res = compare_models(
+    return dict(
         tank=tank,
-        demand_lpm=demand_lpm,
-        loss_input=loss_input,
+        demand_lpm=_DEFAULT_PROFILE_LPM,
+        loss_input=LossInput(loss_kw=float(payload.loss_kw)),
         allowed_violation_min=0.0,
         layered=LayeredParams(hot_fraction=0.3, mixing_tau_s=3600.0),
+        # Odpowiedź używa tylko wartości skalarnych – serie czasowe nie są budowane
+        recording=RECORD_SUMMARY,
+        cyclic=payload.cyclic,
     )
 
+
+# --- Rozgrzanie i gotowość ---
+#
+# Pierwsze żądania po wdrożeniu płacą za leniwe ładowanie backendu, pierwsze przejścia
+# pętli silnika, pulę wątków i otwarcie cache wyników. `warm_up()` liczy kilka typowych
+# przypadków przed przyjęciem ruchu; /readyz odpowiada 200 dopiero po jego zakończeniu.
+#
+# CWU_PRELOAD=1 (z `gunicorn api:app -k uvicorn.workers.UvicornWorker --preload`):
+# rozgrzanie przy imporcie, w procesie nadrzędnym, a potem gc.freeze(), żeby zbieranie
+# śmieci w workerach nie kopiowało współdzielonych stron. Cache wyników (SQLite) i
+# kolejka zadań otwierane są zawsze w workerze – połączeń nie wolno dzielić przez fork.
+
+_WARMUP_PAYLOADS = (
+    CWUInput(V_tank_l=500, T_set_C=55.0, T_min_C=45.0, loss_kw=1.0, cost_kw_month=50.0, horizon_years=10),
+    CWUInput(V_tank_l=500, T_set_C=55.0, T_min_C=45.0, loss_kw=1.0, cost_kw_month=50.0, horizon_years=10, cyclic=True),
+)
+
+_ready = threading.Event()
+_warmup_s: Optional[float] = None
+
+
+def warm_up() -> float:
+    """Obliczenia rozgrzewające (z pominięciem cache wyników); zwraca czas [s] i ustawia gotowość."""
+    global _warmup_s
+    t0 = time.perf_counter()
+    get_backend(None)
+    for payload in _WARMUP_PAYLOADS:
+        inputs = _engine_inputs(payload)
+        cache_key(**inputs)
+        t_solve = time.perf_counter()
+        compare_models(**inputs)
+        if _admission is not None:
+            _admission.record_service_time(time.perf_counter() - t_solve)
+    _warmup_s = time.perf_counter() - t0
+    _ready.set()
+    return _warmup_s
+
+
+async def _compute(payload: CWUInput, inputs: dict[str, Any]) -> ComparisonResult:
+    """Wynik przez cache i single-flight (identyczne równoległe żądania liczone raz).
+
+    Kontrola przyjęć obejmuje tylko faktyczne obliczenie: trafienia w cache i żądania
+    dołączające do obliczenia w toku nie czekają w kolejce ani nie zajmują miejsca.
+    """
+    time_budget_s = payload.time_budget_s if payload.time_budget_s is not None else _DEFAULT_TIME_BUDGET_S
+    cache = _results_cache()
+    result_key = cache_key(**inputs)
+    if cache is not None:
+        hit = await run_in_threadpool(cache.get, result_key)
+        if hit is not None:
+            return hit
+    key = result_key + f"|budget={time_budget_s}"
+
+    async def run(cancel):
+        return await run_in_threadpool(
+            cached_compare_models,
+            cache,
+            **inputs,
+            time_budget_s=time_budget_s,
+            on_progress=cancel_checker(cancel),
+        )
+
+    async def compute(cancel):
+        if _admission is None:
+            return await run(cancel)
+        async with _admission.slot():
+            return await run(cancel)
+
+    return await _inflight.do(key, compute)
+
+
+@app.post("/api/cwu/moc-zamowiona", response_model=CWUResponse)
+async def cwu_moc_zamowiona(payload: CWUInput) -> CWUResponse:
+    # Koszty liczone są niżej, poza silnikiem – do klucza wchodzą tylko wejścia obliczeń
+    res = await _compute(payload, _engine_inputs(payload))
+
     # Wymaganie specyfikacji: delta_P = res.delta_P_kw
     # W silniku pole nazywa się `delta_P_kW` (zachowujemy sens fizyczny, mapujemy nazwę).
     delta_P = float(res.delta_P_kW)
@@ -97,9 +308,7 @@ def cwu_moc_zamowiona(payload: CWUInput) -> CWUResponse:
     cost_year = cost_month * 12.0
     cost_horizon = cost_year * float(payload.horizon_years)
 
-    level = str(res.decision_ui.get("level", "B"))
-    if level not in {"A", "B", "C"}:
-        level = "B"
+    level = res.recommendation_level if res.recommendation_level in {"A", "B", "C"} else None
 
     return CWUResponse(
         Pzam_final=float(res.Pzam_final_kw),
@@ -111,8 +320,106 @@ def cwu_moc_zamowiona(payload: CWUInput) -> CWUResponse:
         cost_horizon=cost_horizon,
         decision=str(res.final_decision_text),
         level=level,  # type: ignore[arg-type]
+        approximate=bool(res.approximate),
+        delta_P_min=res.delta_P_min_kW,
+        delta_P_max=res.delta_P_max_kW,
     )
 
 
+@app.post("/api/cwu/raport")
+async def cwu_raport(
+    payload: CWUInput,
+    request: Request,
+    fmt: Literal["html", "pdf"] = Query("html", alias="format"),
+) -> Response:
+    """Pełny raport audytowy (HTML albo PDF) dla danych jak w /api/cwu/moc-zamowiona.
+
+    Raport zawiera część finansową, więc stawka i horyzont trafiają tu do silnika.
+    Pliki są cache'owane po skrócie treści wyniku; ETag pozwala klientowi nie pobierać ich ponownie.
+    """
+    inputs = {
+        **_engine_inputs(payload),
+        "cost_params": CostParams(
+            cost_per_kw_month_zl=float(payload.cost_kw_month),
+            analysis_horizon_years=int(payload.horizon_years),
+        ),
+    }
+    res = await _compute(payload, inputs)
+
+    etag = f'"{report_digest(report_data(res), fmt)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    path = await _reports().render(res, fmt)
+    return FileResponse(
+        path,
+        media_type=MEDIA_TYPES[fmt],
+        filename=f"raport_moc_cwu.{fmt}",
+        headers=headers,
+    )
+
+
+@app.get("/healthz")
+async def healthz() -> dict[str, Any]:
+    """Stan workera; nie przechodzi przez kontrolę przyjęć (odpowiada także pod przeciążeniem).
+
+    result_cache/engine pozwalają `cwu_traffic.py odtworz` sprawdzić, czy odpowiedzi liczy silnik.
+    """
+    return {
+        "status": "ok",
+        "engine": ENGINE_VERSION,
+        "backend": default_backend(),
+        "result_cache": _results_cache() is not None,
+        "inflight": _inflight.in_flight(),
+        "admission": _admission.stats() if _admission is not None else None,
+    }
+
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """Gotowość do przyjmowania ruchu: 503, dopóki worker się nie rozgrzał."""
+    if not _ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming"}, headers={"Retry-After": "1"})
+    return JSONResponse(content={"status": "ready", "warmup_s": _warmup_s})
+
+
+# --- Zadania długie (kolejka) ---
+
+def _job_or_404(job_id: str) -> dict:
+    job = _jobs().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Nie ma takiego zadania.")
+    return job
+
+
+@app.post("/api/cwu/jobs", response_model=JobStatus, status_code=202)
+def submit_job(payload: JobSubmit) -> JobStatus:
+    job_id = _jobs().submit(payload.kind, payload.params)
+    return JobStatus(**_job_or_404(job_id))
+
+
+@app.get("/api/cwu/jobs/{job_id}", response_model=JobStatus)
+def job_status(job_id: str) -> JobStatus:
+    return JobStatus(**_job_or_404(job_id))
+
+
+@app.get("/api/cwu/jobs/{job_id}/result")
+def job_result(job_id: str) -> dict[str, Any]:
+    job = _job_or_404(job_id)
+    if job["status"] == STATUS_FAILED:
+        raise HTTPException(status_code=409, detail=f"Zadanie zakończone błędem: {job['error']}")
+    if job["status"] != STATUS_DONE:
+        raise HTTPException(status_code=409, detail=f"Zadanie jeszcze nie zakończone (status: {job['status']}).")
+    return {"id": job_id, "kind": job["kind"], "result": job["result"]}
+
+
+if os.environ.get("CWU_PRELOAD") == "1":
+    warm_up()
+    gc.freeze()
+
+
 # Uruchomienie:
 # uvicorn api:app --reload --port 8000
+# produkcyjnie (stan współdzielony przez fork):
+# CWU_PRELOAD=1 gunicorn api:app -k uvicorn.workers.UvicornWorker --preload -w 4
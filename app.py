@@ -1,6 +1,13 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import matplotlib.pyplot as plt
-from cwu_time_simulation import LayeredParams, LossInput, TankParams, compare_models
+from cwu_charts import draw_pzam_bars, pzam_bar_data
+from cwu_time_simulation import RECORD_SUMMARY, LayeredParams, LossInput, TankParams, compare_models
 
 st.set_page_config(
     page_title="CWU – decyzja mocy zamówionej",
@@ -11,33 +18,16 @@ st.title("CWU – decyzja mocy zamówionej")
 
 st.markdown("Demo lokalne (localhost) – model idealnie mieszany vs warstwowy")
 
-# ===== SIDEBAR =====
-st.sidebar.header("Parametry instalacji")
+# Opóźnienie (debounce) przeliczenia po zmianie suwaka oraz okres odpytywania wyniku w tle.
+DEBOUNCE_S = 0.25
+POLL_S = 0.3
+CACHE_MAX_ENTRIES = 256
+MAX_SESSIONS = 1024
+# Po takim czasie stan, którego obliczenie zakończyło się błędem, może być liczony ponownie
+ERROR_RETRY_S = 5.0
 
-V_tank = st.sidebar.slider("Pojemność zasobnika [l]", 300, 1500, 800, 50)
-T_set = st.sidebar.slider("Temperatura zadana CWU [°C]", 50, 60, 55)
-T_min = st.sidebar.slider("Temperatura minimalna [°C]", 40, 50, 45)
-loss_kw = st.sidebar.number_input("Straty CWU [kW]", value=3.0, step=0.5)
-
-st.sidebar.header("Parametry kosztowe")
-koszt_kw_mies = st.sidebar.number_input(
-    "Koszt mocy [zł/kW/miesiąc]",
-    min_value=10,
-    max_value=150,
-    value=50,
-    step=1,
-)
 
-lata = st.sidebar.selectbox(
-    "Horyzont analizy [lata]",
-    options=[5, 10, 15],
-    index=1,
-)
-
-run = st.sidebar.button("Oblicz")
-
-# ===== MAIN =====
-if run:
+def _oblicz(V_tank, T_set, T_min, loss_kw):
     # Silnik oczekuje obiektów konfiguracyjnych oraz profilu poboru demand_lpm.
     # demand_lpm jest zdefiniowane jako wypływ "na kranie" (po zmieszaniu) o T_delivery ≈ T_set.
 
@@ -59,14 +49,163 @@ if run:
     for i in range(19 * 60, 19 * 60 + 20):
         demand_lpm[i] = 50.0
 
-    res = compare_models(
+    return compare_models(
         tank=tank,
         demand_lpm=demand_lpm,
         loss_input=loss_input,
         allowed_violation_min=0.0,
         layered=LayeredParams(hot_fraction=0.3, mixing_tau_s=3600.0),
+        # GUI pokazuje tylko wartości skalarne – bez serii wyniki w cache LRU są małe
+        recording=RECORD_SUMMARY,
     )
 
+
+class _Przeliczanie:
+    """Wspólny dla procesu cache wyników + przeliczanie w tle z debounce.
+
+    - wynik dla danego stanu wejść liczony jest raz (LRU na CACHE_MAX_ENTRIES stanów),
+    - przeliczenie startuje dopiero, gdy stan nie zmienia się przez DEBOUNCE_S (zegar,
+      nie `sleep` w wątku obliczeń – odczekania kolejnych żądań się nie sumują),
+    - stany „przeskoczone” podczas przesuwania suwaka nie są liczone wcale; „aktualny”
+      stan pamiętany jest osobno dla każdej sesji, więc inna karta go nie unieważnia,
+    - błąd obliczeń jest pokazywany, a po ERROR_RETRY_S ponowne żądanie liczy od nowa.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._latest = OrderedDict()  # sesja -> ostatnio żądany stan
+        self._errors = OrderedDict()  # stan -> (czas, wyjątek)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cwu-przeliczanie")
+
+    def get(self, key):
+        with self._lock:
+            res = self._cache.get(key)
+            if res is not None:
+                self._cache.move_to_end(key)
+            return res
+
+    def error(self, key):
+        with self._lock:
+            entry = self._errors.get(key)
+            return entry[1] if entry is not None else None
+
+    def request(self, key, session):
+        """Żąda wyniku dla `key` jako aktualnego stanu sesji; bez efektu, gdy jest lub się liczy."""
+        with self._lock:
+            self._latest[session] = key
+            self._latest.move_to_end(session)
+            while len(self._latest) > MAX_SESSIONS:
+                self._latest.popitem(last=False)
+            if key in self._cache or key in self._pending:
+                return
+            entry = self._errors.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[0] < ERROR_RETRY_S:
+                    return
+                del self._errors[key]
+            self._pending.add(key)
+        timer = threading.Timer(DEBOUNCE_S, self._start, (key,))
+        timer.daemon = True
+        timer.start()
+
+    def _wanted(self, key):
+        """Czy któraś sesja nadal czeka na ten stan (wołane pod blokadą)."""
+        return any(k == key for k in self._latest.values())
+
+    def _start(self, key):
+        with self._lock:
+            if not self._wanted(key):
+                # Użytkownik przesunął suwak dalej – ten stan nie jest już potrzebny
+                self._pending.discard(key)
+                return
+        self._executor.submit(self._run, key)
+
+    def _run(self, key):
+        with self._lock:
+            if not self._wanted(key):
+                self._pending.discard(key)
+                return
+        try:
+            res = _oblicz(*key)
+        except Exception as exc:  # błąd pokazujemy w GUI, nie gubimy go w wątku
+            with self._lock:
+                self._errors[key] = (time.monotonic(), exc)
+                while len(self._errors) > CACHE_MAX_ENTRIES:
+                    self._errors.popitem(last=False)
+                self._pending.discard(key)
+            return
+        with self._lock:
+            self._cache[key] = res
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+            self._pending.discard(key)
+
+
+@st.cache_resource
+def _przeliczanie():
+    return _Przeliczanie()
+
+
+# ===== SIDEBAR =====
+st.sidebar.header("Parametry instalacji")
+
+V_tank = st.sidebar.slider("Pojemność zasobnika [l]", 300, 1500, 800, 50)
+T_set = st.sidebar.slider("Temperatura zadana CWU [°C]", 50, 60, 55)
+T_min = st.sidebar.slider("Temperatura minimalna [°C]", 40, 50, 45)
+loss_kw = st.sidebar.number_input("Straty CWU [kW]", value=3.0, step=0.5)
+
+st.sidebar.header("Parametry kosztowe")
+koszt_kw_mies = st.sidebar.number_input(
+    "Koszt mocy [zł/kW/miesiąc]",
+    min_value=10,
+    max_value=150,
+    value=50,
+    step=1,
+)
+
+lata = st.sidebar.selectbox(
+    "Horyzont analizy [lata]",
+    options=[5, 10, 15],
+    index=1,
+)
+
+# ===== MAIN =====
+
+klucz = (int(V_tank), int(T_set), int(T_min), float(loss_kw))
+sesja = st.session_state.setdefault("cwu_sesja", uuid.uuid4().hex)
+przeliczanie = _przeliczanie()
+przeliczanie.request(klucz, sesja)
+
+# Ostatni policzony wynik tej sesji – pokazywany, dopóki nowy liczy się w tle
+res = przeliczanie.get(klucz)
+if res is not None:
+    st.session_state["cwu_ostatni_wynik"] = (klucz, res)
+aktualny = res is not None
+if res is None and "cwu_ostatni_wynik" in st.session_state:
+    res = st.session_state["cwu_ostatni_wynik"][1]
+
+
+@st.fragment(run_every=None if aktualny else POLL_S)
+def _status_przeliczenia():
+    # Ponowne żądanie (bez efektu, gdy wynik jest lub się liczy): stan mógł wypaść z cache
+    # albo z kolejki, a po ERROR_RETRY_S błąd jest liczony od nowa
+    przeliczanie.request(klucz, sesja)
+    blad = przeliczanie.error(klucz)
+    if blad is not None:
+        st.error(f"Błąd obliczeń: {blad}")
+    elif przeliczanie.get(klucz) is not None:
+        if not aktualny:
+            st.rerun(scope="app")
+    else:
+        st.caption("⏳ Przeliczanie dla nowych parametrów…")
+
+
+_status_przeliczenia()
+
+if res is not None:
     st.subheader("Rekomendowana moc zamówiona")
     st.metric("Pzam final [kW]", round(res.Pzam_final_kw, 1))
 
@@ -75,7 +214,7 @@ if run:
     col2.metric("Model warstwowy [kW]", round(res.layered.Pzam_kW, 1))
     col3.metric("ΔP [kW]", round(res.delta_P_kW, 1))
 
-    # ===== WYKRES (matplotlib) – tylko po kliknięciu "Oblicz" =====
+    # ===== WYKRES (matplotlib) – odświeżany na bieżąco przy zmianie parametrów =====
     delta_P_kw = res.delta_P_kW
     percent_over = (delta_P_kw / res.mix.Pzam_kW * 100.0) if res.mix.Pzam_kW > 0 else 0.0
 
@@ -85,34 +224,13 @@ if run:
         f"({percent_over:.1f} %)"
     )
 
-    labels = ["Model idealnie mieszany", "Model warstwowy", "Rekomendowana moc"]
-    values = [float(res.mix.Pzam_kW), float(res.layered.Pzam_kW), float(res.Pzam_final_kw)]
-    colors = ["#ff7f7f", "#1f77b4", "#2ca02c"]  # mix / warstwowy / final
-
     fig, ax = plt.subplots(figsize=(8, 3.6))
-    bars = ax.bar(labels, values, color=colors)
-
-    ax.set_ylabel("kW")
-    ax.set_ylim(0, max(values) * 1.25 if max(values) > 0 else 1.0)
-    ax.grid(axis="y", linestyle="--", linewidth=0.6, alpha=0.5)
-    ax.set_axisbelow(True)
-
-    for bar, val in zip(bars, values):
-        ax.text(
-            bar.get_x() + bar.get_width() / 2.0,
-            bar.get_height(),
-            f"{val:.1f} kW",
-            ha="center",
-            va="bottom",
-            fontsize=10,
-        )
-
-    ax.tick_params(axis="x", labelrotation=0)
+    draw_pzam_bars(ax, **pzam_bar_data(res.mix.Pzam_kW, res.layered.Pzam_kW, res.Pzam_final_kw))
     fig.tight_layout()
 
     st.pyplot(fig, clear_figure=True)
 
-    # ===== SKUTKI FINANSOWE – tylko po kliknięciu "Oblicz" =====
+    # ===== SKUTKI FINANSOWE – koszty liczone od razu, bez ponownej symulacji =====
     st.subheader("Skutki finansowe zawyżenia mocy")
 
     if delta_P_kw <= 0:
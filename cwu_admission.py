@@ -0,0 +1,182 @@
+"""Kontrola przyjęć (admission control) dla endpointów obliczeniowych API.
+
+Każde żądanie `/api/cwu/moc-zamowiona` uruchamia kosztowne szukanie Pzam. Bez
+limitu nagły napływ spowalnia wszystkie żądania naraz; tutaj część z nich jest
+szybko odrzucana, a przyjęte liczą się w przewidywalnym czasie:
+
+- najwyżej `max_concurrent` obliczeń naraz (w procesie workera),
+- kolejka oczekujących (FIFO) ograniczona do `max_queue`; pełna – od razu 429,
+- oczekiwanie w kolejce ograniczone `queue_timeout_s`; po jego upływie 503.
+  Gdy z bieżącego tempa wynika, że czas oczekiwania i tak przekroczy limit,
+  żądanie odrzucane jest od razu (zamiast czekać na pewne 503),
+- odpowiedzi odmowne niosą `Retry-After` [s] szacowany ze średniego czasu
+  obliczenia (EWMA) i długości kolejki.
+
+Żądania tanie nie przechodzą przez kontrolę: trafienia w cache wyników, żądania
+dołączające do identycznego obliczenia w toku (single-flight) i /healthz –
+decyduje o tym wywołujący (api.py), obejmując `slot()` tylko samo obliczenie.
+
+Konfiguracja (zmienne środowiskowe, na proces workera):
+  CWU_MAX_CONCURRENT   – limit obliczeń naraz (domyślnie liczba rdzeni; 0 – bez kontroli),
+  CWU_MAX_QUEUE        – długość kolejki (domyślnie 4 × limit),
+  CWU_QUEUE_TIMEOUT_S  – maks. czas oczekiwania w kolejce (domyślnie 10 s).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Optional
+
+# Wygładzanie średniego czasu obliczenia (EWMA) i zakres Retry-After [s]
+_EWMA_ALPHA = 0.2
+RETRY_AFTER_MIN_S = 1
+RETRY_AFTER_MAX_S = 120
+
+
+class AdmissionRejected(Exception):
+    """Żądanie nieprzyjęte: status_code 429 (kolejka pełna) albo 503 (limit czasu oczekiwania)."""
+
+    def __init__(self, status_code: int, retry_after_s: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+        self.reason = reason
+
+
+@dataclass(frozen=True)
+class AdmissionConfig:
+    max_concurrent: int
+    max_queue: int
+    queue_timeout_s: float
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionConfig"]:
+        """Konfiguracja ze zmiennych środowiskowych; None – kontrola wyłączona (CWU_MAX_CONCURRENT=0)."""
+        raw = os.environ.get("CWU_MAX_CONCURRENT")
+        max_concurrent = int(raw) if raw else (os.cpu_count() or 1)
+        if max_concurrent <= 0:
+            return None
+        raw_queue = os.environ.get("CWU_MAX_QUEUE")
+        return cls(
+            max_concurrent=max_concurrent,
+            max_queue=int(raw_queue) if raw_queue else 4 * max_concurrent,
+            queue_timeout_s=float(os.environ.get("CWU_QUEUE_TIMEOUT_S", "10")),
+        )
+
+
+class AdmissionController:
+    """Limit obliczeń naraz + ograniczona kolejka FIFO z terminem (jedna pętla asyncio)."""
+
+    def __init__(self, config: AdmissionConfig):
+        if config.max_concurrent < 1 or config.max_queue < 0 or config.queue_timeout_s < 0:
+            raise ValueError("max_concurrent >= 1, max_queue >= 0, queue_timeout_s >= 0")
+        self.config = config
+        self._running = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._service_s: Optional[float] = None  # EWMA czasu obliczenia
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    # --- Szacunki ---
+
+    def _expected_wait_s(self, position: int) -> Optional[float]:
+        """Szacowany czas oczekiwania na miejscu `position` kolejki (0 – pierwszy); None – brak danych."""
+        if self._service_s is None:
+            return None
+        return self._service_s * (position // self.config.max_concurrent + 1)
+
+    def retry_after_s(self) -> int:
+        wait = self._expected_wait_s(len(self._waiters))
+        if wait is None:
+            return RETRY_AFTER_MIN_S
+        return max(RETRY_AFTER_MIN_S, min(RETRY_AFTER_MAX_S, math.ceil(wait)))
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        if status_code == 429:
+            self.rejected_full += 1
+        else:
+            self.rejected_timeout += 1
+        return AdmissionRejected(status_code, self.retry_after_s(), reason)
+
+    # --- Przydział ---
+
+    async def _acquire(self) -> None:
+        cfg = self.config
+        if self._running < cfg.max_concurrent and not self._waiters:
+            self._running += 1
+            return
+        if len(self._waiters) >= cfg.max_queue:
+            raise self._reject(429, "Serwer jest przeciążony – kolejka obliczeń pełna.")
+        expected = self._expected_wait_s(len(self._waiters))
+        if expected is not None and expected > cfg.queue_timeout_s:
+            raise self._reject(503, "Serwer jest przeciążony – obliczenie nie zacznie się w dopuszczalnym czasie.")
+
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=cfg.queue_timeout_s)
+        except asyncio.TimeoutError:
+            if fut.done():
+                return  # miejsce przydzielone w tej samej chwili
+            self._drop(fut)
+            raise self._reject(503, "Serwer jest przeciążony – przekroczono czas oczekiwania w kolejce.")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()  # przydzielone, ale wywołujący już nie czeka
+            else:
+                self._drop(fut)
+            raise
+
+    def _drop(self, fut: "asyncio.Future[None]") -> None:
+        fut.cancel()
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def _release(self) -> None:
+        self._running -= 1
+        while self._waiters:
+            nxt = self._waiters.popleft()
+            if not nxt.done():
+                self._running += 1
+                nxt.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Miejsce na jedno obliczenie; AdmissionRejected, gdy nie da się go przydzielić."""
+        await self._acquire()
+        self.admitted += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_service_time(time.monotonic() - t0)
+            self._release()
+
+    def record_service_time(self, elapsed_s: float) -> None:
+        """Uwzględnia czas obliczenia w średniej (także spoza `slot()`, np. z rozgrzania)."""
+        self._service_s = elapsed_s if self._service_s is None else (
+            (1.0 - _EWMA_ALPHA) * self._service_s + _EWMA_ALPHA * elapsed_s
+        )
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": len(self._waiters),
+            "max_concurrent": self.config.max_concurrent,
+            "max_queue": self.config.max_queue,
+            "queue_timeout_s": self.config.queue_timeout_s,
+            "avg_service_s": self._service_s,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
@@ -0,0 +1,211 @@
+"""Rejestr silników symulacji (backendów) i tryb cienia.
+
+Backend to para funkcji o sygnaturach `simulate_mixed` / `simulate_layered_2zone`.
+Wybór:
+- na wywołanie: `compare_models(..., backend="fast")`,
+- na proces: `set_default_backend("fast")` albo zmienna CWU_SIM_BACKEND.
+
+"reference" to pętle z `cwu_time_simulation` (wynik audytowy). Pozostałe
+backendy ładowane są przy pierwszym użyciu (moduł rejestruje się przy imporcie).
+
+Tryb cienia: wylosowany ułamek wywołań `compare_models` liczony jest w tle
+drugim silnikiem, a różnice Pzam, minut naruszeń lub poziomu decyzji ponad
+tolerancję trafiają do logu (i liczników `shadow_stats()`). Konfiguracja:
+`configure_shadow(...)` albo CWU_SHADOW_BACKEND + CWU_SHADOW_RATE.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REFERENCE = "reference"
+
+# Backendy spoza cwu_time_simulation: nazwa -> moduł, który rejestruje je przy imporcie
+_LOADERS: Dict[str, str] = {
+    "fast": "cwu_fast_sim",
+}
+
+# Ile porównań w cieniu może czekać w kolejce; nadmiarowe losowania są pomijane
+SHADOW_MAX_PENDING = 4
+
+
+@dataclass(frozen=True)
+class SimulationBackend:
+    name: str
+    simulate_mixed: Callable[..., Any]
+    simulate_layered_2zone: Callable[..., Any]
+    description: str = ""
+
+
+@dataclass(frozen=True)
+class ShadowConfig:
+    """backend – silnik liczony w cieniu; rate – ułamek wywołań (0..1).
+
+    pzam_tol_kW: dopuszczalna różnica Pzam (None – tol_kW danego wywołania),
+    violation_tol_min: dopuszczalna różnica minut naruszeń przy znalezionym Pzam.
+    """
+
+    backend: str
+    rate: float
+    pzam_tol_kW: Optional[float] = None
+    violation_tol_min: float = 0.0
+
+
+_lock = threading.Lock()
+_backends: Dict[str, SimulationBackend] = {}
+_default_backend: str = os.environ.get("CWU_SIM_BACKEND", REFERENCE) or REFERENCE
+
+_shadow: Optional[ShadowConfig] = (
+    ShadowConfig(
+        backend=os.environ["CWU_SHADOW_BACKEND"],
+        rate=float(os.environ.get("CWU_SHADOW_RATE", "0.01")),
+    )
+    if os.environ.get("CWU_SHADOW_BACKEND")
+    else None
+)
+_shadow_executor: Optional[ThreadPoolExecutor] = None
+_shadow_pending = 0
+_shadow_counts = {"sampled": 0, "compared": 0, "mismatches": 0, "errors": 0, "skipped": 0}
+
+
+def register_backend(backend: SimulationBackend) -> None:
+    with _lock:
+        _backends[backend.name] = backend
+
+
+def available_backends() -> List[str]:
+    with _lock:
+        return sorted(set(_backends) | set(_LOADERS))
+
+
+def get_backend(name: Optional[str] = None) -> SimulationBackend:
+    """Backend o danej nazwie (None – domyślny dla procesu)."""
+    key = name or _default_backend
+    with _lock:
+        found = _backends.get(key)
+    if found is not None:
+        return found
+    module = _LOADERS.get(key)
+    if module is None:
+        raise ValueError(f"Nieznany backend symulacji: {key!r} (dostępne: {', '.join(available_backends())})")
+    importlib.import_module(module)
+    with _lock:
+        return _backends[key]
+
+
+def set_default_backend(name: str) -> None:
+    """Domyślny backend dla procesu (sprawdzany od razu)."""
+    global _default_backend
+    get_backend(name)
+    _default_backend = name
+
+
+def default_backend() -> str:
+    return _default_backend
+
+
+def configure_shadow(config: Optional[ShadowConfig]) -> None:
+    """Włącza (albo wyłącza dla None) porównania w cieniu."""
+    global _shadow
+    if config is not None:
+        if not (0.0 <= config.rate <= 1.0):
+            raise ValueError("rate musi być w zakresie 0..1")
+        get_backend(config.backend)
+    _shadow = config
+
+
+def shadow_stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_shadow_counts)
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _shadow_counts[key] += 1
+
+
+def shadow_differences(primary: Any, shadow: Any, pzam_tol_kW: float, violation_tol_min: float) -> List[str]:
+    """Różnice wyników `compare_models` ponad tolerancję (opisowo, do logu)."""
+    diffs: List[str] = []
+    for label, a, b in (
+        ("Pzam mix", primary.mix.Pzam_kW, shadow.mix.Pzam_kW),
+        ("Pzam warstwowy", primary.layered.Pzam_kW, shadow.layered.Pzam_kW),
+        ("Pzam final", primary.Pzam_final_kw, shadow.Pzam_final_kw),
+    ):
+        if abs(a - b) > pzam_tol_kW:
+            diffs.append(f"{label}: {a:.3f} vs {b:.3f} kW")
+    for label, a, b in (
+        ("naruszenia mix", primary.mix.violation_minutes, shadow.mix.violation_minutes),
+        ("naruszenia warstwowy", primary.layered.violation_minutes, shadow.layered.violation_minutes),
+    ):
+        if abs(a - b) > violation_tol_min:
+            diffs.append(f"{label}: {a:.1f} vs {b:.1f} min")
+    if primary.recommendation_level != shadow.recommendation_level:
+        diffs.append(f"poziom: {primary.recommendation_level} vs {shadow.recommendation_level}")
+    return diffs
+
+
+def maybe_shadow(
+    primary_backend: str,
+    primary: Any,
+    rerun: Callable[[str], Any],
+    tol_kW: float,
+) -> None:
+    """Po wyniku głównym: z prawdopodobieństwem `rate` liczy `rerun(backend_cienia)` w tle i porównuje."""
+    global _shadow_executor, _shadow_pending
+    cfg = _shadow
+    if cfg is None or cfg.backend == primary_backend or getattr(primary, "approximate", False):
+        return
+    if random.random() >= cfg.rate:
+        return
+
+    with _lock:
+        _shadow_counts["sampled"] += 1
+        if _shadow_pending >= SHADOW_MAX_PENDING:
+            _shadow_counts["skipped"] += 1
+            return
+        _shadow_pending += 1
+        if _shadow_executor is None:
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cwu-shadow")
+        executor = _shadow_executor
+
+    def run() -> None:
+        global _shadow_pending
+        try:
+            other = rerun(cfg.backend)
+            diffs = shadow_differences(
+                primary,
+                other,
+                pzam_tol_kW=cfg.pzam_tol_kW if cfg.pzam_tol_kW is not None else tol_kW,
+                violation_tol_min=cfg.violation_tol_min,
+            )
+            _count("compared")
+            if diffs:
+                _count("mismatches")
+                logger.warning(
+                    "Backend %s różni się od %s: %s", cfg.backend, primary_backend, "; ".join(diffs)
+                )
+        except Exception:
+            _count("errors")
+            logger.exception("Porównanie w cieniu (%s) zakończone błędem", cfg.backend)
+        finally:
+            with _lock:
+                _shadow_pending -= 1
+
+    executor.submit(run)
+
+
+def wait_for_shadow(timeout: Optional[float] = None) -> None:
+    """Czeka na zakończenie zaplanowanych porównań (testy, zamykanie procesu)."""
+    executor = _shadow_executor
+    if executor is not None:
+        executor.submit(lambda: None).result(timeout=timeout)
@@ -0,0 +1,292 @@
+"""Przeliczanie wielu scenariuszy z pliku (np. nocne przeliczenie wszystkich budynków).
+
+    python cwu_batch.py --wejscie scenariusze.jsonl --wyjscie wyniki.jsonl --procesy 8
+
+Wejście: JSONL (jeden scenariusz w wierszu) albo JSON – lista scenariuszy lub
+obiekt {"defaults": {...}, "scenarios": [...]}; "defaults" są łączone z każdym
+scenariuszem (sekcje słownikowe pole po polu). Scenariusz:
+
+    {
+      "id": "B-001",
+      "tank": {"volume_l": 800, "T_init_C": 55, "T_set_C": 55, "T_cold_C": 10, "T_min_C": 45, "dt_s": 60},
+      "profile": {"peaks": [[420, 20, 60.0], [1140, 20, 50.0]], "days": 1}
+                 | {"file": "profile/b001.csv"} | {"demand_lpm": [...]},
+      "loss": {"loss_percent_of_pavg": 30.0},
+      "layered": {"hot_fraction": 0.3, "mixing_tau_s": 3600},
+      "thresholds": {...}, "cost": {"cost_per_kw_month_zl": 50.0},
+      "allowed_violation_min": 0.0,
+      "cyclic": false,
+      "solver": {"pmax_start_kW": 10.0, "pmax_max_kW": 5000.0, "tol_kW": 0.1}
+    }
+
+Plik profilu (ścieżka względem pliku scenariuszy): .csv/.txt – jedna kolumna
+l/min (nagłówek pomijany), .json – lista, .npy – tablica numpy.
+
+Wyjście: JSONL, jeden rekord na scenariusz, zapisywany od razu po jego
+zakończeniu (kolejność wg czasu ukończenia). Ponowne uruchomienie z tym samym
+plikiem wyjściowym pomija scenariusze, które mają już rekord ze statusem "ok";
+scenariusze zakończone błędem liczone są ponownie.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from cwu_backends import get_backend
+from cwu_cache import ResultCache, cached_compare_models
+from cwu_records import load_profile_file, open_output, result_summary
+from cwu_time_simulation import (
+    ENGINE_VERSION,
+    RECORD_SUMMARY,
+    CostParams,
+    LayeredParams,
+    LossInput,
+    RecommendationThresholds,
+    TankParams,
+    build_profile_24h,
+)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+
+# Połączenia z cache wyników otwarte w danym procesie (ścieżka -> cache)
+_RESULT_CACHES: Dict[str, ResultCache] = {}
+
+
+# --- Wejście ---
+
+def _merge(defaults: Dict[str, Any], scenario: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(defaults)
+    for key, value in scenario.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def read_scenarios(path: str) -> List[Dict[str, Any]]:
+    """Scenariusze z pliku JSON/JSONL, z uzupełnionym "id" i katalogiem bazowym profili."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            raw = [json.loads(line) for line in f if line.strip()]
+            defaults: Dict[str, Any] = {}
+        else:
+            doc = json.load(f)
+            if isinstance(doc, dict):
+                raw = list(doc.get("scenarios", []))
+                defaults = dict(doc.get("defaults", {}))
+            else:
+                raw = list(doc)
+                defaults = {}
+
+    scenarios: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for i, sc in enumerate(raw, start=1):
+        if not isinstance(sc, dict):
+            raise ValueError(f"Scenariusz nr {i}: oczekiwano obiektu JSON.")
+        sc = _merge(defaults, sc)
+        sc_id = str(sc.get("id", f"#{i}"))
+        if sc_id in seen:
+            raise ValueError(f"Powtórzony identyfikator scenariusza: {sc_id!r}")
+        seen.add(sc_id)
+        sc["id"] = sc_id
+        sc["_base_dir"] = base_dir
+        scenarios.append(sc)
+    return scenarios
+
+
+def _profile(sc: Dict[str, Any], dt_s: int) -> List[float]:
+    spec = sc.get("profile") or {}
+    if "demand_lpm" in spec:
+        return [float(x) for x in spec["demand_lpm"]]
+    if "file" in spec:
+        path = spec["file"]
+        if not os.path.isabs(path):
+            path = os.path.join(sc.get("_base_dir", ""), path)
+        return load_profile_file(path)
+    if "peaks" in spec:
+        day = build_profile_24h(dt_s, [(int(a), int(b), float(c)) for a, b, c in spec["peaks"]])
+        return day * int(spec.get("days", 1))
+    raise ValueError("Brak profilu: podaj profile.demand_lpm, profile.file albo profile.peaks.")
+
+
+def _result_cache(path: Optional[str]) -> Optional[ResultCache]:
+    if path is None:
+        return None
+    cache = _RESULT_CACHES.get(path)
+    if cache is None:
+        cache = _RESULT_CACHES[path] = ResultCache(path=path)
+    return cache
+
+
+def run_scenario(sc: Dict[str, Any], backend: Optional[str] = None, cache_path: Optional[str] = None) -> Dict[str, Any]:
+    """Liczy jeden scenariusz; zwraca rekord wyjściowy (także przy błędzie).
+
+    cache_path: plik cache wyników (tryb podobieństwa); None – bez cache.
+    """
+    t0 = time.perf_counter()
+    record: Dict[str, Any] = {"id": sc["id"]}
+    if "name" in sc:
+        record["name"] = sc["name"]
+    try:
+        tank = TankParams(**sc["tank"])
+        solver = sc.get("solver", {})
+        res = cached_compare_models(
+            _result_cache(cache_path),
+            similarity=True,
+            tank=tank,
+            demand_lpm=_profile(sc, tank.dt_s),
+            loss_input=LossInput(**sc["loss"]),
+            allowed_violation_min=float(sc.get("allowed_violation_min", 0.0)),
+            layered=LayeredParams(**sc.get("layered", {})),
+            thresholds=RecommendationThresholds(**sc.get("thresholds", {})),
+            cost_params=CostParams(**sc.get("cost", {})),
+            pmax_start_kW=float(solver.get("pmax_start_kW", 10.0)),
+            pmax_max_kW=float(solver.get("pmax_max_kW", 5000.0)),
+            tol_kW=float(solver.get("tol_kW", 0.1)),
+            recording=RECORD_SUMMARY,
+            backend=backend,
+            cyclic=bool(sc.get("cyclic", False)),
+        )
+        record["status"] = STATUS_OK
+        record["result"] = {
+            **result_summary(res),
+            "delta_P_percent": res.delta_P_percent,
+            "decision_basis": res.decision_basis,
+            "P_avg_CWU_kW": res.P_avg_CWU_kW,
+            "E_CWU_kWh": res.E_CWU_kWh,
+            "violation_minutes_mix": res.mix.violation_minutes,
+            "violation_minutes_layer": res.layered.violation_minutes,
+        }
+    except Exception as exc:
+        record["status"] = STATUS_ERROR
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    record["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    record["engine_version"] = ENGINE_VERSION
+    record["backend"] = backend
+    return record
+
+
+# --- Wyjście i wznawianie ---
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Identyfikatory scenariuszy z rekordem "ok" w istniejącym pliku wyników.
+
+    Ucięty ostatni wiersz (przerwanie w trakcie zapisu) jest pomijany.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and rec.get("status") == STATUS_OK and "id" in rec:
+                done.add(str(rec["id"]))
+    return done
+
+
+def run_batch(
+    scenarios: List[Dict[str, Any]],
+    output_path: str,
+    workers: Optional[int] = None,
+    backend: Optional[str] = None,
+    fresh: bool = False,
+    cache_path: Optional[str] = None,
+) -> Tuple[int, int, int]:
+    """Liczy scenariusze bez rekordu "ok" w pliku wyjściowym; zwraca (policzone, błędy, pominięte)."""
+    done = set() if fresh else completed_ids(output_path)
+    todo = [sc for sc in scenarios if sc["id"] not in done]
+    skipped = len(scenarios) - len(todo)
+    # Nazwa ustalona tu, bo procesy robocze nie widzą set_default_backend() procesu głównego
+    backend_name = get_backend(backend).name
+
+    n_ok = n_err = 0
+    with open_output(output_path, fresh) as out:
+
+        def emit(rec: Dict[str, Any]) -> None:
+            nonlocal n_ok, n_err
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            if rec["status"] == STATUS_OK:
+                n_ok += 1
+            else:
+                n_err += 1
+
+        n_workers = workers or os.cpu_count() or 1
+        if n_workers == 1 or len(todo) <= 1:
+            for sc in todo:
+                emit(run_scenario(sc, backend_name, cache_path))
+            return n_ok, n_err, skipped
+
+        # Ograniczona liczba zadań w locie – przy tysiącach scenariuszy nie trzymamy wszystkich w kolejce
+        pending: Set[Future] = set()
+        it: Iterator[Dict[str, Any]] = iter(todo)
+        ex = ProcessPoolExecutor(max_workers=n_workers)
+        try:
+            for sc in it:
+                pending.add(ex.submit(run_scenario, sc, backend_name, cache_path))
+                if len(pending) >= 2 * n_workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        emit(fut.result())
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    emit(fut.result())
+        finally:
+            ex.shutdown(wait=not pending, cancel_futures=True)
+
+    return n_ok, n_err, skipped
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Przeliczenie scenariuszy CWU z pliku (wynik JSONL, wznawialne).")
+    parser.add_argument("--wejscie", required=True, help="Plik scenariuszy .json lub .jsonl")
+    parser.add_argument("--wyjscie", help="Plik wyników .jsonl (domyślnie <wejście>_wyniki.jsonl)")
+    parser.add_argument("--procesy", type=int, default=None, help="Liczba procesów (domyślnie: liczba rdzeni)")
+    parser.add_argument("--backend", default=None, help="Silnik symulacji (np. reference, fast)")
+    parser.add_argument("--od-nowa", action="store_true", help="Nadpisz plik wyników zamiast wznawiać")
+    parser.add_argument("--cache", default=None, help="Plik cache wyników (wspólne wpisy dla budynków przeskalowanych)")
+    args = parser.parse_args(argv)
+
+    if args.wyjscie is None:
+        root, _ = os.path.splitext(args.wejscie)
+        args.wyjscie = root + "_wyniki.jsonl"
+
+    scenarios = read_scenarios(args.wejscie)
+    t0 = time.perf_counter()
+    try:
+        n_ok, n_err, skipped = run_batch(
+            scenarios,
+            args.wyjscie,
+            workers=args.procesy,
+            backend=args.backend,
+            fresh=args.od_nowa,
+            cache_path=args.cache,
+        )
+    except KeyboardInterrupt:
+        print("Przerwano – uruchom ponownie, aby dokończyć (policzone scenariusze zostaną pominięte).", file=sys.stderr)
+        return 130
+    print(
+        f"Policzono {n_ok}, błędy {n_err}, pominięto (już policzone) {skipped} "
+        f"w {time.perf_counter() - t0:.1f} s → {args.wyjscie}",
+        file=sys.stderr,
+    )
+    return 1 if n_err else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,464 @@
+"""Trwały, adresowany treścią cache wyników `compare_models`.
+
+- klucz: szybki skrót (BLAKE2b) kanonicznej postaci wejść – zasobnik, skrót profilu,
+  straty, parametry warstw, progi, koszty, tolerancje solvera i silnik symulacji
+  (wyniki backendu innego niż "reference" nie trafiają pod klucz wyniku audytowego),
+- wpisy oznaczone `ENGINE_VERSION`; wpisy innej wersji silnika są pomijane i usuwane,
+- przechowywanie w lokalnym pliku SQLite (WAL) – bezpieczne dla wielu procesów
+  (workery uvicorn/gunicorn) czytających i piszących jednocześnie,
+- limit rozmiaru z usuwaniem najdawniej używanych wpisów (LRU),
+- opcjonalnie (`similarity=True`) wpisy wspólne dla wejść przeskalowanych
+  proporcjonalnie – patrz `similar_compare_models`.
+
+Plik przeżywa restart i deploy, więc workery startują z "ciepłym" cache.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import asdict, replace
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cwu_backends import REFERENCE, get_backend
+from cwu_time_simulation import (
+    ENGINE_VERSION,
+    ComparisonResult,
+    CostParams,
+    DemandProfile,
+    LayeredParams,
+    LossInput,
+    ModelRunResult,
+    ProgressCallback,
+    RecommendationThresholds,
+    RecordingPolicy,
+    TankParams,
+    _assemble_result,
+    analyze_profile,
+    compare_models,
+    derive_loss_kw,
+)
+
+DEFAULT_CACHE_PATH = os.environ.get("CWU_CACHE_DB", "cwu_results_cache.sqlite3")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("CWU_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Sprawdzanie limitu rozmiaru co tyle zapisów (SUM po tabeli nie jest darmowy)
+_EVICT_EVERY_PUTS = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key          TEXT PRIMARY KEY,
+    engine       TEXT NOT NULL,
+    value        BLOB NOT NULL,
+    size         INTEGER NOT NULL,
+    created_at   REAL NOT NULL,
+    last_access  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_lru_idx ON results(last_access);
+"""
+
+
+def profile_digest(demand_lpm: DemandProfile) -> str:
+    """Skrót profilu poboru (bajty float64 – niezależny od typu listy/krotki/tablicy)."""
+    try:
+        raw = memoryview(demand_lpm).cast("B")  # type: ignore[arg-type]
+        if getattr(demand_lpm, "dtype", None) is not None and str(demand_lpm.dtype) != "float64":  # type: ignore[attr-defined]
+            raise TypeError
+    except TypeError:
+        raw = struct.pack(f"<{len(demand_lpm)}d", *(float(x) for x in demand_lpm))
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _backend_tag(backend: Optional[str]) -> Optional[str]:
+    """Nazwa rozwiązanego backendu do klucza; None dla "reference" (klucze sprzed zmiany bez zmian)."""
+    name = get_backend(backend).name
+    return None if name == REFERENCE else name
+
+
+def cache_key(
+    *,
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_input: LossInput,
+    allowed_violation_min: float,
+    layered: Optional[LayeredParams] = None,
+    thresholds: Optional[RecommendationThresholds] = None,
+    cost_params: Optional[CostParams] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+    recording: Optional[RecordingPolicy] = None,
+    backend: Optional[str] = None,
+    cyclic: bool = False,
+) -> str:
+    """Kanoniczny klucz wejść `compare_models` (domyślne obiekty = jawne wartości domyślne).
+
+    backend: jak w `compare_models` (None – domyślny dla procesu); rozwiązywany na nazwę.
+    """
+    canon = {
+        "tank": asdict(tank),
+        "profile": [len(demand_lpm), profile_digest(demand_lpm)],
+        "loss": asdict(loss_input),
+        "allowed_violation_min": float(allowed_violation_min),
+        "layered": asdict(layered or LayeredParams()),
+        "thresholds": asdict(thresholds or RecommendationThresholds()),
+        "cost": asdict(cost_params or CostParams()),
+        "solver": [float(pmax_start_kW), float(pmax_max_kW), float(tol_kW)],
+        "recording": asdict(recording or RecordingPolicy()),
+        "cyclic": bool(cyclic),
+    }
+    tag = _backend_tag(backend)
+    if tag is not None:
+        canon["backend"] = tag
+    raw = json.dumps(canon, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """Cache wyników w SQLite; osobne połączenie na wątek, wspólny plik dla procesów."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        engine_version: str = ENGINE_VERSION,
+    ) -> None:
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.engine_version = engine_version
+        self._local = threading.local()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # Wpisy z innej wersji silnika są bezużyteczne – sprzątamy przy otwarciu
+        conn.execute("DELETE FROM results WHERE engine != ?", (self.engine_version,))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[ComparisonResult]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM results WHERE key = ? AND engine = ?", (key, self.engine_version)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, result: ComparisonResult) -> None:
+        blob = zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO results (key, engine, value, size, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, self.engine_version, blob, len(blob), now, now),
+        )
+        self._puts += 1
+        if self._puts % _EVICT_EVERY_PUTS == 1:
+            self.evict()
+
+    def evict(self) -> int:
+        """Usuwa najdawniej używane wpisy, aż suma rozmiarów zmieści się w limicie."""
+        conn = self._conn()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self) -> dict:
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+
+def cached_compare_models(cache: Optional[ResultCache], similarity: bool = False, **kwargs) -> ComparisonResult:
+    """`compare_models` przez cache. Wyniki przybliżone (limit czasu) nie są zapisywane.
+
+    Argumenty jak w `compare_models`; `time_budget_s`/`on_progress` nie wchodzą do klucza.
+    similarity: wpisy wspólne dla wejść przeskalowanych o potęgę dwójki (`similar_compare_models`).
+    """
+    if cache is None:
+        return compare_models(**kwargs)
+    if similarity:
+        return similar_compare_models(cache, **kwargs)
+
+    key_kwargs = {k: v for k, v in kwargs.items() if k not in ("time_budget_s", "on_progress")}
+    key = cache_key(**key_kwargs)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+
+    res = compare_models(**kwargs)
+    if not res.approximate:
+        cache.put(key, res)
+    return res
+
+
+# --- Cache podobieństwa: wejścia przeskalowane proporcjonalnie ---
+#
+# Oba modele są jednorodne stopnia 1 względem wielkości ekstensywnych: objętości
+# zasobnika (i stref), poboru [l/min], mocy strat i mocy grzania. Każda energia
+# w pętlach to iloczyn dokładnie jednej z nich przez stałe intensywne (cp, ΔT, dt,
+# hot_fraction, dt/tau); temperatury to T_cold + E / (V·cp), ułamki to ilorazy
+# dwóch wielkości ekstensywnych, a sumy i max/min dotyczą składników tego samego
+# stopnia. Dla s = 2^k mnożenie przez s jest w arytmetyce IEEE 754 dokładne
+# (zmienia tylko wykładnik), a każde działanie +, -, ·, /, max, min na tak
+# przeskalowanych argumentach daje dokładnie s-krotność (stopień 1) albo ten sam
+# wynik (stopień 0). Indukcja po krokach pętli: przebieg dla (s·V, s·pobór,
+# s·straty, s·P) ma bit w bit te same temperatury, minuty naruszeń i czasy
+# regeneracji, a moce i energie s razy większe. To samo dotyczy bisekcji Pzam:
+# próby (s·p_start·2^n, (s·lo + s·hi)/2) i warunek stopu (s·Δ > s·tol) są
+# s-krotnościami prób dla problemu kanonicznego. Zakres pomija tylko nadmiar i
+# liczby subnormalne, nieosiągalne dla rozsądnych wejść. Dowód dotyczy pętli
+# "reference"; wpisy innych backendów mają w kluczu nazwę silnika (nie mieszają
+# się z audytowymi), a dokładność skalowania dla danego backendu sprawdza
+# `check_similarity(..., backend=...)`.
+#
+# Postać kanoniczna: s = 2^floor(log2 V), czyli objętość kanoniczna w [1, 2) l.
+# Zasobniki 400/800/1600 l z profilami i stratami w tej samej proporcji trafiają
+# do jednego wpisu; 500 l i 800 l – nie (skala nie jest potęgą dwójki, więc nie
+# byłaby dokładna).
+#
+# Tolerancja: solver z tym samym tol_kW dla s i 2s wymaga w postaci kanonicznej
+# tolerancji tol/s i tol/2s. Tolerancja kanoniczna zaokrąglana jest więc w dół
+# do potęgi dwójki (2^k <= tol_kW/s), a odczyt przyjmuje także wpisy dokładniejsze
+# (2^(k-1), ...). Brakujący wpis liczony jest od razu o SIMILARITY_STORE_LEVELS
+# poziomów dokładniej (ok. 2 symulacje więcej na model), więc obsługuje zasobniki
+# od 1/4 do 4 razy większe od pierwszego, niezależnie od kolejności. Wynik ma tę samą gwarancję co `compare_models`: Pzam sprawdzone
+# symulacją, w tol_kW od największej mocy niespełniającej warunku – ale nie musi
+# być bit w bit równy wywołaniu bezpośredniemu (inny przebieg bisekcji). Dlatego
+# tryb jest opcjonalny. pmax_start_kW/pmax_max_kW wpływają tylko na przebieg
+# szukania, więc nie wchodzą do klucza.
+#
+# Wpis przechowuje przebiegi obu modeli w jednostkach kanonicznych; ΔP, koszty,
+# rekomendację i decyzję składa `_assemble_result` dla progów i kosztów żądania.
+
+# Ile dokładniejszych tolerancji kanonicznych (2^(k-1), 2^(k-2), ...) sprawdza odczyt
+SIMILARITY_FINER_LEVELS = 4
+# O ile poziomów dokładniej liczony jest brakujący wpis (<= SIMILARITY_FINER_LEVELS)
+SIMILARITY_STORE_LEVELS = 2
+
+
+def similarity_scale(volume_l: float) -> float:
+    """Skala s = 2^floor(log2 V) (dokładna potęga dwójki); V/s leży w [1, 2)."""
+    if not volume_l > 0:
+        raise ValueError("volume_l must be > 0")
+    return math.ldexp(1.0, math.frexp(volume_l)[1] - 1)
+
+
+def similarity_key(
+    *,
+    tank: TankParams,
+    demand_lpm: np.ndarray,
+    loss_kw: float,
+    allowed_violation_min: float,
+    layered: LayeredParams,
+    recording: RecordingPolicy,
+    cyclic: bool,
+    tol_exponent: int,
+    backend: Optional[str] = None,
+) -> str:
+    """Klucz wpisu kanonicznego (wejścia już podzielone przez skalę)."""
+    canon = {
+        "similarity": 1,
+        "tank": asdict(tank),
+        "profile": [len(demand_lpm), profile_digest(demand_lpm)],
+        "loss_kw": float(loss_kw),
+        "allowed_violation_min": float(allowed_violation_min),
+        "layered": asdict(layered),
+        "recording": asdict(recording),
+        "cyclic": bool(cyclic),
+        "tol_exponent": int(tol_exponent),
+    }
+    tag = _backend_tag(backend)
+    if tag is not None:
+        canon["backend"] = tag
+    raw = json.dumps(canon, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def _scale_run(run: ModelRunResult, s: float) -> ModelRunResult:
+    """Przebieg przeskalowany o s: moce ×s, temperatury i czasy bez zmian."""
+    return replace(
+        run,
+        Pzam_kW=run.Pzam_kW * s,
+        loss_kw=run.loss_kw * s,
+        P_in_kW=[p * s for p in run.P_in_kW],
+        search_lo_kW=None if run.search_lo_kW is None else run.search_lo_kW * s,
+    )
+
+
+def similar_compare_models(
+    cache: ResultCache,
+    *,
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_input: LossInput,
+    allowed_violation_min: float,
+    layered: Optional[LayeredParams] = None,
+    thresholds: Optional[RecommendationThresholds] = None,
+    cost_params: Optional[CostParams] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+    time_budget_s: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    recording: Optional[RecordingPolicy] = None,
+    backend: Optional[str] = None,
+    cyclic: bool = False,
+) -> ComparisonResult:
+    """`compare_models` przez wpis kanoniczny wspólny dla wejść przeskalowanych o 2^k.
+
+    Argumenty jak w `compare_models`. Skala i dokładność – komentarz nad sekcją.
+    """
+    if tol_kW <= 0:
+        raise ValueError("tol_kW must be > 0")
+    s = similarity_scale(tank.volume_l)
+    layered_params = layered or LayeredParams()
+    thr = thresholds or RecommendationThresholds()
+    policy = recording or RecordingPolicy()
+
+    # Analiza profilu i straty dla żądania (tanie; straty mogą zależeć od P_avg)
+    analysis = analyze_profile(
+        demand_lpm=demand_lpm,
+        dt_s=tank.dt_s,
+        T_cold_C=tank.T_cold_C,
+        T_delivery_C=tank.T_set_C,
+        thresholds=thr,
+    )
+    loss_kw = derive_loss_kw(loss_input=loss_input, P_avg_CWU_kW=analysis.P_avg_CWU_kW)
+
+    tank_c = replace(tank, volume_l=tank.volume_l / s)
+    demand_c = np.asarray(demand_lpm, dtype=np.float64) / s
+    tol_exponent = math.frexp(tol_kW / s)[1] - 1  # 2^k <= tol_kW/s
+
+    def key(k: int) -> str:
+        return similarity_key(
+            tank=tank_c,
+            demand_lpm=demand_c,
+            loss_kw=loss_kw / s,
+            allowed_violation_min=allowed_violation_min,
+            layered=layered_params,
+            recording=policy,
+            cyclic=cyclic,
+            tol_exponent=k,
+            backend=backend,
+        )
+
+    store_exponent = tol_exponent - SIMILARITY_STORE_LEVELS
+    runs: Optional[Tuple[ModelRunResult, ModelRunResult]] = None
+    for k in range(tol_exponent, tol_exponent - SIMILARITY_FINER_LEVELS - 1, -1):
+        runs = cache.get(key(k))  # type: ignore[assignment]
+        if runs is not None:
+            break
+
+    if runs is None:
+        progress = None
+        if on_progress is not None:
+            progress = lambda ev: on_progress(  # noqa: E731
+                replace(ev, p_lo_kW=ev.p_lo_kW * s, p_hi_kW=None if ev.p_hi_kW is None else ev.p_hi_kW * s)
+            )
+        res_c = compare_models(
+            tank=tank_c,
+            demand_lpm=demand_c,
+            loss_input=LossInput(loss_kw=loss_kw / s),
+            allowed_violation_min=allowed_violation_min,
+            layered=layered_params,
+            thresholds=thr,
+            pmax_start_kW=pmax_start_kW / s,
+            pmax_max_kW=pmax_max_kW / s,
+            tol_kW=math.ldexp(1.0, store_exponent),
+            time_budget_s=time_budget_s,
+            on_progress=progress,
+            recording=policy,
+            backend=backend,
+            cyclic=cyclic,
+        )
+        runs = (res_c.mix, res_c.layered)
+        if not res_c.approximate:
+            cache.put(key(store_exponent), runs)  # type: ignore[arg-type]
+
+    mix_c, layered_c = runs
+    return _assemble_result(
+        tank=tank,
+        layered_params=layered_params,
+        thresholds=thr,
+        cost_params=cost_params,
+        analysis=analysis,
+        mix_res=_scale_run(mix_c, s),
+        layered_res=_scale_run(layered_c, s),
+        cyclic=cyclic,
+    )
+
+
+def check_similarity(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_kw: float,
+    pmax_kW: float,
+    layered: Optional[LayeredParams] = None,
+    factors: Sequence[float] = (0.25, 2.0, 8.0, 1024.0),
+    backend: Optional[str] = None,
+) -> List[str]:
+    """Sprawdzenie dowodu na danych: przebiegi ×s porównane bit w bit z przebiegiem bazowym.
+
+    Zwraca listę rozbieżności (pusta – skalowanie dokładne dla obu modeli).
+    """
+    sim = get_backend(backend)
+    layered_params = layered or LayeredParams()
+    base_demand = np.asarray(demand_lpm, dtype=np.float64)
+
+    def run(f: float) -> List[ModelRunResult]:
+        kw = dict(
+            tank=replace(tank, volume_l=tank.volume_l * f),
+            demand_lpm=base_demand * f,
+            pmax_kW=pmax_kW * f,
+            loss_kw=loss_kw * f,
+            allowed_violation_min=0.0,
+        )
+        return [sim.simulate_mixed(**kw), sim.simulate_layered_2zone(layered=layered_params, **kw)]
+
+    problems: List[str] = []
+    base = run(1.0)
+    for f in factors:
+        if math.frexp(f)[0] != 0.5:
+            problems.append(f"skala {f} nie jest potęgą dwójki")
+            continue
+        for ref, got in zip(base, run(f)):
+            if _scale_run(ref, f) != got:
+                problems.append(f"{ref.model}: przebieg dla skali {f} różni się od bazowego ×{f}")
+    return problems
@@ -0,0 +1,371 @@
+"""Kalibracja `LayeredParams` z pomiarów: profil poboru + temperatura górnej części zasobnika.
+
+hot_fraction i mixing_tau_s (opcjonalnie także losses_split) dobierane są tak,
+by przebieg T_hot z `simulate_layered_2zone` był jak najbliżej zmierzonego
+(najmniejsze kwadraty po krokach z pomiarem; braki jako NaN są pomijane).
+
+Przebieg:
+1. siatka startowa (hot_fraction × log10 τ) liczona wsadowo w puli procesów,
+2. Levenberg–Marquardt od kilku najlepszych punktów siatki (`_LM_STARTS`; jeden
+   start potrafi utknąć na granicy przedziału τ): w każdej iteracji jeden wsad
+   z różnicami skończonymi (jakobian) i jeden z krokami dla kilku wartości
+   tłumienia λ naraz – wybieramy najlepszy; wynikiem jest start z najmniejszym SSR,
+3. niepewność z (JᵀJ)⁻¹·s² w punkcie dopasowania, powiększona o n/n_eff
+   (reszty są silnie skorelowane w czasie; n_eff z autokorelacji rzędu 1).
+   Parametr, który skończył na granicy przedziału (`at_bound`), nie ma
+   przedziału ufności (NaN) – jakobian jest tam jednostronny, a minimum może
+   leżeć poza przedziałem; dopasowanie nie jest wtedy uznawane za zbieżne.
+
+τ dopasowywane jest w skali log10 (ta sama czułość dla 10 min i 10 h),
+przedział ufności τ jest więc niesymetryczny.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cwu_backends import get_backend
+from cwu_time_simulation import RECORD_FULL, DemandProfile, LayeredParams, TankParams
+
+LOSSES_SPLITS = ("by_volume", "all_hot")
+
+HOT_FRACTION_BOUNDS = (0.05, 0.95)
+LOG10_TAU_BOUNDS = (2.0, 6.0)  # 100 s .. ~11.6 doby
+
+_GRID_HOT_FRACTION = (0.1, 0.2, 0.3, 0.4, 0.5, 0.65, 0.8)
+_GRID_LOG10_TAU = (2.5, 3.0, 3.5, 4.0, 4.5, 5.0)
+_FD_STEPS = np.array([0.005, 0.02])  # różnice skończone: hot_fraction, log10 τ
+_LAMBDA_FACTORS = (0.1, 1.0, 10.0)
+_LM_STARTS = 4  # liczba najlepszych punktów siatki, od których startuje LM
+_BOUND_EPS = 1e-9
+
+
+@dataclass(frozen=True)
+class CalibrationResult:
+    layered: LayeredParams  # dopasowane parametry
+    # Niepewności; NaN dla parametru na granicy przedziału (zob. at_bound)
+    hot_fraction_std: float
+    hot_fraction_ci95: Tuple[float, float]
+    mixing_tau_s_ci95: Tuple[float, float]
+    log10_tau_std: float
+    correlation: float  # korelacja oszacowań hot_fraction i log10 τ
+    rmse_C: float
+    rmse_by_losses_split_C: Dict[str, float]
+    n_samples: int
+    n_effective: float
+    evaluations: int
+    iterations: int
+    converged: bool  # False także wtedy, gdy któryś parametr skończył na granicy przedziału
+    at_bound: Tuple[str, ...] = ()  # parametry na granicy: "hot_fraction", "mixing_tau_s"
+
+
+@dataclass(frozen=True)
+class _Context:
+    tank: TankParams
+    demand_lpm: List[float]
+    measured: np.ndarray
+    mask: np.ndarray
+    pmax_kW: float
+    loss_kw: float
+    hysteresis_C: float
+    T_init_cold_C: Optional[float]
+    backend: Optional[str]
+
+
+# Dane pomiarowe ustawiane raz na proces roboczy (initializer puli), a nie wysyłane z każdym kandydatem
+_ctx: Optional[_Context] = None
+
+
+def _init_worker(ctx: _Context) -> None:
+    global _ctx
+    _ctx = ctx
+
+
+def _residuals(candidate: Tuple[float, float, str]) -> np.ndarray:
+    hot_fraction, log10_tau, split = candidate
+    ctx = _ctx
+    assert ctx is not None
+    res = get_backend(ctx.backend).simulate_layered_2zone(
+        tank=ctx.tank,
+        layered=LayeredParams(hot_fraction=hot_fraction, mixing_tau_s=10.0 ** log10_tau, losses_split=split),
+        demand_lpm=ctx.demand_lpm,
+        pmax_kW=ctx.pmax_kW,
+        loss_kw=ctx.loss_kw,
+        allowed_violation_min=0.0,
+        hysteresis_C=ctx.hysteresis_C,
+        T_init_cold_C=ctx.T_init_cold_C,
+        recording=RECORD_FULL,
+    )
+    model = np.asarray(res.T_primary_C, dtype=float)
+    return (model - ctx.measured)[ctx.mask]
+
+
+class _Evaluator:
+    """Wsadowe liczenie reszt kandydatów (pula procesów albo bieżący proces)."""
+
+    def __init__(self, ctx: _Context, workers: Optional[int]):
+        n_workers = 1 if workers == 1 else (workers or os.cpu_count() or 1)
+        self.evaluations = 0
+        if n_workers > 1:
+            self._executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(
+                max_workers=n_workers, initializer=_init_worker, initargs=(ctx,)
+            )
+        else:
+            self._executor = None
+            _init_worker(ctx)
+
+    def __call__(self, candidates: Sequence[Tuple[float, float, str]]) -> List[np.ndarray]:
+        self.evaluations += len(candidates)
+        if self._executor is not None:
+            return list(self._executor.map(_residuals, candidates))
+        return [_residuals(c) for c in candidates]
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def _clip(theta: np.ndarray) -> np.ndarray:
+    return np.array([
+        min(max(theta[0], HOT_FRACTION_BOUNDS[0]), HOT_FRACTION_BOUNDS[1]),
+        min(max(theta[1], LOG10_TAU_BOUNDS[0]), LOG10_TAU_BOUNDS[1]),
+    ])
+
+
+def _jacobian(evaluate: _Evaluator, theta: np.ndarray, r: np.ndarray, split: str) -> np.ndarray:
+    # Krok do wnętrza przedziału, gdy punkt leży na granicy
+    points = []
+    steps = []
+    for j in range(2):
+        h = np.zeros(2)
+        h[j] = _FD_STEPS[j]
+        cand = _clip(theta + h)
+        if cand[j] == theta[j]:
+            cand = _clip(theta - h)
+        points.append((float(cand[0]), float(cand[1]), split))
+        steps.append(cand[j] - theta[j])
+    cols = [(rp - r) / s for rp, s in zip(evaluate(points), steps)]
+    return np.column_stack(cols)
+
+
+def _at_bound(theta: np.ndarray) -> np.ndarray:
+    """Maska parametrów leżących na granicy przedziału (po `_clip`)."""
+    return np.array([
+        any(abs(theta[j] - b) <= _BOUND_EPS for b in bounds)
+        for j, bounds in enumerate((HOT_FRACTION_BOUNDS, LOG10_TAU_BOUNDS))
+    ])
+
+
+def _fit_split(
+    evaluate: _Evaluator,
+    split: str,
+    max_iter: int,
+    tol: float,
+) -> Tuple[np.ndarray, np.ndarray, float, int, bool]:
+    """Siatka + LM z kilku startów dla jednego losses_split; zwraca (θ, reszty, SSR, iteracje, zbieżność)."""
+    grid = [(hf, lt, split) for hf in _GRID_HOT_FRACTION for lt in _GRID_LOG10_TAU]
+    resids = evaluate(grid)
+    order = np.argsort([float(r @ r) for r in resids], kind="stable")
+    best: Optional[Tuple[np.ndarray, np.ndarray, float, int, bool]] = None
+    for k in order[:_LM_STARTS]:
+        fit = _levenberg_marquardt(evaluate, np.array(grid[k][:2]), resids[k], split, max_iter, tol)
+        if best is None or fit[2] < best[2]:
+            best = fit
+    assert best is not None
+    return best
+
+
+def _levenberg_marquardt(
+    evaluate: _Evaluator,
+    theta: np.ndarray,
+    r: np.ndarray,
+    split: str,
+    max_iter: int,
+    tol: float,
+) -> Tuple[np.ndarray, np.ndarray, float, int, bool]:
+    """Levenberg–Marquardt od punktu θ (reszty r); zwraca jak `_fit_split`."""
+    ssr = float(r @ r)
+    lam = 1e-2
+    converged = False
+    it = 0
+    for it in range(1, max_iter + 1):
+        J = _jacobian(evaluate, theta, r, split)
+        JTJ = J.T @ J
+        g = J.T @ r
+        damp = np.diag(np.diag(JTJ)) + 1e-12 * np.eye(2)
+
+        trials = []
+        for f in _LAMBDA_FACTORS:
+            try:
+                delta = np.linalg.solve(JTJ + lam * f * damp, -g)
+            except np.linalg.LinAlgError:
+                continue
+            trials.append((f, _clip(theta + delta)))
+        if not trials:
+            break
+        trial_resids = evaluate([(float(c[0]), float(c[1]), split) for _, c in trials])
+        costs = [float(tr @ tr) for tr in trial_resids]
+        best = int(np.argmin(costs))
+
+        if costs[best] < ssr:
+            f, cand = trials[best]
+            step = float(np.max(np.abs(cand - theta)))
+            rel = (ssr - costs[best]) / max(ssr, 1e-300)
+            theta, r, ssr = cand, trial_resids[best], costs[best]
+            lam = max(lam * f / 3.0, 1e-9)
+            if rel < tol or step < 1e-5:
+                converged = True
+                break
+        else:
+            lam *= 100.0
+            if lam > 1e8:
+                converged = True  # żaden krok nie poprawia – minimum w rozdzielczości różnic skończonych
+                break
+    return theta, r, ssr, it, converged
+
+
+def _lag1_autocorrelation(r: np.ndarray) -> float:
+    if r.size < 3:
+        return 0.0
+    x = r - r.mean()
+    den = float(x @ x)
+    if den <= 0.0:
+        return 0.0
+    return float(np.clip((x[1:] @ x[:-1]) / den, -0.99, 0.99))
+
+
+def calibrate_layered(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    T_hot_measured_C: Sequence[float],
+    pmax_kW: float,
+    loss_kw: float,
+    fit_losses_split: bool = False,
+    losses_split: str = "by_volume",
+    hysteresis_C: float = 0.0,
+    T_init_cold_C: Optional[float] = None,
+    max_iter: int = 30,
+    tol: float = 1e-6,
+    workers: Optional[int] = None,
+    backend: Optional[str] = None,
+) -> CalibrationResult:
+    """Dopasowanie hot_fraction, mixing_tau_s (i opcjonalnie losses_split) do zmierzonej T_hot.
+
+    demand_lpm, T_hot_measured_C: pomiary w krokach tank.dt_s, ta sama długość
+      (braki pomiaru temperatury jako NaN).
+    pmax_kW, loss_kw, hysteresis_C: moc i nastawy istniejącej instalacji w okresie pomiaru.
+    tank.T_init_C zastępowane jest pierwszym pomiarem; T_init_cold_C – jak w
+      `simulate_layered_2zone` (domyślnie ta sama temperatura).
+    fit_losses_split: dopasowanie osobno dla każdego wariantu z LOSSES_SPLITS i wybór lepszego.
+    workers: liczba procesów (domyślnie liczba CPU); 1 = liczenie w bieżącym procesie.
+    backend: silnik symulacji (`cwu_backends`) – np. "fast" dla długich serii.
+    """
+    demand = [float(x) for x in demand_lpm]
+    measured = np.asarray(T_hot_measured_C, dtype=float)
+    if measured.shape != (len(demand),):
+        raise ValueError("T_hot_measured_C musi mieć tę samą długość co demand_lpm.")
+    mask = np.isfinite(measured)
+    n = int(mask.sum())
+    if n < 10:
+        raise ValueError("Za mało pomiarów temperatury (potrzeba co najmniej 10).")
+    if losses_split not in LOSSES_SPLITS:
+        raise ValueError(f"Nieznany losses_split: {losses_split!r} (dostępne: {', '.join(LOSSES_SPLITS)})")
+    if pmax_kW < 0 or loss_kw < 0:
+        raise ValueError("pmax_kW i loss_kw muszą być >= 0")
+
+    first = float(measured[np.argmax(mask)])
+    ctx = _Context(
+        tank=replace(tank, T_init_C=first),
+        demand_lpm=demand,
+        measured=measured,
+        mask=mask,
+        pmax_kW=float(pmax_kW),
+        loss_kw=float(loss_kw),
+        hysteresis_C=float(hysteresis_C),
+        T_init_cold_C=T_init_cold_C,
+        # Nazwa ustalona tu, bo procesy robocze nie widzą set_default_backend() procesu głównego
+        backend=get_backend(backend).name,
+    )
+
+    splits = LOSSES_SPLITS if fit_losses_split else (losses_split,)
+    evaluate = _Evaluator(ctx, workers)
+    try:
+        fits = {s: _fit_split(evaluate, s, max_iter, tol) for s in splits}
+        split = min(fits, key=lambda s: fits[s][2])
+        theta, r, ssr, iterations, converged = fits[split]
+        J = _jacobian(evaluate, theta, r, split)
+    finally:
+        evaluate.close()
+
+    # Niepewność: s²·(JᵀJ)⁻¹, powiększone o n/n_eff (autokorelacja reszt) – tylko dla parametrów
+    # wewnątrz przedziałów; na granicy jakobian jest jednostronny, a minimum może leżeć poza nią
+    bound = _at_bound(theta)
+    free = np.flatnonzero(~bound)
+    p = 2
+    rho = _lag1_autocorrelation(r)
+    n_eff = max(float(p + 1), n * (1.0 - rho) / (1.0 + rho)) if rho > 0 else float(n)
+    s2 = ssr / max(n - p, 1)
+    cov = np.full((2, 2), np.nan)
+    if free.size:
+        Jf = J[:, free]
+        try:
+            cov[np.ix_(free, free)] = np.linalg.inv(Jf.T @ Jf) * s2 * (n / n_eff)
+        except np.linalg.LinAlgError:
+            cov[np.ix_(free, free)] = np.inf
+    sd = np.sqrt(np.maximum(np.diag(cov), 0.0))
+    corr = float(cov[0, 1] / (sd[0] * sd[1])) if np.all(np.isfinite(sd)) and sd[0] > 0 and sd[1] > 0 else float("nan")
+
+    hf, lt = float(theta[0]), float(theta[1])
+    return CalibrationResult(
+        layered=LayeredParams(hot_fraction=hf, mixing_tau_s=10.0 ** lt, losses_split=split),
+        hot_fraction_std=float(sd[0]),
+        hot_fraction_ci95=(hf - 1.96 * float(sd[0]), hf + 1.96 * float(sd[0])),
+        mixing_tau_s_ci95=(10.0 ** (lt - 1.96 * float(sd[1])), 10.0 ** (lt + 1.96 * float(sd[1]))),
+        log10_tau_std=float(sd[1]),
+        correlation=corr,
+        rmse_C=math.sqrt(ssr / n),
+        rmse_by_losses_split_C={s: math.sqrt(f[2] / n) for s, f in fits.items()},
+        n_samples=n,
+        n_effective=n_eff,
+        evaluations=evaluate.evaluations,
+        iterations=iterations,
+        converged=converged and not bound.any(),
+        at_bound=tuple(name for name, b in zip(("hot_fraction", "mixing_tau_s"), bound) if b),
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    from cwu_time_simulation import simulate_layered_2zone
+
+    # Demo: tydzień syntetycznych „pomiarów” z znanymi parametrami + szum czujnika
+    rng = np.random.default_rng(0)
+    steps = 7 * 1440
+    demand = np.zeros(steps)
+    for day in range(7):
+        for start_h, minutes, lpm in ((6, 90, 22.0), (12, 30, 10.0), (18, 150, 16.0)):
+            s = day * 1440 + start_h * 60 + int(rng.integers(-30, 31))
+            demand[s:s + minutes] = lpm * float(rng.uniform(0.7, 1.3))
+    tank = TankParams(volume_l=800.0, T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=60)
+    truth = LayeredParams(hot_fraction=0.35, mixing_tau_s=5400.0)
+    sim = simulate_layered_2zone(
+        tank=tank, layered=truth, demand_lpm=demand.tolist(), pmax_kW=35.0, loss_kw=1.0, allowed_violation_min=0.0,
+    )
+    measured = np.asarray(sim.T_primary_C) + rng.normal(0.0, 0.3, steps)
+
+    t0 = time.perf_counter()
+    cal = calibrate_layered(tank, demand.tolist(), measured, pmax_kW=35.0, loss_kw=1.0, backend="fast")
+    print(f"Czas: {time.perf_counter() - t0:.1f} s, symulacje: {cal.evaluations}, iteracje: {cal.iterations}")
+    print(f"hot_fraction = {cal.layered.hot_fraction:.3f} ± {cal.hot_fraction_std:.3f} (prawda {truth.hot_fraction})")
+    lo, hi = cal.mixing_tau_s_ci95
+    print(f"mixing_tau_s = {cal.layered.mixing_tau_s:.0f} s, 95%: {lo:.0f}..{hi:.0f} s (prawda {truth.mixing_tau_s:.0f})")
+    print(f"RMSE = {cal.rmse_C:.3f} °C, n_eff = {cal.n_effective:.0f} z {cal.n_samples}")
+    if not cal.converged:
+        print("UWAGA: dopasowanie niezbieżne" + (f" (na granicy: {', '.join(cal.at_bound)})" if cal.at_bound else ""))
@@ -0,0 +1,347 @@
+"""Bezokienkowe (headless) renderowanie wykresów do raportów mocy CWU.
+
+Wykresy rysowane są bez wyświetlacza, z danych wynikowych (`ComparisonResult`,
+portfel z `oblicz_moc_cwu`). Szablony to samodzielne `Figure` (poza pyplot), więc
+import modułu nie zmienia backendu matplotlib importującego (app.py, cwu_report);
+Agg ustawiany jest tylko w procesach puli i w `main()`. Założenia:
+
+- jeden szablon figury na rodzaj wykresu i proces – kolejne wykresy tylko
+  podmieniają dane w istniejących artystach (bez budowania figury od zera),
+- wiele wykresów renderuje pula procesów,
+- wykres nie jest rysowany ponownie, jeśli jego dane się nie zmieniły
+  (skrót danych zapisany obok pliku).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import matplotlib
+from matplotlib.figure import Figure
+
+# Podbij przy każdej zmianie wyglądu szablonów – unieważnia zapisane skróty.
+TEMPLATE_VERSION = 1
+
+HASH_SUFFIX = ".src-hash"
+
+PZAM_COLORS = ["#ff7f7f", "#1f77b4", "#2ca02c"]  # mix / warstwowy / final
+
+
+@dataclass(frozen=True)
+class ChartJob:
+    """Jeden wykres do wyrenderowania.
+
+    kind:
+      "bar" (słupki z etykietami wartości) lub "moc_temp" (krzywe mocy
+      w funkcji temperatury zewnętrznej).
+    data:
+      Dane wykresu – wyłącznie typy JSON (są podstawą skrótu).
+    path:
+      Plik docelowy; format wynika z rozszerzenia (.png / .svg / .pdf).
+    """
+
+    kind: str
+    data: dict
+    path: str
+    dpi: int = 100
+
+    def digest(self) -> str:
+        payload = {
+            "v": TEMPLATE_VERSION,
+            "kind": self.kind,
+            "data": self.data,
+            "fmt": os.path.splitext(self.path)[1].lower(),
+            "dpi": self.dpi,
+        }
+        raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RenderReport:
+    rendered: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+
+
+# --- Szablony figur (po jednym na proces i rodzaj) ---
+
+class _BarTemplate:
+    def __init__(self, n_bars: int) -> None:
+        # Stałe marginesy zamiast tight_layout() przy każdym wykresie (to drugie kosztuje pełny przebieg rysowania).
+        self.fig = Figure(figsize=(8, 3.6))
+        self.ax = self.fig.subplots()
+        self.fig.subplots_adjust(left=0.09, right=0.98, top=0.9, bottom=0.12)
+        self.bars = self.ax.bar(range(n_bars), [0.0] * n_bars)
+        self.value_texts = [
+            self.ax.text(0.0, 0.0, "", ha="center", va="bottom", fontsize=10) for _ in range(n_bars)
+        ]
+        self.ax.grid(axis="y", linestyle="--", linewidth=0.6, alpha=0.5)
+        self.ax.set_axisbelow(True)
+        self.ax.set_xticks(range(n_bars))
+        self.ax.tick_params(axis="x", labelrotation=0)
+
+    def update(self, data: dict) -> None:
+        labels = list(data["labels"])
+        values = [float(v) for v in data["values"]]
+        colors = list(data.get("colors") or PZAM_COLORS)
+        unit = str(data.get("unit", "kW"))
+        fmt = str(data.get("value_fmt", "{:.1f}"))
+
+        for i, (bar, val) in enumerate(zip(self.bars, values)):
+            bar.set_height(val)
+            bar.set_color(colors[i % len(colors)])
+            txt = self.value_texts[i]
+            txt.set_position((bar.get_x() + bar.get_width() / 2.0, val))
+            txt.set_text(f"{fmt.format(val)} {unit}")
+
+        top = max(values, default=0.0)
+        self.ax.set_ylim(0, top * 1.25 if top > 0 else 1.0)
+        self.ax.set_xticklabels(labels)
+        self.ax.set_ylabel(str(data.get("ylabel", unit)))
+        self.ax.set_title(str(data.get("title", "")))
+
+
+class _MocTempTemplate:
+    def __init__(self) -> None:
+        self.fig = Figure(figsize=(10, 6))
+        self.ax = self.fig.subplots()
+        self.fig.subplots_adjust(left=0.1, right=0.97, top=0.93, bottom=0.09)
+        (self.line_cwu,) = self.ax.plot([], [], label="Straty ciepła CWU [W]", color="blue")
+        (self.line_zam,) = self.ax.plot([], [], label="Moc zamówiona MPEC [W]", color="red", linestyle="--")
+        self.ax.set_xlabel("Temperatura zewnętrzna [°C]")
+        self.ax.set_ylabel("Moc [W]")
+        self.ax.grid(True)
+        self.ax.legend()
+
+    def update(self, data: dict) -> None:
+        self.line_cwu.set_data(data["temp_zew"], data["moc_cwu_W"])
+        self.line_zam.set_data(data["temp_zew"], data["moc_zam_mpec_W"])
+        self.ax.set_title(str(data.get("title", "Zależność mocy zamówionej MPEC od temperatury zewnętrznej")))
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+
+_TEMPLATES: Dict[Tuple[str, int], object] = {}
+
+
+def _template_for(job: ChartJob):
+    if job.kind == "bar":
+        key = ("bar", len(job.data["values"]))
+        if key not in _TEMPLATES:
+            _TEMPLATES[key] = _BarTemplate(key[1])
+    elif job.kind == "moc_temp":
+        key = ("moc_temp", 0)
+        if key not in _TEMPLATES:
+            _TEMPLATES[key] = _MocTempTemplate()
+    else:
+        raise ValueError(f"Nieznany rodzaj wykresu: {job.kind}")
+    return _TEMPLATES[key]
+
+
+def _is_fresh(job: ChartJob, digest: str) -> bool:
+    if not os.path.exists(job.path):
+        return False
+    try:
+        with open(job.path + HASH_SUFFIX, "r", encoding="utf-8") as f:
+            return f.read().strip() == digest
+    except OSError:
+        return False
+
+
+def _render_one(job: ChartJob) -> str:
+    """Renderuje jeden wykres na szablonie procesu (zapis atomowy + skrót)."""
+    tpl = _template_for(job)
+    tpl.update(job.data)  # type: ignore[attr-defined]
+
+    out_dir = os.path.dirname(job.path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    root, ext = os.path.splitext(job.path)
+    tmp_path = f"{root}.tmp-{os.getpid()}{ext}"
+    # Niski poziom kompresji PNG: pliki nieco większe, zapis kilkukrotnie szybszy.
+    extra = {"pil_kwargs": {"compress_level": 1}} if ext.lower() == ".png" else {}
+    tpl.fig.savefig(tmp_path, dpi=job.dpi, **extra)  # type: ignore[attr-defined]
+    os.replace(tmp_path, job.path)
+
+    with open(job.path + HASH_SUFFIX, "w", encoding="utf-8") as f:
+        f.write(job.digest())
+    return job.path
+
+
+def _init_worker() -> None:
+    matplotlib.use("Agg", force=True)
+
+
+def render_charts(
+    jobs: Iterable[ChartJob],
+    workers: Optional[int] = None,
+    force: bool = False,
+    inline_below: int = 8,
+) -> RenderReport:
+    """Renderuje wykresy, pomijając te, których dane się nie zmieniły.
+
+    Przy małej liczbie wykresów (< inline_below) rysuje w bieżącym procesie –
+    start puli kosztowałby więcej niż samo rysowanie.
+    """
+
+    report = RenderReport()
+    dirty: List[ChartJob] = []
+    for job in jobs:
+        if not force and _is_fresh(job, job.digest()):
+            report.skipped.append(job.path)
+        else:
+            dirty.append(job)
+
+    if not dirty:
+        return report
+
+    if len(dirty) < inline_below or workers == 1:
+        report.rendered.extend(_render_one(j) for j in dirty)
+        return report
+
+    n_workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(dirty) // (n_workers * 4))
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as ex:
+        report.rendered.extend(ex.map(_render_one, dirty, chunksize=chunksize))
+    return report
+
+
+# --- Budowanie zadań z danych wynikowych ---
+
+def draw_pzam_bars(
+    ax,
+    labels: Sequence[str],
+    values: Sequence[float],
+    colors: Sequence[str] = PZAM_COLORS,
+    unit: str = "kW",
+):
+    """Rysuje słupki Pzam (ten sam wygląd co w szablonie "bar") na podanej osi."""
+    bars = ax.bar(list(labels), [float(v) for v in values], color=list(colors))
+
+    ax.set_ylabel(unit)
+    top = max((float(v) for v in values), default=0.0)
+    ax.set_ylim(0, top * 1.25 if top > 0 else 1.0)
+    ax.grid(axis="y", linestyle="--", linewidth=0.6, alpha=0.5)
+    ax.set_axisbelow(True)
+
+    for bar, val in zip(bars, values):
+        ax.text(
+            bar.get_x() + bar.get_width() / 2.0,
+            bar.get_height(),
+            f"{float(val):.1f} {unit}",
+            ha="center",
+            va="bottom",
+            fontsize=10,
+        )
+
+    ax.tick_params(axis="x", labelrotation=0)
+    return bars
+
+
+def pzam_bar_data(Pzam_mix_kW: float, Pzam_layer_kW: float, Pzam_final_kW: float) -> dict:
+    return {
+        "labels": ["Model idealnie mieszany", "Model warstwowy", "Rekomendowana moc"],
+        "values": [float(Pzam_mix_kW), float(Pzam_layer_kW), float(Pzam_final_kW)],
+        "colors": PZAM_COLORS,
+        "unit": "kW",
+    }
+
+
+def comparison_chart_jobs(res, out_dir: str, stem: str, fmt: str = "png") -> List[ChartJob]:
+    """Zadania wykresów dla jednego `ComparisonResult` (słupki Pzam i koszt roczny)."""
+    jobs = [
+        ChartJob(
+            kind="bar",
+            data=pzam_bar_data(res.mix.Pzam_kW, res.layered.Pzam_kW, res.Pzam_final_kw),
+            path=os.path.join(out_dir, f"{stem}_pzam.{fmt}"),
+        )
+    ]
+    if res.cost_bar_chart_year:
+        jobs.append(
+            ChartJob(
+                kind="bar",
+                data={
+                    "labels": [str(row["label"]) for row in res.cost_bar_chart_year],
+                    "values": [float(row["value_zl"]) for row in res.cost_bar_chart_year],
+                    "colors": ["#ff7f0e"],
+                    "unit": "zł",
+                    "value_fmt": "{:.0f}",
+                    "title": "Koszt roczny",
+                },
+                path=os.path.join(out_dir, f"{stem}_koszt_rok.{fmt}"),
+            )
+        )
+    return jobs
+
+
+def moc_temp_chart_job(
+    liczba_osob: float,
+    skutecznosc: float,
+    path: str,
+    temp_zew_min: float = -15.0,
+    temp_zew_max: float = 5.0,
+    punkty: int = 100,
+) -> ChartJob:
+    """Zadanie wykresu z `oblicz_moc_cwu` (moc vs temperatura zewnętrzna) dla jednego budynku."""
+    from oblicz_moc_cwu import _moc_cwu_W
+
+    if punkty < 2:
+        raise ValueError("Liczba punktów wykresu musi wynosić co najmniej 2.")
+
+    step = (temp_zew_max - temp_zew_min) / (punkty - 1)
+    temps = [temp_zew_min + i * step for i in range(punkty)]
+    moc = [float(_moc_cwu_W(float(liczba_osob), t)) for t in temps]
+    return ChartJob(
+        kind="moc_temp",
+        data={
+            "temp_zew": temps,
+            "moc_cwu_W": moc,
+            "moc_zam_mpec_W": [m / float(skutecznosc) for m in moc],
+        },
+        path=path,
+    )
+
+
+def main(argv=None) -> int:
+    import argparse
+    import sys
+    import time
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Wykresy moc–temperatura dla portfela budynków (bez wyświetlacza).")
+    parser.add_argument("--wejscie", required=True, help="CSV z kolumnami id, liczba_osob[, skutecznosc]")
+    parser.add_argument("--katalog", default="wykresy", help="Katalog wyjściowy")
+    parser.add_argument("--format", default="png", choices=["png", "svg", "pdf"])
+    parser.add_argument("--procesy", type=int, default=None, help="Liczba procesów (domyślnie: liczba rdzeni)")
+    parser.add_argument("--wymus", action="store_true", help="Renderuj także niezmienione wykresy")
+    args = parser.parse_args(argv)
+    matplotlib.use("Agg", force=True)
+
+    df = pd.read_csv(args.wejscie)
+    ids = df["id"].astype(str) if "id" in df.columns else pd.Series(range(len(df))).astype(str)
+    eta = df["skutecznosc"] if "skutecznosc" in df.columns else pd.Series([0.85] * len(df))
+
+    jobs = [
+        moc_temp_chart_job(osoby, sk, os.path.join(args.katalog, f"{bid}_moc_temp.{args.format}"))
+        for bid, osoby, sk in zip(ids, df["liczba_osob"], eta)
+    ]
+
+    t0 = time.perf_counter()
+    report = render_charts(jobs, workers=args.procesy, force=args.wymus)
+    print(
+        f"Wyrenderowano {len(report.rendered)}, pominięto {len(report.skipped)} "
+        f"w {time.perf_counter() - t0:.1f} s → {args.katalog}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
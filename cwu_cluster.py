@@ -0,0 +1,500 @@
+"""Przeliczenia rozproszone: koordynator i workery HTTP (bez brokera).
+
+Duże przeglądy (siatki parametrów, portfele budynków, Monte Carlo) przestają
+mieścić się w rdzeniach jednej maszyny. Worker to mała usługa HTTP wokół
+`compare_models` (scenariusze w formacie `cwu_batch`), koordynator dzieli listę
+scenariuszy na porcje (shardy) i rozdziela je między workery.
+
+Worker (na każdym hoście; albo `uvicorn cwu_cluster:worker_app --port 8101`):
+
+    python cwu_cluster.py worker --port 8101 [--procesy 4]
+
+Koordynator:
+
+    python cwu_cluster.py koordynator --wejscie scenariusze.jsonl \\
+        --wezly http://10.0.0.5:8101,http://10.0.0.6:8101 [--wyjscie wyniki.jsonl]
+
+Wszystko na jednej maszynie (workery jako lokalne procesy, np. do testów):
+
+    python cwu_cluster.py lokalnie --wejscie scenariusze.jsonl --wezly 4
+
+Zasady:
+- równoważenie: shardy czekają we wspólnej kolejce, a każdy węzeł (× `--sloty`)
+  pobiera następny, gdy skończy poprzedni – szybsze węzły liczą więcej,
+- ponawianie: błąd transportu, 5xx albo przekroczenie czasu zwraca shard do kolejki
+  (maks. `--proby` prób); węzeł z kolejnymi błędami odczekuje coraz dłużej, więc jego
+  shardy przejmują pozostałe. Błąd w samym scenariuszu nie jest ponawiany – wraca
+  jako rekord "error" (jak w `cwu_batch`),
+- kolejność: rekordy zapisywane są w kolejności wejścia (bufor do pierwszego
+  brakującego sharda); shard policzony dwa razy (odpowiedź po limicie czasu)
+  liczy się raz,
+- wznawianie jak w `cwu_batch`: scenariusze z rekordem "ok" w pliku wyjściowym są pomijane,
+- profile z plików (`profile.file`) są wczytywane przez koordynatora i wysyłane
+  jako `demand_lpm` – workery nie potrzebują wspólnego dysku.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from cwu_batch import STATUS_ERROR, STATUS_OK, completed_ids, read_scenarios, run_scenario
+from cwu_records import load_profile_file, open_output
+from cwu_time_simulation import ENGINE_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 8
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_TIMEOUT_S = 600.0
+
+# Odczekanie węzła po kolejnych błędach: BASE · 2^(n-1), maks. MAX
+NODE_BACKOFF_BASE_S = 0.5
+NODE_BACKOFF_MAX_S = 30.0
+
+
+# --- Worker ---
+
+_worker_pool: Optional[ProcessPoolExecutor] = None
+_worker_pool_lock = threading.Lock()
+
+
+def _worker_executor() -> Optional[ProcessPoolExecutor]:
+    """Pula procesów workera (CWU_WORKER_PROCESSES > 1); None – scenariusze liczone w wątku żądania."""
+    global _worker_pool
+    n = int(os.environ.get("CWU_WORKER_PROCESSES", "1") or 1)
+    if n <= 1:
+        return None
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ProcessPoolExecutor(max_workers=n)
+        return _worker_pool
+
+
+class ShardRequest(BaseModel):
+    shard: int
+    scenarios: list[dict[str, Any]]
+    backend: Optional[str] = None
+
+
+class ShardResponse(BaseModel):
+    shard: int
+    records: list[dict[str, Any]]
+    engine_version: str
+
+
+worker_app = FastAPI(title="CWU – worker przeliczeń rozproszonych", version="1.0")
+
+
+@worker_app.get("/healthz")
+def worker_health() -> dict[str, Any]:
+    return {"status": "ok", "engine_version": ENGINE_VERSION, "pid": os.getpid()}
+
+
+@worker_app.post("/shard", response_model=ShardResponse)
+def worker_shard(req: ShardRequest) -> ShardResponse:
+    # Funkcja synchroniczna – FastAPI liczy ją w puli wątków, pętla zdarzeń obsługuje /healthz
+    ex = _worker_executor()
+    if ex is None:
+        records = [run_scenario(sc, req.backend) for sc in req.scenarios]
+    else:
+        records = list(ex.map(run_scenario, req.scenarios, [req.backend] * len(req.scenarios)))
+    return ShardResponse(shard=req.shard, records=records, engine_version=ENGINE_VERSION)
+
+
+# --- Koordynator ---
+
+@dataclass
+class _Shard:
+    index: int
+    scenarios: List[Dict[str, Any]]
+    attempts: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ClusterStats:
+    shards: int = 0
+    retries: int = 0
+    failed_shards: int = 0
+    shards_by_node: Dict[str, int] = field(default_factory=dict)
+
+
+def _portable(sc: Dict[str, Any]) -> Dict[str, Any]:
+    """Scenariusz bez ścieżek lokalnych: profil z pliku wczytany tutaj i wysłany jako lista."""
+    spec = sc.get("profile") or {}
+    out = {k: v for k, v in sc.items() if k != "_base_dir"}
+    if "file" in spec and "demand_lpm" not in spec:
+        path = spec["file"]
+        if not os.path.isabs(path):
+            path = os.path.join(sc.get("_base_dir", ""), path)
+        out["profile"] = {"demand_lpm": load_profile_file(path)}
+    return out
+
+
+def _error_records(shard: _Shard) -> List[Dict[str, Any]]:
+    msg = f"Shard {shard.index} nie powiódł się po {shard.attempts} próbach: " + " | ".join(shard.errors[-3:])
+    return [
+        {"id": sc["id"], "status": STATUS_ERROR, "error": msg, "engine_version": ENGINE_VERSION}
+        for sc in shard.scenarios
+    ]
+
+
+class Coordinator:
+    """Rozdziela scenariusze między workery HTTP i scala rekordy w kolejności wejścia.
+
+    nodes: adresy workerów (http://host:port).
+    slots_per_node: ile shardów naraz wysyłać do jednego węzła (np. = liczba jego procesów).
+    unavailable_timeout_s: po takim czasie bez żadnego działającego węzła pozostałe shardy
+      kończą się rekordami "error" (zamiast czekać w nieskończoność).
+    """
+
+    def __init__(
+        self,
+        nodes: List[str],
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        timeout_s: float = DEFAULT_TIMEOUT_S,
+        slots_per_node: int = 1,
+        backend: Optional[str] = None,
+        unavailable_timeout_s: float = 60.0,
+    ):
+        if not nodes:
+            raise ValueError("Podaj co najmniej jeden węzeł.")
+        if shard_size < 1 or max_attempts < 1 or slots_per_node < 1:
+            raise ValueError("shard_size, max_attempts i slots_per_node muszą być >= 1")
+        self.nodes = [n.rstrip("/") for n in nodes]
+        self.shard_size = int(shard_size)
+        self.max_attempts = int(max_attempts)
+        self.timeout_s = float(timeout_s)
+        self.slots_per_node = int(slots_per_node)
+        self.backend = backend
+        self.unavailable_timeout_s = float(unavailable_timeout_s)
+        self.stats = ClusterStats()
+
+    def _healthy(self, node: str) -> bool:
+        try:
+            with urllib.request.urlopen(node + "/healthz", timeout=min(5.0, self.timeout_s)) as resp:
+                return json.loads(resp.read().decode("utf-8")).get("engine_version") == ENGINE_VERSION
+        except Exception:  # noqa: BLE001 – każdy błąd = węzeł niedostępny
+            return False
+
+    def _post(self, node: str, shard: _Shard) -> List[Dict[str, Any]]:
+        body = json.dumps(
+            {"shard": shard.index, "scenarios": shard.scenarios, "backend": self.backend}, ensure_ascii=False
+        ).encode("utf-8")
+        req = urllib.request.Request(
+            node + "/shard", data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
+            payload = json.loads(resp.read().decode("utf-8"))
+        records = payload["records"]
+        if payload.get("shard") != shard.index or len(records) != len(shard.scenarios):
+            raise ValueError("niespójna odpowiedź workera")
+        if payload.get("engine_version") != ENGINE_VERSION:
+            raise ValueError(f"inna wersja silnika na węźle: {payload.get('engine_version')}")
+        return records
+
+    def run(
+        self,
+        scenarios: List[Dict[str, Any]],
+        on_record: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Liczy scenariusze; zwraca rekordy w kolejności wejścia (on_record – też w tej kolejności)."""
+        shards = [
+            _Shard(index=i, scenarios=[_portable(sc) for sc in scenarios[start : start + self.shard_size]])
+            for i, start in enumerate(range(0, len(scenarios), self.shard_size))
+        ]
+        self.stats = ClusterStats(shards=len(shards))
+        todo: "queue.Queue[_Shard]" = queue.Queue()
+        for sh in shards:
+            todo.put(sh)
+
+        results: Dict[int, List[Dict[str, Any]]] = {}
+        cond = threading.Condition()
+        stop = threading.Event()
+
+        def finish(shard: _Shard, records: List[Dict[str, Any]], node: Optional[str]) -> None:
+            with cond:
+                if shard.index in results:
+                    return  # policzony już przez inny węzeł
+                results[shard.index] = records
+                if node is not None:
+                    self.stats.shards_by_node[node] = self.stats.shards_by_node.get(node, 0) + 1
+                cond.notify_all()
+
+        in_flight = 0
+        last_available = time.monotonic()
+
+        def serve(node: str) -> None:
+            nonlocal in_flight, last_available
+            failures = 0
+            healthy = False
+            while not stop.is_set():
+                # Węzeł bez potwierdzonej gotowości (start, po błędzie) nie bierze shardów –
+                # niedziałający host nie zużywa prób cudzych shardów
+                if not healthy:
+                    healthy = self._healthy(node)
+                    if not healthy:
+                        failures += 1
+                        stop.wait(min(NODE_BACKOFF_MAX_S, NODE_BACKOFF_BASE_S * 2 ** (failures - 1)))
+                        continue
+                with cond:
+                    last_available = time.monotonic()
+                try:
+                    shard = todo.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                with cond:
+                    if shard.index in results:
+                        continue
+                    shard.attempts += 1
+                    in_flight += 1
+                try:
+                    records = self._post(node, shard)
+                except Exception as exc:  # noqa: BLE001 – każdy błąd sharda: ponowienie na innym węźle
+                    failures += 1
+                    healthy = False
+                    err = f"{node}: {type(exc).__name__}: {exc}"
+                    logger.warning("Shard %d, próba %d: %s", shard.index, shard.attempts, err)
+                    with cond:
+                        in_flight -= 1
+                        shard.errors.append(err)
+                        give_up = shard.attempts >= self.max_attempts
+                        if give_up:
+                            self.stats.failed_shards += 1
+                        else:
+                            self.stats.retries += 1
+                    if give_up:
+                        finish(shard, _error_records(shard), None)
+                    else:
+                        todo.put(shard)
+                    # Węzeł z błędami odczekuje – jego shardy w tym czasie przejmują inne
+                    stop.wait(min(NODE_BACKOFF_MAX_S, NODE_BACKOFF_BASE_S * 2 ** (failures - 1)))
+                    continue
+                failures = 0
+                with cond:
+                    in_flight -= 1
+                finish(shard, records, node)
+
+        def fail_pending() -> None:
+            """Żaden węzeł nie działa od `unavailable_timeout_s` – pozostałe shardy kończą się błędem."""
+            while True:
+                try:
+                    shard = todo.get_nowait()
+                except queue.Empty:
+                    return
+                if shard.index not in results:
+                    shard.errors.append(f"brak działających węzłów przez {self.unavailable_timeout_s:.0f} s")
+                    self.stats.failed_shards += 1
+                    results[shard.index] = _error_records(shard)
+            cond.notify_all()
+
+        threads = [
+            threading.Thread(target=serve, args=(node,), name=f"cwu-cluster-{node}-{slot}", daemon=True)
+            for node in self.nodes
+            for slot in range(self.slots_per_node)
+        ]
+        for t in threads:
+            t.start()
+
+        ordered: List[Dict[str, Any]] = []
+        try:
+            for i in range(len(shards)):
+                with cond:
+                    while i not in results:
+                        cond.wait(timeout=1.0)
+                        if in_flight == 0 and time.monotonic() - last_available > self.unavailable_timeout_s:
+                            fail_pending()
+                    records = results[i]
+                for rec in records:
+                    ordered.append(rec)
+                    if on_record is not None:
+                        on_record(rec)
+        finally:
+            stop.set()
+            for t in threads:
+                t.join(timeout=self.timeout_s)
+        return ordered
+
+
+def run_cluster(
+    scenarios: List[Dict[str, Any]],
+    output_path: str,
+    coordinator: Coordinator,
+    fresh: bool = False,
+):
+    """Jak `cwu_batch.run_batch`, ale na węzłach koordynatora; zwraca (policzone, błędy, pominięte)."""
+    done = set() if fresh else completed_ids(output_path)
+    todo = [sc for sc in scenarios if sc["id"] not in done]
+    n_ok = n_err = 0
+    with open_output(output_path, fresh) as out:
+
+        def emit(rec: Dict[str, Any]) -> None:
+            nonlocal n_ok, n_err
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            if rec.get("status") == STATUS_OK:
+                n_ok += 1
+            else:
+                n_err += 1
+
+        coordinator.run(todo, on_record=emit)
+    return n_ok, n_err, len(scenarios) - len(todo)
+
+
+# --- Workery lokalne ---
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(url: str, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            with urllib.request.urlopen(url + "/healthz", timeout=2.0) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Worker {url} nie odpowiada po {timeout_s:.0f} s.")
+        time.sleep(0.1)
+
+
+class LocalWorkers:
+    """Workery jako procesy lokalne (uvicorn na 127.0.0.1, wolne porty); zamykane przy wyjściu z `with`."""
+
+    def __init__(self, count: int, processes_per_worker: int = 1, startup_timeout_s: float = 60.0):
+        self.count = int(count)
+        self.processes_per_worker = int(processes_per_worker)
+        self.startup_timeout_s = float(startup_timeout_s)
+        self.urls: List[str] = []
+        self._procs: List[subprocess.Popen] = []
+
+    def __enter__(self) -> "LocalWorkers":
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, CWU_WORKER_PROCESSES=str(self.processes_per_worker))
+        try:
+            for _ in range(self.count):
+                port = _free_port()
+                self._procs.append(subprocess.Popen(
+                    [sys.executable, os.path.join(here, "cwu_cluster.py"), "worker", "--port", str(port)],
+                    cwd=here,
+                    env=env,
+                ))
+                self.urls.append(f"http://127.0.0.1:{port}")
+            for url in self.urls:
+                _wait_healthy(url, self.startup_timeout_s)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def close(self) -> None:
+        for p in self._procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in self._procs:
+            try:
+                p.wait(timeout=10.0)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
+        self._procs.clear()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Przeliczenia CWU rozproszone na workery HTTP.")
+    sub = parser.add_subparsers(dest="tryb", required=True)
+
+    p_worker = sub.add_parser("worker", help="Uruchom worker HTTP")
+    p_worker.add_argument("--host", default="127.0.0.1")
+    p_worker.add_argument("--port", type=int, default=8101)
+    p_worker.add_argument("--procesy", type=int, default=None, help="Procesy liczące w workerze (domyślnie CWU_WORKER_PROCESSES albo 1)")
+
+    for name, help_text in (("koordynator", "Rozdziel scenariusze na podane workery"), ("lokalnie", "Uruchom workery lokalnie i przelicz")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--wejscie", required=True, help="Plik scenariuszy .json lub .jsonl (format cwu_batch)")
+        p.add_argument("--wyjscie", help="Plik wyników .jsonl (domyślnie <wejście>_wyniki.jsonl)")
+        p.add_argument("--shard", type=int, default=DEFAULT_SHARD_SIZE, help="Scenariuszy na shard")
+        p.add_argument("--proby", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Maks. prób na shard")
+        p.add_argument("--limit-czasu", type=float, default=DEFAULT_TIMEOUT_S, help="Limit czasu odpowiedzi na shard [s]")
+        p.add_argument("--sloty", type=int, default=1, help="Shardy naraz na węzeł")
+        p.add_argument("--backend", default=None, help="Silnik symulacji na workerach (np. reference, fast)")
+        p.add_argument("--od-nowa", action="store_true", help="Nadpisz plik wyników zamiast wznawiać")
+    sub.choices["koordynator"].add_argument("--wezly", required=True, help="Adresy workerów, po przecinku")
+    sub.choices["lokalnie"].add_argument("--wezly", type=int, default=os.cpu_count() or 1, help="Liczba lokalnych workerów")
+    sub.choices["lokalnie"].add_argument("--procesy", type=int, default=1, help="Procesy liczące na worker")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.tryb == "worker":
+        import uvicorn
+
+        if args.procesy is not None:
+            os.environ["CWU_WORKER_PROCESSES"] = str(args.procesy)
+        uvicorn.run(worker_app, host=args.host, port=args.port, log_level="warning")
+        return 0
+
+    if args.wyjscie is None:
+        root, _ = os.path.splitext(args.wejscie)
+        args.wyjscie = root + "_wyniki.jsonl"
+    scenarios = read_scenarios(args.wejscie)
+
+    def run(nodes: List[str]) -> int:
+        coordinator = Coordinator(
+            nodes,
+            shard_size=args.shard,
+            max_attempts=args.proby,
+            timeout_s=args.limit_czasu,
+            slots_per_node=args.sloty,
+            backend=args.backend,
+        )
+        t0 = time.perf_counter()
+        n_ok, n_err, skipped = run_cluster(scenarios, args.wyjscie, coordinator, fresh=args.od_nowa)
+        st = coordinator.stats
+        print(
+            f"Policzono {n_ok}, błędy {n_err}, pominięto (już policzone) {skipped} "
+            f"w {time.perf_counter() - t0:.1f} s → {args.wyjscie}; shardy {st.shards}, "
+            f"ponowienia {st.retries}, nieudane {st.failed_shards}, na węzeł {st.shards_by_node}",
+            file=sys.stderr,
+        )
+        return 1 if n_err else 0
+
+    try:
+        if args.tryb == "koordynator":
+            return run([n for n in args.wezly.split(",") if n])
+        with LocalWorkers(args.wezly, processes_per_worker=args.procesy) as workers:
+            return run(workers.urls)
+    except KeyboardInterrupt:
+        print("Przerwano – uruchom ponownie, aby dokończyć (policzone scenariusze zostaną pominięte).", file=sys.stderr)
+        return 130
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
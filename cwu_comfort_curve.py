@@ -0,0 +1,229 @@
+"""Krzywa komfort–moc: Pzam w funkcji dopuszczalnych minut poniżej T_min.
+
+`compare_models` przyjmuje jedną wartość `allowed_violation_min`, więc pytanie
+„ile mocy oszczędzimy, tolerując 5/10/30 minut poniżej T_min” oznaczało osobne
+szukanie dla każdej wartości. Tutaj minuty naruszeń w funkcji mocy, v(P),
+liczone są raz dla obu modeli i odwracane dla dowolnej listy tolerancji:
+
+1. drabina mocy pmax_start·2^k (jak faza podwajania w `_find_min_pmax`) – jedna
+   symulacja wektorowa, górna granica dla najostrzejszej tolerancji,
+2. równomierna siatka kandydatów poniżej tej granicy – druga symulacja wektorowa,
+3. dla każdej tolerancji a: przedział [największa moc z v > a, najmniejsza moc
+   z v <= a] z próbek, zawężany bisekcją wektorową – wszystkie tolerancje naraz,
+   jedna symulacja wektorowa na krok.
+
+v(P) jest nierosnące w P, więc wynik spełnia warunek (moc sprawdzona symulacją)
+i leży w tol_kW od wyniku `compare_models(allowed_violation_min=a)`. Koszt nie
+zależy od liczby tolerancji: ok. 8–10 symulacji wektorowych na model.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cwu_time_simulation import (
+    DemandProfile,
+    LayeredParams,
+    LossInput,
+    TankParams,
+    analyze_profile,
+    derive_loss_kw,
+)
+from cwu_vector_sim import BatchRunResult, simulate_layered_batch, simulate_mixed_batch
+
+MODELS = ("mixed", "layered_2zone")
+
+DEFAULT_TOLERANCES_MIN = (0.0, 5.0, 10.0, 15.0, 30.0, 60.0)
+
+# Liczba kandydatów na siatce (krok 2)
+GRID_POINTS = 32
+
+
+@dataclass(frozen=True)
+class ComfortPoint:
+    allowed_violation_min: float
+    Pzam_mix_kW: float
+    Pzam_layer_kW: float
+    # Oszczędność względem najostrzejszej tolerancji z listy
+    saving_mix_kW: float
+    saving_layer_kW: float
+
+
+@dataclass(frozen=True)
+class ViolationCurve:
+    """Próbki v(P) jednego modelu (rosnąco wg mocy) – wszystkie moce policzone po drodze."""
+
+    model: str
+    P_kW: List[float]
+    violation_minutes: List[float]
+
+
+@dataclass(frozen=True)
+class ComfortCurve:
+    points: List[ComfortPoint]  # rosnąco wg tolerancji
+    curves: Dict[str, ViolationCurve]
+    loss_kw: float
+    vector_simulations: int
+
+
+def _invert(
+    model: str,
+    simulate: Callable[[np.ndarray], BatchRunResult],
+    tolerances: np.ndarray,
+    pmax_start_kW: float,
+    pmax_max_kW: float,
+    tol_kW: float,
+) -> Tuple[np.ndarray, ViolationCurve, int]:
+    """Pzam dla każdej tolerancji + próbki v(P) jednego modelu."""
+    samples_P: List[np.ndarray] = []
+    samples_v: List[np.ndarray] = []
+
+    def run(p: np.ndarray) -> np.ndarray:
+        v = simulate(p).violation_minutes
+        samples_P.append(p)
+        samples_v.append(v)
+        return v
+
+    # (1) Drabina jak w fazie podwajania: ostatni szczebel to pierwszy >= pmax_max
+    steps = max(0, math.ceil(math.log2(pmax_max_kW / pmax_start_kW))) if pmax_max_kW > pmax_start_kW else 0
+    ladder = pmax_start_kW * 2.0 ** np.arange(steps + 1)
+    v_ladder = run(ladder)
+    ok = v_ladder <= tolerances.min()
+    if not ok.any():
+        raise RuntimeError(f"Nie znaleziono Pmax spełniającego warunek do {pmax_max_kW} kW.")
+    p_top = float(ladder[int(np.argmax(ok))])
+
+    # (2) Siatka kandydatów poniżej górnej granicy
+    run(p_top * np.arange(1, GRID_POINTS + 1) / GRID_POINTS)
+    sims = 2
+
+    # (3) Przedziały z próbek i bisekcja wektorowa (tor = tolerancja)
+    P = np.concatenate(samples_P)
+    V = np.concatenate(samples_v)
+    hi = np.array([P[V <= a].min() for a in tolerances])
+    lo = np.array([max((P[(V > a) & (P < h)]).max(initial=0.0), 0.0) for a, h in zip(tolerances, hi)])
+    while True:
+        active = (hi - lo) > tol_kW
+        if not active.any():
+            break
+        mid = np.where(active, 0.5 * (lo + hi), hi)
+        v_mid = run(mid)
+        sims += 1
+        mid_ok = v_mid <= tolerances
+        hi = np.where(active & mid_ok, mid, hi)
+        lo = np.where(active & ~mid_ok, mid, lo)
+
+    P = np.concatenate(samples_P)
+    V = np.concatenate(samples_v)
+    order = np.argsort(P, kind="stable")
+    P, V = P[order], V[order]
+    keep = np.concatenate(([True], np.diff(P) > 0)) if P.size else np.array([], dtype=bool)
+    curve = ViolationCurve(model=model, P_kW=P[keep].tolist(), violation_minutes=V[keep].tolist())
+    return hi, curve, sims
+
+
+def comfort_power_curve(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_input: LossInput,
+    allowed_violation_min: Sequence[float] = DEFAULT_TOLERANCES_MIN,
+    layered: Optional[LayeredParams] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+) -> ComfortCurve:
+    """Pzam_mix i Pzam_layer dla listy dopuszczalnych minut naruszeń (parametry jak w `compare_models`)."""
+    tolerances = np.array(sorted({float(a) for a in allowed_violation_min}))
+    if tolerances.size == 0:
+        raise ValueError("Podaj co najmniej jedną tolerancję.")
+    if tolerances[0] < 0:
+        raise ValueError("allowed_violation_min musi być >= 0")
+    if tol_kW <= 0:
+        raise ValueError("tol_kW must be > 0")
+    if pmax_start_kW <= 0:
+        raise ValueError("pmax_start_kW musi być > 0")
+
+    layered_params = layered or LayeredParams()
+    demand = np.asarray(demand_lpm, dtype=np.float64)
+
+    # Straty jak w compare_models
+    P_avg_kW = analyze_profile(
+        demand_lpm=demand,
+        dt_s=tank.dt_s,
+        T_cold_C=tank.T_cold_C,
+        T_delivery_C=tank.T_set_C,
+    ).P_avg_CWU_kW
+    loss_kw = derive_loss_kw(loss_input=loss_input, P_avg_CWU_kW=P_avg_kW)
+
+    common = dict(
+        volume_l=tank.volume_l,
+        T_init_C=tank.T_init_C,
+        T_set_C=tank.T_set_C,
+        T_cold_C=tank.T_cold_C,
+        T_min_C=tank.T_min_C,
+        dt_s=tank.dt_s,
+        demand_lpm=demand,
+        loss_kw=loss_kw,
+    )
+    simulate = {
+        "mixed": lambda p: simulate_mixed_batch(**common, pmax_kW=p),
+        "layered_2zone": lambda p: simulate_layered_batch(
+            **common,
+            pmax_kW=p,
+            hot_fraction=layered_params.hot_fraction,
+            mixing_tau_s=layered_params.mixing_tau_s,
+            losses_all_hot=layered_params.losses_split == "all_hot",
+        ),
+    }
+
+    pzam: Dict[str, np.ndarray] = {}
+    curves: Dict[str, ViolationCurve] = {}
+    sims = 0
+    for m in MODELS:
+        pzam[m], curves[m], k = _invert(m, simulate[m], tolerances, pmax_start_kW, pmax_max_kW, tol_kW)
+        sims += k
+
+    points = [
+        ComfortPoint(
+            allowed_violation_min=float(a),
+            Pzam_mix_kW=float(pzam["mixed"][i]),
+            Pzam_layer_kW=float(pzam["layered_2zone"][i]),
+            saving_mix_kW=float(pzam["mixed"][0] - pzam["mixed"][i]),
+            saving_layer_kW=float(pzam["layered_2zone"][0] - pzam["layered_2zone"][i]),
+        )
+        for i, a in enumerate(tolerances)
+    ]
+    return ComfortCurve(points=points, curves=curves, loss_kw=loss_kw, vector_simulations=sims)
+
+
+def comfort_table(curve: ComfortCurve) -> List[Dict[str, float]]:
+    """Wiersze do GUI/raportu: tolerancja, Pzam obu modeli, oszczędność."""
+    return [
+        {
+            "naruszenia_min": p.allowed_violation_min,
+            "Pzam_mix_kW": round(p.Pzam_mix_kW, 1),
+            "Pzam_layer_kW": round(p.Pzam_layer_kW, 1),
+            "oszczednosc_layer_kW": round(p.saving_layer_kW, 1),
+        }
+        for p in curve.points
+    ]
+
+
+if __name__ == "__main__":
+    import time
+
+    from cwu_time_simulation import DEFAULT_AUDIT_PEAKS, build_profile_24h
+
+    t0 = time.perf_counter()
+    curve = comfort_power_curve(
+        TankParams(volume_l=500.0, T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=60),
+        build_profile_24h(dt_s=60, peaks=DEFAULT_AUDIT_PEAKS),
+        LossInput(loss_kw=1.0),
+    )
+    print(f"Symulacje wektorowe: {curve.vector_simulations}, czas: {time.perf_counter() - t0:.2f} s")
+    for row in comfort_table(curve):
+        print(row)
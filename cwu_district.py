@@ -0,0 +1,256 @@
+"""Węzeł cieplny / sieć: dobór Pzam dla wielu budynków naraz.
+
+Każdy budynek ma własne `TankParams`, `LayeredParams`, profil poboru i straty.
+Wszystkie budynki liczone są jedną symulacją wektorową (`cwu_vector_sim`),
+także szukanie Pzam – jedna bisekcja wektorowa zamiast N osobnych wyszukiwań.
+
+Raport:
+- Pzam każdego budynku (samodzielnie, bez limitu węzła),
+- moc jednoczesna węzła (max sumy P_in przy Pzam budynków),
+- współczynnik różnorodności = suma Pzam / moc jednoczesna (≥ 1),
+- przy zadanym limicie mocy węzła: minuty naruszeń budynków przy proporcjonalnym
+  ograniczaniu mocy oraz minimalny limit węzła, przy którym wszystkie budynki
+  mieszczą się w dopuszczalnych naruszeniach.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from cwu_time_simulation import (
+    DemandProfile,
+    LayeredParams,
+    LossInput,
+    TankParams,
+    analyze_profile,
+    derive_loss_kw,
+)
+from cwu_vector_sim import BatchRunResult, find_min_pmax_batch, simulate_layered_batch, simulate_mixed_batch
+
+MODELS = ("mixed", "layered_2zone")
+
+
+@dataclass(frozen=True)
+class DistrictBuilding:
+    name: str
+    tank: TankParams
+    demand_lpm: DemandProfile
+    loss_input: LossInput
+    layered: LayeredParams = field(default_factory=LayeredParams)
+    allowed_violation_min: float = 0.0
+
+
+@dataclass(frozen=True)
+class BuildingSizing:
+    name: str
+    Pzam_kW: float
+    loss_kw: float
+    T_min_reached_C: float
+    # Minuty naruszeń przy wspólnym limicie węzła (None, gdy limitu nie podano)
+    violation_minutes_at_node_limit: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class DistrictResult:
+    model: str
+    buildings: List[BuildingSizing]
+    sum_Pzam_kW: float
+    coincident_peak_kW: float
+    diversity_factor: float  # suma Pzam / moc jednoczesna
+    simultaneity_factor: float  # odwrotność: moc jednoczesna / suma Pzam
+    # Minimalny wspólny limit mocy węzła, przy którym wszystkie budynki spełniają warunek komfortu
+    node_Pzam_kW: float
+    node_limit_kW: Optional[float]
+    node_limit_ok: Optional[bool]
+    P_node_kW: List[float]  # suma P_in budynków w kolejnych krokach (przy Pzam, bez limitu)
+    vector_simulations: int
+
+
+class _District:
+    """Budynki w układzie struct-of-arrays (tablice o długości N, profile (N, T))."""
+
+    def __init__(self, buildings: Sequence[DistrictBuilding], model: str):
+        if not buildings:
+            raise ValueError("Podaj co najmniej jeden budynek.")
+        if model not in MODELS:
+            raise ValueError(f"Nieznany model: {model!r} (dostępne: {', '.join(MODELS)})")
+
+        dts = {b.tank.dt_s for b in buildings}
+        if len(dts) != 1:
+            raise ValueError("Wszystkie budynki muszą mieć ten sam krok czasu dt_s.")
+        lengths = {len(b.demand_lpm) for b in buildings}
+        if len(lengths) != 1:
+            raise ValueError("Wszystkie profile poboru muszą mieć tę samą długość.")
+
+        self.model = model
+        self.dt_s = dts.pop()
+        self.names = [b.name for b in buildings]
+        self.demand = np.asarray([np.asarray(b.demand_lpm, dtype=np.float64) for b in buildings])
+
+        def col(getter) -> np.ndarray:
+            return np.asarray([getter(b) for b in buildings], dtype=np.float64)
+
+        self.volume_l = col(lambda b: b.tank.volume_l)
+        self.T_init_C = col(lambda b: b.tank.T_init_C)
+        self.T_set_C = col(lambda b: b.tank.T_set_C)
+        self.T_cold_C = col(lambda b: b.tank.T_cold_C)
+        self.T_min_C = col(lambda b: b.tank.T_min_C)
+        self.hot_fraction = col(lambda b: b.layered.hot_fraction)
+        self.mixing_tau_s = col(lambda b: b.layered.mixing_tau_s)
+        self.losses_all_hot = np.asarray([b.layered.losses_split == "all_hot" for b in buildings])
+        self.allowed = col(lambda b: b.allowed_violation_min)
+
+        # Straty jak w compare_models: z P_avg_CWU profilu danego budynku
+        self.loss_kw = np.asarray([
+            derive_loss_kw(
+                loss_input=b.loss_input,
+                P_avg_CWU_kW=analyze_profile(
+                    demand_lpm=self.demand[i],
+                    dt_s=self.dt_s,
+                    T_cold_C=b.tank.T_cold_C,
+                    T_delivery_C=b.tank.T_set_C,
+                ).P_avg_CWU_kW,
+            )
+            for i, b in enumerate(buildings)
+        ])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def simulate(self, pmax_kW: np.ndarray, node_limit_kW: Optional[float] = None) -> BatchRunResult:
+        common = dict(
+            volume_l=self.volume_l,
+            T_init_C=self.T_init_C,
+            T_set_C=self.T_set_C,
+            T_cold_C=self.T_cold_C,
+            T_min_C=self.T_min_C,
+            dt_s=self.dt_s,
+            demand_lpm=self.demand,
+            pmax_kW=pmax_kW,
+            loss_kw=self.loss_kw,
+            node_limit_kW=node_limit_kW,
+        )
+        if self.model == "mixed":
+            return simulate_mixed_batch(**common)
+        return simulate_layered_batch(
+            **common,
+            hot_fraction=self.hot_fraction,
+            mixing_tau_s=self.mixing_tau_s,
+            losses_all_hot=self.losses_all_hot,
+        )
+
+    def all_ok(self, res: BatchRunResult) -> bool:
+        return bool(np.all(res.violation_minutes <= self.allowed))
+
+
+def size_district(
+    buildings: Sequence[DistrictBuilding],
+    model: str = "layered_2zone",
+    node_limit_kW: Optional[float] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+) -> DistrictResult:
+    """Dobór Pzam budynków węzła i mocy jednoczesnej – wszystko symulacjami wektorowymi."""
+    if node_limit_kW is not None and node_limit_kW < 0:
+        raise ValueError("node_limit_kW musi być >= 0")
+
+    district = _District(buildings, model)
+    n = len(district)
+
+    # (1) Pzam każdego budynku – jedna bisekcja dla wszystkich
+    pzam, sims = find_min_pmax_batch(
+        district.simulate,
+        n,
+        pmax_start_kW=pmax_start_kW,
+        pmax_max_kW=pmax_max_kW,
+        tol_kW=tol_kW,
+        allowed_violation_min=district.allowed,
+    )
+
+    # (2) Moc jednoczesna: wszystkie budynki naraz przy swoich Pzam
+    at_pzam = district.simulate(pzam)
+    sims += 1
+    sum_pzam = float(pzam.sum())
+    peak = float(at_pzam.P_total_kW.max()) if at_pzam.P_total_kW.size else 0.0
+
+    # (3) Minimalny wspólny limit węzła (proporcjonalne ograniczanie) – bisekcja po skalarze.
+    # Przy limicie równym mocy jednoczesnej ograniczenie nigdy nie działa, więc to górna granica.
+    lo, hi = 0.0, peak
+    while (hi - lo) > tol_kW:
+        mid = 0.5 * (lo + hi)
+        sims += 1
+        if district.all_ok(district.simulate(pzam, node_limit_kW=mid)):
+            hi = mid
+        else:
+            lo = mid
+    node_pzam = hi
+
+    at_limit: Optional[BatchRunResult] = None
+    if node_limit_kW is not None:
+        at_limit = district.simulate(pzam, node_limit_kW=node_limit_kW)
+        sims += 1
+
+    sizings = [
+        BuildingSizing(
+            name=district.names[i],
+            Pzam_kW=float(pzam[i]),
+            loss_kw=float(district.loss_kw[i]),
+            T_min_reached_C=float(at_pzam.T_min_reached_C[i]),
+            violation_minutes_at_node_limit=(
+                float(at_limit.violation_minutes[i]) if at_limit is not None else None
+            ),
+        )
+        for i in range(n)
+    ]
+
+    return DistrictResult(
+        model=model,
+        buildings=sizings,
+        sum_Pzam_kW=sum_pzam,
+        coincident_peak_kW=peak,
+        diversity_factor=(sum_pzam / peak) if peak > 0 else 1.0,
+        simultaneity_factor=(peak / sum_pzam) if sum_pzam > 0 else 1.0,
+        node_Pzam_kW=node_pzam,
+        node_limit_kW=node_limit_kW,
+        node_limit_ok=(district.all_ok(at_limit) if at_limit is not None else None),
+        P_node_kW=at_pzam.P_total_kW.tolist(),
+        vector_simulations=sims,
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    # Demo: 500 budynków, tydzień (dt=60 s), piki przesunięte losowo w czasie
+    rng = np.random.default_rng(0)
+    steps = 7 * 1440
+    buildings = []
+    for k in range(500):
+        demand = np.zeros(steps)
+        for day in range(7):
+            for start_h, minutes, lpm in ((7, 20, 60.0), (19, 20, 50.0)):
+                s = day * 1440 + start_h * 60 + int(rng.integers(-45, 46))
+                demand[s:s + minutes] = lpm * float(rng.uniform(0.5, 1.5))
+        buildings.append(DistrictBuilding(
+            name=f"B{k:03d}",
+            tank=TankParams(
+                volume_l=float(rng.choice([300, 500, 800, 1000])),
+                T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=60,
+            ),
+            demand_lpm=demand,
+            loss_input=LossInput(loss_kw=float(rng.uniform(0.5, 3.0))),
+            layered=LayeredParams(hot_fraction=float(rng.uniform(0.2, 0.4)), mixing_tau_s=3600.0),
+        ))
+
+    t0 = time.perf_counter()
+    res = size_district(buildings, node_limit_kW=None)
+    print(f"Budynki: {len(res.buildings)}, symulacje wektorowe: {res.vector_simulations}, "
+          f"czas: {time.perf_counter() - t0:.1f} s")
+    print(f"Suma Pzam: {res.sum_Pzam_kW:.1f} kW")
+    print(f"Moc jednoczesna: {res.coincident_peak_kW:.1f} kW")
+    print(f"Współczynnik różnorodności: {res.diversity_factor:.2f}")
+    print(f"Minimalny limit węzła: {res.node_Pzam_kW:.1f} kW")
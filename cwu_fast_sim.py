@@ -0,0 +1,306 @@
+"""Szybsze pętle symulacji pojedynczego zasobnika (backend "fast").
+
+Ta sama fizyka i ta sama kolejność działań zmiennoprzecinkowych co
+`simulate_mixed` / `simulate_layered_2zone`, ale bez wywołań funkcji
+pomocniczych w każdym kroku: stałe (m·cp, energia strat, moc w J/krok)
+liczone są raz przed pętlą. Wyniki są bit w bit takie same jak z pętli
+referencyjnych – pilnuje tego tryb cienia (`cwu_backends`).
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from cwu_backends import SimulationBackend, register_backend
+from cwu_time_simulation import (
+    RECORD_FULL,
+    DemandProfile,
+    LayeredParams,
+    ModelRunResult,
+    RecordingPolicy,
+    TankParams,
+    _RegenTracker,
+    _SeriesRecorder,
+)
+
+_CP = 4180.0  # J/(kg·K), rho = 1 kg/l
+
+
+def simulate_mixed_fast(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    pmax_kW: float,
+    loss_kw: float,
+    allowed_violation_min: float,
+    hysteresis_C: float = 0.0,
+    recording: Optional[RecordingPolicy] = None,
+) -> ModelRunResult:
+    if tank.volume_l <= 0:
+        raise ValueError("volume_l must be > 0")
+    if pmax_kW < 0:
+        raise ValueError("pmax_kW must be >= 0")
+    if loss_kw < 0:
+        raise ValueError("loss_kw must be >= 0")
+
+    dt = tank.dt_s
+    if dt <= 0:
+        raise ValueError("dt_s must be > 0")
+
+    T_cold = tank.T_cold_C
+    T_set = tank.T_set_C
+    T_min = tank.T_min_C
+    mcp = tank.volume_l * 1.0 * _CP
+    dT_draw = max(0.0, T_set - T_cold)
+    E_cap_J = mcp * dT_draw
+    E_J = mcp * max(0.0, tank.T_init_C - T_cold)
+
+    if T_set - T_cold <= 0:
+        raise ValueError("T_set_C musi być > T_cold_C")
+
+    step_min = dt / 60.0
+    E_loss_J = loss_kw * 1000.0 * dt
+    p_J = pmax_kW * 1000.0 * dt
+    T_on = T_set - hysteresis_C
+    hyst = hysteresis_C > 0
+
+    policy = recording or RECORD_FULL
+    rec = _SeriesRecorder(policy, two_zone=False) if policy.mode != "summary" else None
+    regen = _RegenTracker(T_min, T_set)
+
+    violation_s = 0
+    Tmin_reached = T_cold + E_J / mcp
+    t_min_temp_s = 0
+    heater_on = Tmin_reached < T_set
+    T_now = Tmin_reached
+
+    t_s = -dt
+    for i, lpm in enumerate(demand_lpm):
+        t_s += dt
+        T_now = T_cold + E_J / mcp
+        if regen.pending:
+            regen.observe(t_s, T_now)
+
+        lpm = float(lpm)
+        v_l = (lpm if lpm > 0.0 else 0.0) * step_min
+        E_J -= (v_l * _CP) * dT_draw
+        if E_J < 0.0:
+            E_J = 0.0
+        E_J -= E_loss_J
+        if E_J < 0.0:
+            E_J = 0.0
+
+        T_after = T_cold + E_J / mcp
+        if hyst:
+            if heater_on:
+                heater_on = T_after < T_set
+            else:
+                heater_on = T_after <= T_on
+        else:
+            heater_on = T_after < T_set
+
+        if heater_on:
+            E_J += p_J
+            if rec is not None:
+                rec.add(i, t_s, T_now, None, pmax_kW)
+        elif rec is not None:
+            rec.add(i, t_s, T_now, None, 0.0)
+        if E_J > E_cap_J:
+            E_J = E_cap_J
+
+        T_end = T_cold + E_J / mcp
+        if T_end < T_min:
+            violation_s += dt
+        if T_end < Tmin_reached:
+            Tmin_reached = T_end
+            t_min_temp_s = t_s + dt
+            regen.new_min(t_min_temp_s)
+
+    n = len(demand_lpm)
+    regen_to_Tmin_s, regen_to_Tset_s = regen.finish((n - 1) * dt if n else None, T_now)
+    time_s, temps_C, _, pin_series = rec.finish() if rec is not None else ([], [], None, [])
+
+    return ModelRunResult(
+        model="mixed",
+        Pzam_kW=pmax_kW,
+        loss_kw=loss_kw,
+        time_s=time_s,
+        T_primary_C=temps_C,
+        P_in_kW=pin_series,
+        violation_minutes=violation_s / 60.0,
+        regen_to_Tmin_s=regen_to_Tmin_s,
+        regen_to_Tset_s=regen_to_Tset_s,
+        t_min_temp_s=t_min_temp_s,
+        T_min_reached_C=Tmin_reached,
+        T_secondary_C=None,
+        T_end_primary_C=T_cold + E_J / mcp,
+        recording=policy.mode,
+    )
+
+
+def simulate_layered_2zone_fast(
+    tank: TankParams,
+    layered: LayeredParams,
+    demand_lpm: DemandProfile,
+    pmax_kW: float,
+    loss_kw: float,
+    allowed_violation_min: float,
+    hysteresis_C: float = 0.0,
+    T_init_cold_C: Optional[float] = None,
+    recording: Optional[RecordingPolicy] = None,
+) -> ModelRunResult:
+    if tank.volume_l <= 0:
+        raise ValueError("volume_l must be > 0")
+    if pmax_kW < 0:
+        raise ValueError("pmax_kW must be >= 0")
+    if loss_kw < 0:
+        raise ValueError("loss_kw must be >= 0")
+
+    dt = tank.dt_s
+    if dt <= 0:
+        raise ValueError("dt_s must be > 0")
+
+    hot_fraction = float(layered.hot_fraction)
+    if not (0.05 <= hot_fraction <= 0.95):
+        raise ValueError("hot_fraction powinno być w rozsądnym zakresie (np. 0.05..0.95)")
+
+    T_cold = tank.T_cold_C
+    T_set = tank.T_set_C
+    T_min = tank.T_min_C
+
+    V_total = tank.volume_l
+    V_hot = V_total * hot_fraction
+    V_cold = V_total - V_hot
+    mcp_hot = V_hot * 1.0 * _CP
+    mcp_cold = V_cold * 1.0 * _CP
+
+    dT_draw = max(0.0, T_set - T_cold)
+    E_hot_cap_J = mcp_hot * dT_draw
+    E_hot_J = mcp_hot * max(0.0, tank.T_init_C - T_cold)
+    T_init_cold = tank.T_init_C if T_init_cold_C is None else T_init_cold_C
+    E_cold_J = mcp_cold * max(0.0, T_init_cold - T_cold)
+
+    E_loss_total_J = loss_kw * 1000.0 * dt
+    if layered.losses_split == "all_hot":
+        E_loss_hot = E_loss_total_J
+        E_loss_cold = 0.0
+    else:
+        E_loss_hot = E_loss_total_J * (V_hot / V_total)
+        E_loss_cold = E_loss_total_J * (V_cold / V_total)
+
+    tau = float(layered.mixing_tau_s)
+    mixing = tau > 0
+    alpha = max(0.0, min(1.0, dt / tau)) if mixing else 0.0
+
+    step_min = dt / 60.0
+    p_J = pmax_kW * 1000.0 * dt
+    T_on = T_set - hysteresis_C
+    hyst = hysteresis_C > 0
+
+    policy = recording or RECORD_FULL
+    rec = _SeriesRecorder(policy, two_zone=True) if policy.mode != "summary" else None
+    regen = _RegenTracker(T_min, T_set)
+
+    violation_s = 0
+    Tmin_reached = T_cold + E_hot_J / mcp_hot
+    t_min_temp_s = 0
+    heater_on = Tmin_reached < T_set
+    T_hot = Tmin_reached
+
+    t_s = -dt
+    for i, lpm in enumerate(demand_lpm):
+        t_s += dt
+        T_hot = T_cold + E_hot_J / mcp_hot
+        E_cold_start = E_cold_J
+        if regen.pending:
+            regen.observe(t_s, T_hot)
+
+        # (1) pobór z górnej strefy, (1b) dopływ z dolnej (plug-flow)
+        lpm = float(lpm)
+        v_l = (lpm if lpm > 0.0 else 0.0) * step_min
+        E_hot_J -= (v_l * _CP) * dT_draw
+        if E_hot_J < 0.0:
+            E_hot_J = 0.0
+        if v_l > 0:
+            E_tr = E_cold_J * (v_l / V_cold if v_l < V_cold else 1.0)
+            E_cold_J -= E_tr
+            if E_cold_J < 0.0:
+                E_cold_J = 0.0
+            E_hot_J += E_tr
+            if E_hot_J > E_hot_cap_J:
+                E_hot_J = E_hot_cap_J
+
+        # (2) straty
+        E_hot_J -= E_loss_hot
+        if E_hot_J < 0.0:
+            E_hot_J = 0.0
+        E_cold_J -= E_loss_cold
+        if E_cold_J < 0.0:
+            E_cold_J = 0.0
+
+        # (3) mieszanie
+        if mixing:
+            Th = T_cold + E_hot_J / mcp_hot
+            Tc = T_cold + E_cold_J / mcp_cold
+            Teq = (Th * V_hot + Tc * V_cold) / V_total
+            dTh = Th + alpha * (Teq - Th) - T_cold
+            dTc = Tc + alpha * (Teq - Tc) - T_cold
+            E_hot_J = mcp_hot * (dTh if dTh > 0.0 else 0.0)
+            if E_hot_J > E_hot_cap_J:
+                E_hot_J = E_hot_cap_J
+            E_cold_J = mcp_cold * (dTc if dTc > 0.0 else 0.0)
+
+        # (4) sterowanie i dogrzewanie
+        T_hot_after = T_cold + E_hot_J / mcp_hot
+        if hyst:
+            if heater_on:
+                heater_on = T_hot_after < T_set
+            else:
+                heater_on = T_hot_after <= T_on
+        else:
+            heater_on = T_hot_after < T_set
+
+        if rec is not None:
+            rec.add(i, t_s, T_hot, T_cold + E_cold_start / mcp_cold, pmax_kW if heater_on else 0.0)
+        if heater_on:
+            E_hot_J += p_J
+        if E_hot_J > E_hot_cap_J:
+            E_hot_J = E_hot_cap_J
+
+        # (5) komfort strefy górnej
+        T_hot_end = T_cold + E_hot_J / mcp_hot
+        if T_hot_end < T_min:
+            violation_s += dt
+        if T_hot_end < Tmin_reached:
+            Tmin_reached = T_hot_end
+            t_min_temp_s = t_s + dt
+            regen.new_min(t_min_temp_s)
+
+    n = len(demand_lpm)
+    regen_to_Tmin_s, regen_to_Tset_s = regen.finish((n - 1) * dt if n else None, T_hot)
+    time_s, Th_series, Tc_series, pin_series = rec.finish() if rec is not None else ([], [], [], [])
+
+    return ModelRunResult(
+        model="layered_2zone",
+        Pzam_kW=pmax_kW,
+        loss_kw=loss_kw,
+        time_s=time_s,
+        T_primary_C=Th_series,
+        P_in_kW=pin_series,
+        violation_minutes=violation_s / 60.0,
+        regen_to_Tmin_s=regen_to_Tmin_s,
+        regen_to_Tset_s=regen_to_Tset_s,
+        t_min_temp_s=t_min_temp_s,
+        T_min_reached_C=Tmin_reached,
+        T_secondary_C=Tc_series,
+        T_end_primary_C=T_cold + E_hot_J / mcp_hot,
+        T_end_secondary_C=T_cold + E_cold_J / mcp_cold,
+        recording=policy.mode,
+    )
+
+
+register_backend(SimulationBackend(
+    name="fast",
+    simulate_mixed=simulate_mixed_fast,
+    simulate_layered_2zone=simulate_layered_2zone_fast,
+    description="Pętle ze stałymi liczonymi raz przed pętlą (wyniki jak referencyjne)",
+))
@@ -0,0 +1,551 @@
+"""Trwała kolejka zadań dla długich obliczeń (audyty roczne, przeglądy parametrów, Monte Carlo).
+
+Zadanie: zgłoś → dostajesz id → odpytujesz status/postęp → pobierasz wynik.
+
+- stan zadań trzymany jest w lokalnym pliku SQLite (jak baza Prisma w projekcie),
+- zadania liczy lokalna pula procesów; proces roboczy sam zapisuje postęp i wynik,
+- zadanie ma właściciela (host:pid:token pracującego `JobRunner`), który co
+  HEARTBEAT_S odnawia znacznik życia swoich zadań; tylko on może je uruchomić,
+- zadania "queued"/"running" martwego właściciela (nieaktualny znacznik albo proces
+  na tym hoście już nie istnieje) przejmuje inny runner – przy starcie i okresowo;
+  zadania żywych runnerów (np. innych workerów API) nie są ruszane, więc nic nie
+  liczy się dwa razy. Przeglądy i Monte Carlo wznawiają się od ostatniego punktu
+  kontrolnego (checkpoint), a nie od zera.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cwu_time_simulation import (
+    DEFAULT_AUDIT_PEAKS,
+    RECORD_SUMMARY,
+    ComparisonResult,
+    CostParams,
+    LayeredParams,
+    LossInput,
+    SolverProgress,
+    TankParams,
+    build_profile_24h,
+    compare_models,
+)
+from cwu_comfort_curve import DEFAULT_TOLERANCES_MIN, comfort_power_curve, comfort_table
+from cwu_records import result_summary
+from cwu_sizing_curve import curve_table, sizing_curve
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.environ.get("CWU_JOBS_DB", "cwu_jobs.sqlite3")
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Ile razy zadanie może zostać wznowione po awarii procesu roboczego
+MAX_ATTEMPTS = 3
+
+# Minimalny odstęp zapisów postępu do bazy [s]
+PROGRESS_MIN_INTERVAL_S = 0.5
+
+# Co ile runner odnawia znacznik życia swoich zadań i szuka osieroconych [s];
+# zadanie bez odnowienia przez OWNER_STALE_S uznawane jest za porzucone
+HEARTBEAT_S = 5.0
+OWNER_STALE_S = 30.0
+
+_HOST = socket.gethostname()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    progress    TEXT,
+    checkpoint  TEXT,
+    result      TEXT,
+    error       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    owner       TEXT,
+    heartbeat   REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs(status, created_at);
+"""
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Kolumny właściciela w bazach sprzed ich wprowadzenia."""
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+    for name, decl in (("owner", "TEXT"), ("heartbeat", "REAL")):
+        if name not in cols:
+            try:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+            except sqlite3.OperationalError as exc:  # inny worker dodał ją równolegle
+                if "duplicate column" not in str(exc):
+                    raise
+
+
+def _owner_alive(owner: Optional[str], heartbeat: Optional[float], now: float, stale_after_s: float) -> bool:
+    """Czy właściciel zadania żyje: świeży znacznik, a na tym hoście także istniejący proces."""
+    if owner is None or heartbeat is None or now - heartbeat > stale_after_s:
+        return False
+    host, pid, _token = owner.rsplit(":", 2)
+    if host == _HOST:
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def new_owner_id() -> str:
+    return f"{_HOST}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _connect(db_path: str, shared: bool = False) -> sqlite3.Connection:
+    # shared=True: połączenie używane z wielu wątków (serializowane blokadą właściciela)
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None, check_same_thread=not shared)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class JobStore:
+    """Dostęp do tabeli zadań (jedno połączenie na proces/wątek właściciela)."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH) -> None:
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = _connect(db_path, shared=True)
+        self._conn.executescript(_SCHEMA)
+        _migrate(self._conn)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _exec(self, sql: str, args: Tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, args)
+
+    def create(self, kind: str, params: dict, owner: Optional[str] = None) -> str:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Nieznany rodzaj zadania: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._exec(
+            "INSERT INTO jobs (id, kind, status, params, created_at, updated_at, owner, heartbeat) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, STATUS_QUEUED, json.dumps(params), now, now, owner, now),
+        )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._exec("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def heartbeat(self, owner: str) -> None:
+        """Odnawia znacznik życia zadań właściciela ("queued" i "running")."""
+        self._exec(
+            "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN (?, ?)",
+            (time.time(), owner, STATUS_QUEUED, STATUS_RUNNING),
+        )
+
+    def requeue_interrupted(self, owner: str, stale_after_s: float = OWNER_STALE_S) -> List[str]:
+        """Przejmuje zadania martwych właścicieli; zwraca id do uruchomienia przez `owner`.
+
+        Przerwane w trakcie ("running") wracają do kolejki (albo "failed" po MAX_ATTEMPTS).
+        Zadania żywych właścicieli zostają u nich.
+        """
+        now = time.time()
+        rows = self._exec(
+            "SELECT id, status, owner, heartbeat, attempts FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (STATUS_QUEUED, STATUS_RUNNING),
+        ).fetchall()
+        taken: List[str] = []
+        for r in rows:
+            if r["owner"] == owner or _owner_alive(r["owner"], r["heartbeat"], now, stale_after_s):
+                continue
+            if r["status"] == STATUS_RUNNING and r["attempts"] >= MAX_ATTEMPTS:
+                self._exec(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ? AND owner IS ?",
+                    (STATUS_FAILED, "Przekroczono limit wznowień zadania.", now, r["id"], STATUS_RUNNING, r["owner"]),
+                )
+                continue
+            # Warunek na dotychczasowego właściciela: dwa runnery nie przejmą tego samego zadania
+            cur = self._exec(
+                "UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND owner IS ?",
+                (STATUS_QUEUED, owner, now, now, r["id"], r["status"], r["owner"]),
+            )
+            if cur.rowcount:
+                taken.append(r["id"])
+        return taken
+
+    def requeue(self, job_id: str) -> bool:
+        """Po awarii procesu roboczego: z powrotem do kolejki (albo "failed" po MAX_ATTEMPTS)."""
+        now = time.time()
+        cur = self._exec(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?) AND attempts < ?",
+            (STATUS_QUEUED, now, job_id, STATUS_QUEUED, STATUS_RUNNING, MAX_ATTEMPTS),
+        )
+        if cur.rowcount:
+            return True
+        self.mark_failed(job_id, "Przekroczono limit wznowień zadania.")
+        return False
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        self._exec(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status != ?",
+            (STATUS_FAILED, error, time.time(), job_id, STATUS_DONE),
+        )
+
+
+# --- Wykonanie zadania (w procesie roboczym) ---
+
+class JobContext:
+    """Przekazywany do funkcji zadania: postęp i punkty kontrolne."""
+
+    def __init__(self, conn: sqlite3.Connection, job_id: str, checkpoint: Any) -> None:
+        self._conn = conn
+        self._job_id = job_id
+        self._last_write = 0.0
+        self.checkpoint = checkpoint
+
+    def progress(self, fraction: float, force: bool = False, **info: Any) -> None:
+        now = time.monotonic()
+        if not force and (now - self._last_write) < PROGRESS_MIN_INTERVAL_S:
+            return
+        self._last_write = now
+        payload = {"fraction": max(0.0, min(1.0, float(fraction))), **info}
+        self._conn.execute(
+            "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(payload), time.time(), self._job_id),
+        )
+
+    def save_checkpoint(self, state: Any) -> None:
+        self.checkpoint = state
+        self._conn.execute(
+            "UPDATE jobs SET checkpoint = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(state), time.time(), self._job_id),
+        )
+
+
+def _execute_job(db_path: str, job_id: str, owner: Optional[str] = None) -> str:
+    """Punkt wejścia procesu roboczego: pobiera zadanie, liczy, zapisuje wynik.
+
+    Zadanie uruchamia tylko jego właściciel – po przejęciu przez inny runner wpis
+    czekający jeszcze w puli poprzedniego właściciela nic nie robi.
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] != STATUS_QUEUED or row["owner"] != owner:
+            conn.execute("COMMIT")
+            return row["status"] if row is not None else "missing"
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, heartbeat = ?, updated_at = ? WHERE id = ?",
+            (STATUS_RUNNING, now, now, job_id),
+        )
+        conn.execute("COMMIT")
+
+        ctx = JobContext(conn, job_id, json.loads(row["checkpoint"]) if row["checkpoint"] else None)
+        try:
+            result = JOB_KINDS[row["kind"]](json.loads(row["params"]), ctx)
+        except Exception as exc:
+            logger.exception("Zadanie %s (%s) zakończone błędem", job_id, row["kind"])
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (STATUS_FAILED, f"{type(exc).__name__}: {exc}", time.time(), job_id),
+            )
+            return STATUS_FAILED
+
+        ctx.progress(1.0, force=True)
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, checkpoint = NULL, updated_at = ? WHERE id = ?",
+            (STATUS_DONE, json.dumps(result), time.time(), job_id),
+        )
+        return STATUS_DONE
+    finally:
+        conn.close()
+
+
+class JobRunner:
+    """Lokalna pula procesów wykonująca zadania z `JobStore`.
+
+    Kilka runnerów (np. po jednym na worker API) może dzielić bazę: każdy liczy
+    własne zadania i przejmuje tylko porzucone. Procesy puli startują dopiero przy
+    pierwszym zadaniu; przy `-w N` workerach ustaw CWU_JOB_WORKERS tak, żeby
+    N × CWU_JOB_WORKERS nie przekraczało liczby rdzeni.
+    """
+
+    def __init__(self, store: JobStore, workers: Optional[int] = None) -> None:
+        self.store = store
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.owner = new_owner_id()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def start(self) -> List[str]:
+        """Uruchamia pulę i znacznik życia; przejmuje zadania porzucone przez martwe runnery."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            if self._heartbeat is None:
+                self._stop.clear()
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="cwu-jobs-heartbeat", daemon=True)
+                self._heartbeat.start()
+        return self._resume_orphaned()
+
+    def _resume_orphaned(self) -> List[str]:
+        resumed = self.store.requeue_interrupted(self.owner)
+        for job_id in resumed:
+            self._dispatch(job_id)
+        if resumed:
+            logger.info("Przejęto %d porzuconych zadań z kolejki", len(resumed))
+        return resumed
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(HEARTBEAT_S):
+            try:
+                self.store.heartbeat(self.owner)
+                self._resume_orphaned()
+            except Exception:
+                logger.exception("Znacznik życia zadań: błąd")
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._stop.set()
+        with self._lock:
+            ex, self._executor = self._executor, None
+            self._heartbeat = None
+        if ex is not None:
+            ex.shutdown(wait=wait, cancel_futures=True)
+
+    def submit(self, kind: str, params: dict) -> str:
+        job_id = self.store.create(kind, params, owner=self.owner)
+        self._dispatch(job_id)
+        return job_id
+
+    def _dispatch(self, job_id: str) -> None:
+        with self._lock:
+            ex = self._executor
+            if ex is None:
+                raise RuntimeError("JobRunner nie został uruchomiony (wywołaj start()).")
+            fut = ex.submit(_execute_job, self.store.db_path, job_id, self.owner)
+        fut.add_done_callback(lambda f, jid=job_id, e=ex: self._on_done(jid, e, f))
+
+    def _on_done(self, job_id: str, ex: ProcessPoolExecutor, fut: Future) -> None:
+        if fut.cancelled():
+            return  # zamknięcie puli – zadanie zostaje w bazie i wróci po restarcie
+        exc = fut.exception()
+        if exc is None:
+            return
+        if isinstance(exc, BrokenProcessPool):
+            # Proces roboczy padł (np. OOM) – nowa pula, zadanie wraca do kolejki
+            with self._lock:
+                if self._executor is ex:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                running = self._executor is not None
+            logger.error("Proces roboczy zadania %s przerwany: %r", job_id, exc)
+            if running and self.store.requeue(job_id):
+                self._dispatch(job_id)
+            return
+        logger.error("Zadanie %s: nieoczekiwany błąd puli: %r", job_id, exc)
+        self.store.mark_failed(job_id, f"{type(exc).__name__}: {exc}")
+
+
+# --- Rodzaje zadań ---
+
+def _scenario_from_params(params: dict) -> Tuple[TankParams, List[float], LossInput, LayeredParams, CostParams]:
+    """Parametry w konwencji API (`CWUInput`) + opcjonalny profil i parametry warstw."""
+    dt_s = int(params.get("dt_s", 60))
+    tank = TankParams(
+        volume_l=float(params["V_tank_l"]),
+        T_init_C=float(params["T_set_C"]),
+        T_set_C=float(params["T_set_C"]),
+        T_cold_C=float(params.get("T_cold_C", 10.0)),
+        T_min_C=float(params["T_min_C"]),
+        dt_s=dt_s,
+    )
+    demand = params.get("demand_lpm")
+    demand_lpm = [float(x) for x in demand] if demand is not None else build_profile_24h(dt_s, DEFAULT_AUDIT_PEAKS)
+    layered = LayeredParams(
+        hot_fraction=float(params.get("hot_fraction", 0.3)),
+        mixing_tau_s=float(params.get("mixing_tau_s", 3600.0)),
+    )
+    cost = CostParams(
+        cost_per_kw_month_zl=params.get("cost_kw_month"),
+        analysis_horizon_years=int(params.get("horizon_years", 10)),
+    )
+    return tank, demand_lpm, LossInput(loss_kw=float(params["loss_kw"])), layered, cost
+
+
+def _run_compare(params: dict, on_progress: Optional[Callable[[SolverProgress], None]] = None) -> ComparisonResult:
+    tank, demand_lpm, loss_input, layered, cost = _scenario_from_params(params)
+    return compare_models(
+        tank=tank,
+        demand_lpm=demand_lpm,
+        loss_input=loss_input,
+        allowed_violation_min=float(params.get("allowed_violation_min", 0.0)),
+        layered=layered,
+        cost_params=cost,
+        tol_kW=float(params.get("tol_kW", 0.1)),
+        on_progress=on_progress,
+        recording=RECORD_SUMMARY,  # wynik zadania to tylko wartości skalarne (result_summary)
+    )
+
+
+def job_audit(params: dict, ctx: JobContext) -> dict:
+    """Pojedynczy audyt (np. profil roczny); postęp z kolejnych kroków bisekcji."""
+
+    def on_progress(ev: SolverProgress) -> None:
+        # mix ~ pierwsza połowa pracy, warstwowy ~ druga (po liczbie symulacji w typowym przebiegu)
+        base = 0.0 if ev.model == "mixed" else 0.5
+        ctx.progress(
+            base + 0.5 * min(1.0, ev.simulations / 20.0),
+            model=ev.model,
+            phase=ev.phase,
+            p_lo_kW=ev.p_lo_kW,
+            p_hi_kW=ev.p_hi_kW,
+            simulations=ev.simulations,
+        )
+
+    return result_summary(_run_compare(params, on_progress=on_progress))
+
+
+def _run_items(items: List[dict], ctx: JobContext, label: str) -> List[dict]:
+    """Liczy listę scenariuszy z punktem kontrolnym po każdym (wznawianie po restarcie)."""
+    done: List[dict] = list(ctx.checkpoint or [])
+    total = len(items)
+    for i in range(len(done), total):
+        done.append(result_summary(_run_compare(items[i])))
+        ctx.save_checkpoint(done)
+        ctx.progress((i + 1) / total, force=True, done=i + 1, total=total, kind=label)
+    return done
+
+
+def job_sweep(params: dict, ctx: JobContext) -> dict:
+    """Przegląd siatki parametrów: params = {"base": {...}, "grid": {"V_tank_l": [...], ...}}."""
+    base = dict(params["base"])
+    grid: Dict[str, list] = params["grid"]
+    keys = sorted(grid)
+    points = [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+    results = _run_items([{**base, **p} for p in points], ctx, "sweep")
+    return {"points": [{"params": p, "result": r} for p, r in zip(points, results)]}
+
+
+def job_monte_carlo(params: dict, ctx: JobContext) -> dict:
+    """Monte Carlo niepewności profilu: każdy pik skalowany losowo (rozkład log-normalny).
+
+    params = {"base": {...}, "samples": N, "seed": S, "sigma": 0.2}
+    Próbki są deterministyczne (seed), więc wznowienie daje identyczne wyniki.
+    """
+    base = dict(params["base"])
+    n = int(params.get("samples", 100))
+    sigma = float(params.get("sigma", 0.2))
+    rng = random.Random(int(params.get("seed", 0)))
+    _, demand_lpm, _, _, _ = _scenario_from_params(base)
+
+    items = []
+    for _ in range(n):
+        scale = rng.lognormvariate(0.0, sigma)
+        items.append({**base, "demand_lpm": [x * scale for x in demand_lpm]})
+
+    results = _run_items(items, ctx, "monte_carlo")
+    pzam = sorted(r["Pzam_final"] for r in results)
+
+    def pct(q: float) -> float:
+        return pzam[min(len(pzam) - 1, int(q * (len(pzam) - 1) + 0.5))]
+
+    return {
+        "samples": n,
+        "Pzam_final_mean": sum(pzam) / len(pzam),
+        "Pzam_final_p50": pct(0.5),
+        "Pzam_final_p90": pct(0.9),
+        "Pzam_final_p95": pct(0.95),
+        "Pzam_final_max": pzam[-1],
+        "levels": {lvl: sum(1 for r in results if r["level"] == lvl) for lvl in ("A", "B", "C")},
+    }
+
+
+def job_sizing_curve(params: dict, ctx: JobContext) -> dict:
+    """Krzywa Pzam(V): params = {"base": {...}, "volumes_l": [...]} (jedna symulacja wektorowa)."""
+    base = dict(params["base"])
+    tank, demand_lpm, loss_input, layered, _ = _scenario_from_params(base)
+    curve = sizing_curve(
+        tank,
+        demand_lpm,
+        loss_input,
+        volumes_l=[float(v) for v in params["volumes_l"]],
+        allowed_violation_min=float(base.get("allowed_violation_min", 0.0)),
+        layered=layered,
+        tol_kW=float(base.get("tol_kW", 0.1)),
+        workers=1,  # zadanie i tak liczy się w procesie roboczym puli
+    )
+    ctx.progress(1.0, force=True, simulations=curve.simulations)
+    return {"method": curve.method, "simulations": curve.simulations, "points": curve_table(curve)}
+
+
+def job_comfort_curve(params: dict, ctx: JobContext) -> dict:
+    """Krzywa komfort–moc: params = {"base": {...}, "allowed_violation_min": [...]}."""
+    base = dict(params["base"])
+    tank, demand_lpm, loss_input, layered, _ = _scenario_from_params(base)
+    curve = comfort_power_curve(
+        tank,
+        demand_lpm,
+        loss_input,
+        allowed_violation_min=[float(a) for a in params.get("allowed_violation_min", DEFAULT_TOLERANCES_MIN)],
+        layered=layered,
+        tol_kW=float(base.get("tol_kW", 0.1)),
+    )
+    ctx.progress(1.0, force=True, simulations=curve.vector_simulations)
+    return {"vector_simulations": curve.vector_simulations, "points": comfort_table(curve)}
+
+
+JOB_KINDS: Dict[str, Callable[[dict, JobContext], dict]] = {
+    "audit": job_audit,
+    "sweep": job_sweep,
+    "monte_carlo": job_monte_carlo,
+    "sizing_curve": job_sizing_curve,
+    "comfort_curve": job_comfort_curve,
+}
@@ -0,0 +1,319 @@
+"""Budżety pamięci silnika dla długich horyzontów (kontrola regresji).
+
+    python cwu_memory_budget.py [--horyzonty doba,miesiac,rok] [--backend fast] [--budzety budzety.json]
+
+Kontenery z workerami dobierane są wg pamięci, a szczyt pamięci `compare_models`
+rośnie z długością profilu (serie wyników budowane w `simulate_*`). Skrypt mierzy
+dla profili 1-dniowego, 30-dniowego i rocznego (dt = 60 s):
+
+- simulate_mixed / simulate_layered_2zone z pełnym zapisem serii,
+- compare_models z pełnym zapisem (GUI/raport) i RECORD_SUMMARY (API, batch),
+- handler API `/api/cwu/moc-zamowiona` (tylko doba – API liczy zawsze profil dobowy;
+  cache wyników wyłączony, żeby mierzyć obliczenie, a nie odczyt).
+
+Każdy przypadek liczony jest w świeżym procesie (spawn), po rozgrzaniu na profilu
+dobowym. Szczyt:
+- doba: tracemalloc (szczyt alokacji od startu pomiaru) – RSS nie nadaje się, bo
+  rozgrzanie tym samym obciążeniem ustawia już maksimum RSS procesu, a spowolnienie
+  pętli (ok. 7×) przy krótkim profilu nie ma znaczenia,
+- miesiąc, rok: maksymalne RSS (VmHWM) minus RSS przed wywołaniem – liczba, która
+  decyduje o OOM w kontenerze; maksimum zerowane przed wywołaniem przez
+  /proc/self/clear_refs (tracemalloc wydłużałby rok do kilkunastu minut).
+Zerowy szczyt oznacza błędny pomiar i też jest przekroczeniem. Zatrzymane = rozmiar
+obiektu wyniku (z listami serii), liczony przez obejście grafu obiektów.
+
+Budżet przypadku jest liniowy: stała + bajty na krok profilu, osobno dla szczytu i
+zatrzymanego wyniku, więc ta sama tabela obowiązuje dla każdego horyzontu.
+Nadpisanie z pliku JSON: {"compare_models": {"peak_bytes_per_step": 300}, ...}.
+Kod wyjścia 1, gdy którykolwiek pomiar przekracza budżet.
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, List, Optional
+
+HORIZONS_DAYS: Dict[str, int] = {"doba": 1, "miesiac": 30, "rok": 365}
+
+DT_S = 60
+STEPS_PER_DAY = 86400 // DT_S
+
+# Przypadek "api" tylko dla doby (patrz opis modułu)
+CASES = ("simulate_mixed", "simulate_layered_2zone", "compare_models", "compare_models_summary", "api")
+_API_HORIZONS = ("doba",)
+
+_MB = 1024.0 * 1024.0
+
+# Horyzonty (w dniach) mierzone przez tracemalloc zamiast RSS
+TRACEMALLOC_MAX_DAYS = 1
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Budżet [MB] = *_fixed_mb + *_bytes_per_step · liczba kroków / 2^20."""
+
+    peak_fixed_mb: float
+    peak_bytes_per_step: float
+    retained_fixed_mb: float
+    retained_bytes_per_step: float
+
+    def peak_mb(self, steps: int) -> float:
+        return self.peak_fixed_mb + self.peak_bytes_per_step * steps / _MB
+
+    def retained_mb(self, steps: int) -> float:
+        return self.retained_fixed_mb + self.retained_bytes_per_step * steps / _MB
+
+
+# Zmierzone (backendy reference i fast, profil roczny) z zapasem 30–50%; pełne serie to 3–4 listy na model.
+# Stałe części to tylko narzut niezależny od długości profilu (dziesiątki kB): doba mierzona jest
+# tracemalloc (bez szumu RSS), więc budżet dobowy wynosi ok. 1,5–2× pomiaru i wykrywa regresje.
+DEFAULT_BUDGETS: Dict[str, Budget] = {
+    "simulate_mixed": Budget(peak_fixed_mb=0.02, peak_bytes_per_step=160.0, retained_fixed_mb=0.02, retained_bytes_per_step=115.0),
+    "simulate_layered_2zone": Budget(peak_fixed_mb=0.02, peak_bytes_per_step=200.0, retained_fixed_mb=0.02, retained_bytes_per_step=150.0),
+    "compare_models": Budget(peak_fixed_mb=0.05, peak_bytes_per_step=360.0, retained_fixed_mb=0.05, retained_bytes_per_step=265.0),
+    "compare_models_summary": Budget(peak_fixed_mb=0.03, peak_bytes_per_step=60.0, retained_fixed_mb=0.02, retained_bytes_per_step=0.0),
+    "api": Budget(peak_fixed_mb=0.15, peak_bytes_per_step=0.0, retained_fixed_mb=0.005, retained_bytes_per_step=0.0),
+}
+
+
+@dataclass(frozen=True)
+class Measurement:
+    case: str
+    horizon: str
+    steps: int
+    peak_mb: float
+    retained_mb: float
+    elapsed_s: float
+    peak_budget_mb: float
+    retained_budget_mb: float
+    method: str = "rss"
+
+    @property
+    def valid(self) -> bool:
+        """Zerowy szczyt: metoda pomiaru nic nie zobaczyła (np. maksimum RSS niezerowane)."""
+        return self.peak_mb > 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.valid and self.peak_mb <= self.peak_budget_mb and self.retained_mb <= self.retained_budget_mb
+
+
+# --- Pomiar (w procesie potomnym) ---
+
+def _rss_bytes() -> int:
+    """Bieżące RSS procesu (Linux: /proc; gdzie indziej – szczytowe, jako górne oszacowanie)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return _max_rss_bytes()
+
+
+def _max_rss_bytes() -> int:
+    """Maksymalne RSS od ostatniego zerowania (VmHWM); poza Linuksem – od startu procesu."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    ru = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(ru) if sys.platform == "darwin" else int(ru) * 1024
+
+
+def _reset_max_rss() -> bool:
+    """Zeruje maksimum RSS procesu (Linux: /proc/self/clear_refs, wartość 5)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _deep_size(obj: Any) -> int:
+    """Rozmiar obiektu razem z obiektami osiągalnymi z niego (bez typów i modułów)."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type) or type(o).__name__ in ("module", "function", "builtin_function_or_method"):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return total
+
+
+def _case_call(case: str, days: int, backend: Optional[str]):
+    """Funkcja bez argumentów licząca przypadek dla profilu `days`-dniowego."""
+    from cwu_backends import get_backend
+    from cwu_time_simulation import (
+        DEFAULT_AUDIT_PEAKS,
+        RECORD_SUMMARY,
+        LayeredParams,
+        LossInput,
+        TankParams,
+        build_profile_24h,
+        compare_models,
+    )
+
+    if case == "api":
+        import asyncio
+
+        import api
+
+        payload = api.CWUInput(V_tank_l=500, T_set_C=55.0, T_min_C=45.0, loss_kw=1.0, cost_kw_month=50.0, horizon_years=10)
+        return lambda: asyncio.run(api.cwu_moc_zamowiona(payload))
+
+    tank = TankParams(volume_l=500.0, T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=DT_S)
+    demand = build_profile_24h(dt_s=DT_S, peaks=DEFAULT_AUDIT_PEAKS) * days
+    sim = get_backend(backend)
+    if case == "simulate_mixed":
+        return lambda: sim.simulate_mixed(tank=tank, demand_lpm=demand, pmax_kW=150.0, loss_kw=1.0, allowed_violation_min=0.0)
+    if case == "simulate_layered_2zone":
+        return lambda: sim.simulate_layered_2zone(
+            tank=tank, layered=LayeredParams(), demand_lpm=demand, pmax_kW=150.0, loss_kw=1.0, allowed_violation_min=0.0
+        )
+    recording = RECORD_SUMMARY if case == "compare_models_summary" else None
+    return lambda: compare_models(
+        tank=tank,
+        demand_lpm=demand,
+        loss_input=LossInput(loss_kw=1.0),
+        allowed_violation_min=0.0,
+        recording=recording,
+        backend=backend,
+    )
+
+
+def _measure_in_child(case: str, days: int, backend: Optional[str]) -> Dict[str, float]:
+    if case == "api":
+        os.environ["CWU_CACHE_DB"] = ""  # bez cache wyników
+
+    # Rozgrzanie: importy ładowane leniwie i bufory jednorazowe nie wchodzą do pomiaru
+    _case_call(case, 1, backend)()
+    call = _case_call(case, days, backend)
+    gc.collect()
+
+    if days <= TRACEMALLOC_MAX_DAYS:
+        import tracemalloc
+
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        result = call()
+        elapsed = time.perf_counter() - t0
+        peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        method = "tracemalloc"
+    else:
+        # Bez zerowania maksimum RSS pochodziłoby z rozgrzania (szczyt 0 – wykryje to `valid`)
+        _reset_max_rss()
+        rss0 = _rss_bytes()
+        t0 = time.perf_counter()
+        result = call()
+        elapsed = time.perf_counter() - t0
+        peak = max(0, _max_rss_bytes() - rss0)
+        method = "rss"
+    return {"peak_mb": peak / _MB, "retained_mb": _deep_size(result) / _MB, "elapsed_s": elapsed, "method": method}
+
+
+def measure(case: str, horizon: str, budget: Budget, backend: Optional[str] = None) -> Measurement:
+    """Jeden pomiar w świeżym procesie (maksymalne RSS nie maleje, więc proces na przypadek)."""
+    days = HORIZONS_DAYS[horizon]
+    steps = days * STEPS_PER_DAY
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+        raw = ex.submit(_measure_in_child, case, days, backend).result()
+    return Measurement(
+        case=case,
+        horizon=horizon,
+        steps=steps,
+        peak_budget_mb=budget.peak_mb(steps),
+        retained_budget_mb=budget.retained_mb(steps),
+        **raw,
+    )
+
+
+def load_budgets(path: Optional[str]) -> Dict[str, Budget]:
+    """Budżety domyślne nadpisane (pole po polu) wartościami z pliku JSON."""
+    budgets = dict(DEFAULT_BUDGETS)
+    if path is None:
+        return budgets
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    for case, fields in overrides.items():
+        if case not in budgets:
+            raise ValueError(f"Nieznany przypadek w pliku budżetów: {case!r} (dostępne: {', '.join(CASES)})")
+        budgets[case] = replace(budgets[case], **{k: float(v) for k, v in fields.items()})
+    return budgets
+
+
+def run_suite(
+    horizons: List[str],
+    cases: List[str],
+    budgets: Dict[str, Budget],
+    backend: Optional[str] = None,
+) -> List[Measurement]:
+    out: List[Measurement] = []
+    for horizon in horizons:
+        for case in cases:
+            if case == "api" and horizon not in _API_HORIZONS:
+                continue
+            m = measure(case, horizon, budgets[case], backend)
+            status = "OK " if m.ok else ("PRZEKROCZONY" if m.valid else "BŁĘDNY POMIAR")
+            print(
+                f"{status} {m.case:24s} {m.horizon:8s} "
+                f"szczyt {m.peak_mb:8.2f} / {m.peak_budget_mb:8.2f} MB ({m.method})  "
+                f"wynik {m.retained_mb:8.2f} / {m.retained_budget_mb:8.2f} MB  ({m.elapsed_s:.1f} s)",
+                flush=True,
+            )
+            out.append(m)
+    return out
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Kontrola budżetów pamięci silnika CWU (doba, miesiąc, rok).")
+    parser.add_argument("--horyzonty", default=",".join(HORIZONS_DAYS), help="Lista horyzontów: doba,miesiac,rok")
+    parser.add_argument("--przypadki", default=",".join(CASES), help="Lista przypadków (domyślnie wszystkie)")
+    parser.add_argument("--backend", default=None, help="Silnik symulacji (np. reference, fast)")
+    parser.add_argument("--budzety", default=None, help="Plik JSON z nadpisaniem budżetów")
+    parser.add_argument("--json", default=None, help="Zapisz pomiary do pliku JSON")
+    args = parser.parse_args(argv)
+
+    horizons = [h for h in args.horyzonty.split(",") if h]
+    cases = [c for c in args.przypadki.split(",") if c]
+    for h in horizons:
+        if h not in HORIZONS_DAYS:
+            parser.error(f"Nieznany horyzont: {h!r} (dostępne: {', '.join(HORIZONS_DAYS)})")
+    for c in cases:
+        if c not in CASES:
+            parser.error(f"Nieznany przypadek: {c!r} (dostępne: {', '.join(CASES)})")
+
+    results = run_suite(horizons, cases, load_budgets(args.budzety), backend=args.backend)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([{**asdict(m), "ok": m.ok, "valid": m.valid} for m in results], f, ensure_ascii=False, indent=2)
+
+    failed = [m for m in results if not m.ok]
+    if failed:
+        print(f"Przekroczone budżety: {len(failed)} z {len(results)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+"""Wspólne formaty i pliki przeliczeń: zadania (cwu_jobs), batch (cwu_batch) i klaster (cwu_cluster).
+
+- `result_summary` – wartości skalarne `ComparisonResult` zapisywane jako wynik,
+- `load_profile_file` – profil poboru z pliku (z małym cache na proces),
+- `open_output` – plik wyników JSONL, nowy albo dopisywany (wznawianie).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, List, TextIO
+
+from cwu_time_simulation import ComparisonResult
+
+# Profile z plików wczytane w danym procesie (wiele budynków dzieli ten sam profil)
+_PROFILE_CACHE: Dict[str, List[float]] = {}
+_PROFILE_CACHE_MAX = 64
+
+
+def result_summary(res: ComparisonResult) -> dict:
+    """Wartości skalarne wyniku (w konwencji odpowiedzi API) – rekord zadania i wiersz batch."""
+    return {
+        "Pzam_final": res.Pzam_final_kw,
+        "Pmix": res.mix.Pzam_kW,
+        "Player": res.layered.Pzam_kW,
+        "delta_P": res.delta_P_kW,
+        "cost_month": res.extra_cost_month_zl,
+        "cost_year": res.extra_cost_year_zl,
+        "cost_horizon": res.extra_cost_total_zl,
+        "decision": res.final_decision_text,
+        "level": res.recommendation_level,
+        "approximate": res.approximate,
+        "delta_P_min": res.delta_P_min_kW,
+        "delta_P_max": res.delta_P_max_kW,
+    }
+
+
+def load_profile_file(path: str) -> List[float]:
+    """Profil poboru [l/min] z pliku: .csv/.txt (pierwsza kolumna, nagłówek pomijany), .json, .npy."""
+    cached = _PROFILE_CACHE.get(path)
+    if cached is not None:
+        return cached
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        import numpy as np
+
+        values = [float(x) for x in np.load(path).ravel()]
+    elif ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            values = [float(x) for x in json.load(f)]
+    else:
+        values = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                cell = line.strip().split(",")[0].split(";")[0].strip()
+                if not cell:
+                    continue
+                try:
+                    values.append(float(cell))
+                except ValueError:
+                    if values:
+                        raise
+                    # nagłówek
+
+    if len(_PROFILE_CACHE) >= _PROFILE_CACHE_MAX:
+        _PROFILE_CACHE.pop(next(iter(_PROFILE_CACHE)))
+    _PROFILE_CACHE[path] = values
+    return values
+
+
+def open_output(path: str, fresh: bool) -> TextIO:
+    """Plik wyników JSONL do zapisu: nowy (fresh) albo dopisywany do istniejącego."""
+    if fresh or not os.path.exists(path):
+        return open(path, "w", encoding="utf-8")
+    # Dopisujemy; jeśli ostatni wiersz został ucięty, zaczynamy od nowej linii
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        needs_newline = False
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    out = open(path, "a", encoding="utf-8")
+    if needs_newline:
+        out.write("\n")
+    return out
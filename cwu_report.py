@@ -0,0 +1,345 @@
+"""Raport audytowy (HTML / PDF) z `ComparisonResult`, renderowany po stronie serwera.
+
+- Treść raportu to wyłącznie gotowe pola wyniku (teksty rekomendacji, komentarze,
+  dane słupków) – `report_data()` wyciąga je do słownika JSON.
+- Skrót tego słownika (+ format, wersja szablonu) jest kluczem cache: raport
+  i jego wykresy zapisywane są w katalogu `<CWU_REPORT_DIR>/<skrót>/`, więc
+  ponowne pobranie albo wydruk tego samego wyniku nic nie kosztuje.
+- Wykresy rysuje `cwu_charts` (Agg, bez wyświetlacza); PDF składany jest przez
+  matplotlib `PdfPages`, HTML ma wykresy wbudowane (jeden samodzielny plik).
+- `ReportRenderer` renderuje w osobnej, małej puli procesów – niezależnej od
+  wątków i procesów liczących Pzam – z deduplikacją równoległych żądań.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import html
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from cwu_charts import ChartJob, pzam_bar_data, render_charts
+from cwu_singleflight import SingleFlight
+from cwu_time_simulation import ENGINE_VERSION, LEVEL_UNDETERMINED, ComparisonResult
+
+# Podbij przy każdej zmianie wyglądu raportu – unieważnia zapisane pliki.
+REPORT_TEMPLATE_VERSION = 2
+
+DEFAULT_REPORT_DIR = os.environ.get("CWU_REPORT_DIR", "cwu_reports")
+DEFAULT_MAX_BYTES = int(os.environ.get("CWU_REPORT_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Raporty użyte (wyrenderowane albo pobrane) w tym czasie [s] nie są usuwane przy
+# przycinaniu – ścieżka zwrócona z cache musi przetrwać do otwarcia pliku przez odpowiedź
+PRUNE_MIN_AGE_S = 300.0
+
+MEDIA_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "pdf": "application/pdf",
+}
+
+LEVEL_NAMES = {
+    "A": "A – różnica nieistotna",
+    "B": "B – różnica umiarkowana",
+    "C": "C – różnica istotna",
+    LEVEL_UNDETERMINED: "nieustalony – wynik przybliżony",
+}
+
+
+def report_data(res: ComparisonResult) -> Dict[str, Any]:
+    """Wszystko, co trafia do raportu (bez serii czasowych) – typy JSON."""
+    return {
+        "Pzam_mix_kW": res.mix.Pzam_kW,
+        "Pzam_layer_kW": res.layered.Pzam_kW,
+        "Pzam_final_kW": res.Pzam_final_kw,
+        "delta_P_kW": res.delta_P_kW,
+        "delta_P_percent": res.delta_P_percent,
+        "P_avg_CWU_kW": res.P_avg_CWU_kW,
+        "E_CWU_kWh": res.E_CWU_kWh,
+        "loss_kw": res.mix.loss_kw,
+        "violation_minutes_mix": res.mix.violation_minutes,
+        "violation_minutes_layer": res.layered.violation_minutes,
+        "T_min_reached_mix_C": res.mix.T_min_reached_C,
+        "T_min_reached_layer_C": res.layered.T_min_reached_C,
+        "recommendation_level": res.recommendation_level,
+        "recommendation_title": res.recommendation_title,
+        "recommendation_text": res.recommendation_text,
+        "economic_hint": res.economic_hint,
+        "economic_commentary": res.economic_commentary,
+        "extra_cost_month_zl": res.extra_cost_month_zl,
+        "extra_cost_year_zl": res.extra_cost_year_zl,
+        "extra_cost_total_zl": res.extra_cost_total_zl,
+        "decision_basis": res.decision_basis,
+        "final_decision_text": res.final_decision_text,
+        "commentary": res.commentary,
+        "bar_chart": res.bar_chart,
+        "cost_bar_chart_year": res.cost_bar_chart_year,
+        "metrics": res.metrics,
+        "approximate": res.approximate,
+        "delta_P_min_kW": res.delta_P_min_kW,
+        "delta_P_max_kW": res.delta_P_max_kW,
+        "cyclic": res.cyclic,
+    }
+
+
+def report_digest(data: Dict[str, Any], fmt: str) -> str:
+    payload = {"v": REPORT_TEMPLATE_VERSION, "engine": ENGINE_VERSION, "fmt": fmt, "data": data}
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:40]
+
+
+def _chart_jobs(data: Dict[str, Any], out_dir: str, fmt: str) -> List[ChartJob]:
+    jobs = [
+        ChartJob(
+            kind="bar",
+            data={**pzam_bar_data(data["Pzam_mix_kW"], data["Pzam_layer_kW"], data["Pzam_final_kW"]),
+                  "title": "Moc zamówiona wg modelu"},
+            path=os.path.join(out_dir, f"pzam.{fmt}"),
+        )
+    ]
+    if data["cost_bar_chart_year"]:
+        jobs.append(ChartJob(
+            kind="bar",
+            data={
+                "labels": [str(row["label"]) for row in data["cost_bar_chart_year"]],
+                "values": [float(row["value_zl"]) for row in data["cost_bar_chart_year"]],
+                "colors": ["#ff7f0e"],
+                "unit": "zł",
+                "value_fmt": "{:.0f}",
+                "title": "Koszt roczny",
+            },
+            path=os.path.join(out_dir, f"koszt_rok.{fmt}"),
+        ))
+    return jobs
+
+
+def _summary_rows(data: Dict[str, Any]) -> List[tuple]:
+    rows = [
+        ("Pzam – model idealnie mieszany", f"{data['Pzam_mix_kW']:.1f} kW"),
+        ("Pzam – model warstwowy (2-strefowy)", f"{data['Pzam_layer_kW']:.1f} kW"),
+        ("ΔP", f"{data['delta_P_kW']:.1f} kW ({data['delta_P_percent']:.1f}%)" if not data["approximate"]
+         else f"nieustalone: {data['delta_P_min_kW']:.1f} … {data['delta_P_max_kW']:.1f} kW"),
+        ("Rekomendowana moc zamówiona", f"{data['Pzam_final_kW']:.1f} kW"),
+        ("Podstawa decyzji", str(data["decision_basis"])),
+        ("Poziom", LEVEL_NAMES.get(data["recommendation_level"], str(data["recommendation_level"]))),
+        ("Średnia moc CWU", f"{data['P_avg_CWU_kW']:.2f} kW"),
+        ("Energia CWU w profilu", f"{data['E_CWU_kWh']:.1f} kWh"),
+        ("Straty postojowe", f"{data['loss_kw']:.2f} kW"),
+        ("Dodatkowy koszt (rok)", f"{data['extra_cost_year_zl']:.0f} zł"),
+        ("Dodatkowy koszt (horyzont)", f"{data['extra_cost_total_zl']:.0f} zł"),
+    ]
+    return rows
+
+
+def _notes(data: Dict[str, Any]) -> List[str]:
+    notes = []
+    if data["approximate"]:
+        notes.append(
+            "Szukanie Pzam przerwał limit czasu – podane moce to bezpieczne górne granice; "
+            "rekomendacja jest konserwatywna, bez poziomu A/B/C i kosztów."
+        )
+    if data["cyclic"]:
+        notes.append("Obliczenia dla powtarzalnej doby (stan okresowy zasobnika).")
+    return notes
+
+
+def _render_html(data: Dict[str, Any], charts: List[str], path: str) -> None:
+    def para(text: Optional[str]) -> str:
+        if not text:
+            return ""
+        return "".join(f"<p>{html.escape(line)}</p>" for line in str(text).split("\n") if line.strip())
+
+    images = []
+    for chart in charts:
+        with open(chart, "rb") as f:
+            images.append(f'<img alt="" src="data:image/png;base64,{base64.b64encode(f.read()).decode("ascii")}">')
+
+    rows = "".join(f"<tr><th>{html.escape(k)}</th><td>{html.escape(v)}</td></tr>" for k, v in _summary_rows(data))
+    notes = "".join(f'<p class="note">{html.escape(n)}</p>' for n in _notes(data))
+    doc = f"""<!DOCTYPE html>
+<html lang="pl"><head><meta charset="utf-8"><title>Raport mocy zamówionej CWU</title>
+<style>
+body {{ font-family: sans-serif; max-width: 60em; margin: 2em auto; color: #222; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+th, td {{ text-align: left; padding: .3em 1em .3em 0; border-bottom: 1px solid #ddd; }}
+img {{ max-width: 100%; }}
+.note {{ color: #a15c00; }}
+@media print {{ body {{ margin: 0; }} }}
+</style></head><body>
+<h1>Raport mocy zamówionej CWU</h1>
+{notes}
+<h2>{html.escape(str(data["recommendation_title"]))}</h2>
+<table>{rows}</table>
+<h2>Decyzja</h2>{para(data["final_decision_text"])}
+<h2>Rekomendacja</h2>{para(data["recommendation_text"])}{para(data["economic_hint"])}
+<h2>Wykresy</h2>{"".join(images)}
+<h2>Komentarz inżynierski</h2>{para(data["commentary"])}
+<h2>Skutki finansowe</h2>{para(data["economic_commentary"])}
+<p class="small">Wersja silnika {html.escape(ENGINE_VERSION)}.</p>
+</body></html>
+"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(doc)
+
+
+def _render_pdf(data: Dict[str, Any], charts: List[str], path: str) -> None:
+    import textwrap
+
+    import matplotlib.image as mpimg
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    def text_page(pdf: PdfPages, blocks: List[tuple]) -> None:
+        # A4, tekst łamany ręcznie (matplotlib nie zawija tekstu)
+        fig = plt.figure(figsize=(8.27, 11.69))
+        y = 0.95
+        for style, text in blocks:
+            size, weight, width = {"h1": (16, "bold", 60), "h2": (12, "bold", 80), "p": (9, "normal", 105)}[style]
+            for line in [w for part in str(text).split("\n") for w in (textwrap.wrap(part, width) or [""])]:
+                if y < 0.05:
+                    pdf.savefig(fig)
+                    plt.close(fig)
+                    fig = plt.figure(figsize=(8.27, 11.69))
+                    y = 0.95
+                fig.text(0.07, y, line, fontsize=size, weight=weight, va="top")
+                y -= 0.022 if style == "p" else 0.032
+            y -= 0.01
+        pdf.savefig(fig)
+        plt.close(fig)
+
+    blocks: List[tuple] = [("h1", "Raport mocy zamówionej CWU")]
+    blocks += [("p", n) for n in _notes(data)]
+    blocks.append(("h2", data["recommendation_title"]))
+    blocks += [("p", f"{k}: {v}") for k, v in _summary_rows(data)]
+    blocks += [("h2", "Decyzja"), ("p", data["final_decision_text"])]
+    blocks += [("h2", "Rekomendacja"), ("p", data["recommendation_text"])]
+    if data["economic_hint"]:
+        blocks.append(("p", data["economic_hint"]))
+    blocks += [("h2", "Komentarz inżynierski"), ("p", data["commentary"])]
+    blocks += [("h2", "Skutki finansowe"), ("p", data["economic_commentary"])]
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with PdfPages(tmp_path) as pdf:
+        text_page(pdf, blocks)
+        if charts:
+            fig, axes = plt.subplots(len(charts), 1, figsize=(8.27, 11.69))
+            for ax, chart in zip(axes if len(charts) > 1 else [axes], charts):
+                ax.imshow(mpimg.imread(chart))
+                ax.axis("off")
+            pdf.savefig(fig)
+            plt.close(fig)
+    os.replace(tmp_path, path)
+
+
+def render_report(data: Dict[str, Any], fmt: str, report_dir: str = DEFAULT_REPORT_DIR) -> str:
+    """Renderuje raport (albo zwraca zapisany) – ścieżka pliku. Funkcja dla procesu roboczego."""
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Nieznany format raportu: {fmt!r} (dostępne: {', '.join(MEDIA_TYPES)})")
+    digest = report_digest(data, fmt)
+    out_dir = os.path.join(report_dir, digest)
+    path = os.path.join(out_dir, f"raport.{fmt}")
+    if os.path.exists(path):
+        os.utime(out_dir)
+        return path
+
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = _chart_jobs(data, out_dir, "png")
+    render_charts(jobs, workers=1)
+    charts = [j.path for j in jobs]
+    if fmt == "html":
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        _render_html(data, charts, tmp_path)
+        os.replace(tmp_path, path)
+    else:
+        _render_pdf(data, charts, path)
+    return path
+
+
+def prune_reports(
+    report_dir: str = DEFAULT_REPORT_DIR,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    min_age_s: float = PRUNE_MIN_AGE_S,
+) -> int:
+    """Usuwa najdawniej używane raporty, aż katalog zmieści się w limicie. Zwraca liczbę usuniętych.
+
+    Czas użycia to mtime katalogu raportu (odnawiany przy każdym trafieniu); raporty
+    użyte w ostatnich `min_age_s` sekundach zostają, nawet ponad limit.
+    """
+    if not os.path.isdir(report_dir):
+        return 0
+    entries = []
+    for name in os.listdir(report_dir):
+        d = os.path.join(report_dir, name)
+        try:
+            if os.path.isdir(d):
+                size = sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+                entries.append((os.path.getmtime(d), size, d))
+        except OSError:
+            continue  # katalog usuwany albo zapisywany równolegle
+    total = sum(e[1] for e in entries)
+    removed = 0
+    cutoff = time.time() - min_age_s
+    for used_at, size, d in sorted(entries):
+        if total <= max_bytes or used_at > cutoff:
+            break
+        shutil.rmtree(d, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _init_worker() -> None:
+    import matplotlib
+
+    matplotlib.use("Agg", force=True)
+
+
+class ReportRenderer:
+    """Renderowanie raportów poza pulą obliczeń: własna pula procesów + single-flight po skrócie."""
+
+    def __init__(self, report_dir: str = DEFAULT_REPORT_DIR, workers: int = 1, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.report_dir = report_dir
+        self.max_bytes = max_bytes
+        self._executor = ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker)
+        self._inflight: SingleFlight[str] = SingleFlight()
+        self._last_prune = 0.0
+        self.hits = 0
+        self.rendered = 0
+
+    def cached_path(self, data: Dict[str, Any], fmt: str) -> Optional[str]:
+        """Ścieżka zapisanego raportu (None – brak); trafienie odnawia czas użycia dla LRU."""
+        out_dir = os.path.join(self.report_dir, report_digest(data, fmt))
+        path = os.path.join(out_dir, f"raport.{fmt}")
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(out_dir)
+        except FileNotFoundError:
+            return None  # usunięty w międzyczasie – wyrenderuje się ponownie
+        return path
+
+    async def render(self, res: ComparisonResult, fmt: str) -> str:
+        data = report_data(res)
+        cached = self.cached_path(data, fmt)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        async def job(_cancel) -> str:
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(self._executor, render_report, data, fmt, self.report_dir)
+            self.rendered += 1
+            if time.monotonic() - self._last_prune > 60.0:
+                self._last_prune = time.monotonic()
+                await loop.run_in_executor(self._executor, prune_reports, self.report_dir, self.max_bytes)
+            return path
+
+        return await self._inflight.do(report_digest(data, fmt), job)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,361 @@
+"""Harmonogram mocy zamówionej: osobne Pzam dla miesięcy lub sezonów z profilu rocznego.
+
+Profil roczny (od 1 stycznia, 365 lub 366 dni) dzielony jest na miesiące, każdy
+z własną temperaturą wody zimnej. Pzam każdego miesiąca szukane jest niezależnie,
+równolegle w puli procesów. Miesiąc startuje ze stanu zasobnika, w którym
+skończył się poprzedni (przy jego Pzam): najpierw wszystkie miesiące liczone są
+od stanu początkowego, potem przeliczane są tylko te, których stan startowy
+się zmienił – aż do zbieżności (zwykle 1–2 przebiegi, bo przy Pzam zasobnik
+kończy miesiąc prawie naładowany).
+
+Pzam sezonu to maksimum Pzam jego miesięcy, a pojedyncza moc roczna to maksimum
+wszystkich miesięcy: wyższa moc nie pogarsza stanu na starcie kolejnego miesiąca,
+więc spełnia warunek w każdym z nich (sprawdzane symulacją całego roku).
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cwu_backends import get_backend
+from cwu_time_simulation import (
+    RECORD_SUMMARY,
+    CostParams,
+    DemandProfile,
+    LayeredParams,
+    LossInput,
+    ModelRunResult,
+    TankParams,
+    _find_min_pmax,
+    analyze_profile,
+    derive_loss_kw,
+)
+
+MODELS = ("mixed", "layered_2zone")
+
+MONTH_NAMES = (
+    "styczeń", "luty", "marzec", "kwiecień", "maj", "czerwiec",
+    "lipiec", "sierpień", "wrzesień", "październik", "listopad", "grudzień",
+)
+_MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Sezony jako grupy miesięcy (1 = styczeń)
+SEASONS: Tuple[Tuple[str, Tuple[int, ...]], ...] = (
+    ("zima", (12, 1, 2)),
+    ("wiosna", (3, 4, 5)),
+    ("lato", (6, 7, 8)),
+    ("jesień", (9, 10, 11)),
+)
+
+# Zmiana stanu startowego miesiąca [°C], poniżej której nie przeliczamy go ponownie
+CARRY_TOL_C = 0.01
+
+
+@dataclass(frozen=True)
+class MonthSlice:
+    month: int
+    T_cold_C: float
+    T_start_primary_C: float
+    T_start_secondary_C: Optional[float]
+    Pzam_kW: float
+    violation_minutes: float
+    T_end_primary_C: float
+    T_end_secondary_C: Optional[float]
+    simulations: int
+
+
+@dataclass(frozen=True)
+class PeriodPzam:
+    label: str
+    months: Tuple[int, ...]
+    Pzam_kW: float
+    cost_zl: Optional[float]  # opłata za moc w tym okresie (None – brak stawek)
+
+
+@dataclass(frozen=True)
+class SeasonalSchedule:
+    model: str
+    split: str  # "month" | "season"
+    loss_kw: float
+    months: List[MonthSlice]
+    periods: List[PeriodPzam]
+    Pzam_annual_kW: float
+    annual_violation_minutes: Optional[float]  # symulacja roku przy Pzam_annual (None – nie sprawdzano)
+    carry_passes: int
+    carry_converged: bool
+    cost_schedule_year_zl: Optional[float]
+    cost_annual_year_zl: Optional[float]
+    saving_year_zl: Optional[float]
+
+
+@dataclass(frozen=True)
+class _SliceTask:
+    month: int
+    model: str
+    tank: TankParams
+    layered: LayeredParams
+    demand_lpm: List[float]
+    loss_kw: float
+    allowed_violation_min: float
+    T_init_cold_C: Optional[float]
+    pmax_start_kW: float
+    pmax_max_kW: float
+    tol_kW: float
+    backend: Optional[str] = None
+
+
+def _simulate(task: _SliceTask, pmax_kW: float) -> ModelRunResult:
+    sim = get_backend(task.backend)
+    if task.model == "mixed":
+        return sim.simulate_mixed(
+            tank=task.tank,
+            demand_lpm=task.demand_lpm,
+            pmax_kW=pmax_kW,
+            loss_kw=task.loss_kw,
+            allowed_violation_min=task.allowed_violation_min,
+            recording=RECORD_SUMMARY,
+        )
+    return sim.simulate_layered_2zone(
+        tank=task.tank,
+        layered=task.layered,
+        demand_lpm=task.demand_lpm,
+        pmax_kW=pmax_kW,
+        loss_kw=task.loss_kw,
+        allowed_violation_min=task.allowed_violation_min,
+        T_init_cold_C=task.T_init_cold_C,
+        recording=RECORD_SUMMARY,
+    )
+
+
+def _solve_slice(task: _SliceTask) -> MonthSlice:
+    res = _find_min_pmax(
+        simulate_fn=lambda p: _simulate(task, p),
+        pmax_start_kW=task.pmax_start_kW,
+        pmax_max_kW=task.pmax_max_kW,
+        tol_kW=task.tol_kW,
+        allowed_violation_min=task.allowed_violation_min,
+        model=task.model,
+    )
+    return MonthSlice(
+        month=task.month,
+        T_cold_C=task.tank.T_cold_C,
+        T_start_primary_C=task.tank.T_init_C,
+        T_start_secondary_C=task.T_init_cold_C,
+        Pzam_kW=res.Pzam_kW,
+        violation_minutes=res.violation_minutes,
+        T_end_primary_C=float(res.T_end_primary_C),
+        T_end_secondary_C=res.T_end_secondary_C,
+        simulations=res.search_simulations,
+    )
+
+
+def month_bounds(n_steps: int, dt_s: int) -> List[Tuple[int, int]]:
+    """Granice miesięcy [i0, i1) w krokach profilu rocznego (365 lub 366 dni od 1 stycznia)."""
+    if dt_s <= 0 or 86400 % dt_s != 0:
+        raise ValueError("dt_s musi dzielić dobę (86400 s) bez reszty.")
+    steps_per_day = 86400 // dt_s
+    days = n_steps / steps_per_day
+    if days == 365:
+        month_days = _MONTH_DAYS
+    elif days == 366:
+        month_days = (31, 29) + _MONTH_DAYS[2:]
+    else:
+        raise ValueError(f"Profil roczny musi mieć 365 lub 366 dni (jest {days:.2f}).")
+
+    bounds = []
+    i0 = 0
+    for d in month_days:
+        i1 = i0 + d * steps_per_day
+        bounds.append((i0, i1))
+        i0 = i1
+    return bounds
+
+
+def _state_changed(a: Tuple[float, Optional[float]], b: Tuple[float, Optional[float]]) -> bool:
+    if abs(a[0] - b[0]) > CARRY_TOL_C:
+        return True
+    if (a[1] is None) != (b[1] is None):
+        return True
+    return a[1] is not None and abs(a[1] - b[1]) > CARRY_TOL_C
+
+
+def seasonal_pzam_schedule(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_input: LossInput,
+    allowed_violation_min: float = 0.0,
+    T_cold_monthly_C: Optional[Sequence[float]] = None,
+    layered: Optional[LayeredParams] = None,
+    model: str = "layered_2zone",
+    split: str = "month",
+    cost_params: Optional[CostParams] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+    workers: Optional[int] = None,
+    max_carry_passes: int = 4,
+    verify_annual: bool = True,
+    backend: Optional[str] = None,
+) -> SeasonalSchedule:
+    """Harmonogram Pzam (miesięczny lub sezonowy) i porównanie kosztu z jedną mocą roczną.
+
+    T_cold_monthly_C:
+      12 temperatur wody zimnej (styczeń..grudzień); domyślnie stałe tank.T_cold_C.
+    workers:
+      Liczba procesów (domyślnie liczba CPU); 1 = liczenie w bieżącym procesie.
+    backend:
+      Silnik symulacji (`cwu_backends`); None – domyślny procesu głównego.
+    """
+
+    if model not in MODELS:
+        raise ValueError(f"Nieznany model: {model!r} (dostępne: {', '.join(MODELS)})")
+    if split not in ("month", "season"):
+        raise ValueError("split musi być 'month' albo 'season'.")
+    t_cold = list(T_cold_monthly_C) if T_cold_monthly_C is not None else [tank.T_cold_C] * 12
+    if len(t_cold) != 12:
+        raise ValueError("T_cold_monthly_C musi mieć 12 wartości (styczeń..grudzień).")
+
+    layered_params = layered or LayeredParams()
+    # Nazwa ustalona tu, bo procesy robocze nie widzą set_default_backend() procesu głównego
+    backend_name = get_backend(backend).name
+    demand = [float(x) for x in demand_lpm]
+    bounds = month_bounds(len(demand), tank.dt_s)
+
+    # Straty to stała moc dla całego roku – z P_avg_CWU roku przy sezonowej T_cold
+    E_kWh = sum(
+        analyze_profile(
+            demand_lpm=demand[i0:i1],
+            dt_s=tank.dt_s,
+            T_cold_C=t_cold[m],
+            T_delivery_C=tank.T_set_C,
+        ).E_CWU_kWh
+        for m, (i0, i1) in enumerate(bounds)
+    )
+    P_avg_kW = E_kWh / (len(demand) * tank.dt_s / 3600.0)
+    loss_kw = derive_loss_kw(loss_input=loss_input, P_avg_CWU_kW=P_avg_kW)
+
+    def task(m: int, start: Tuple[float, Optional[float]]) -> _SliceTask:
+        i0, i1 = bounds[m]
+        return _SliceTask(
+            month=m + 1,
+            model=model,
+            tank=replace(tank, T_cold_C=float(t_cold[m]), T_init_C=start[0]),
+            layered=layered_params,
+            demand_lpm=demand[i0:i1],
+            loss_kw=loss_kw,
+            allowed_violation_min=allowed_violation_min,
+            T_init_cold_C=start[1],
+            pmax_start_kW=pmax_start_kW,
+            pmax_max_kW=pmax_max_kW,
+            tol_kW=tol_kW,
+            backend=backend_name,
+        )
+
+    initial: Tuple[float, Optional[float]] = (tank.T_init_C, None)
+    starts: List[Tuple[float, Optional[float]]] = [initial] * 12
+    slices: List[Optional[MonthSlice]] = [None] * 12
+    todo = list(range(12))
+    passes = 0
+
+    n_workers = 1 if workers == 1 else (workers or os.cpu_count() or 1)
+    executor = ProcessPoolExecutor(max_workers=min(n_workers, 12)) if n_workers > 1 else None
+    try:
+        while todo and passes < max_carry_passes:
+            tasks = [task(m, starts[m]) for m in todo]
+            solved = executor.map(_solve_slice, tasks) if executor is not None else map(_solve_slice, tasks)
+            for m, sl in zip(todo, solved):
+                slices[m] = sl
+            passes += 1
+
+            carried = [initial] + [(s.T_end_primary_C, s.T_end_secondary_C) for s in slices[:-1]]
+            todo = [m for m in range(12) if _state_changed(carried[m], starts[m])]
+            starts = carried
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    months: List[MonthSlice] = [s for s in slices if s is not None]
+    P_annual = max(s.Pzam_kW for s in months)
+
+    annual_violation: Optional[float] = None
+    if verify_annual:
+        annual_violation = 0.0
+        state = initial
+        for m in range(12):
+            r = _simulate(task(m, state), P_annual)
+            annual_violation += r.violation_minutes
+            state = (float(r.T_end_primary_C), r.T_end_secondary_C)
+
+    groups: Sequence[Tuple[str, Tuple[int, ...]]] = (
+        [(MONTH_NAMES[m], (m + 1,)) for m in range(12)] if split == "month" else SEASONS
+    )
+
+    cost = (cost_params or CostParams()).normalized()
+    rate = cost.cost_per_kw_month_zl
+    periods: List[PeriodPzam] = []
+    for label, group in groups:
+        p = max(months[m - 1].Pzam_kW for m in group)
+        periods.append(PeriodPzam(
+            label=label,
+            months=tuple(group),
+            Pzam_kW=p,
+            cost_zl=(p * float(rate) * len(group)) if rate is not None else None,
+        ))
+
+    cost_schedule = sum(p.cost_zl for p in periods) if rate is not None else None  # type: ignore[misc]
+    cost_annual = (P_annual * float(rate) * 12.0) if rate is not None else None
+
+    return SeasonalSchedule(
+        model=model,
+        split=split,
+        loss_kw=loss_kw,
+        months=months,
+        periods=periods,
+        Pzam_annual_kW=P_annual,
+        annual_violation_minutes=annual_violation,
+        carry_passes=passes,
+        carry_converged=not todo,
+        cost_schedule_year_zl=cost_schedule,
+        cost_annual_year_zl=cost_annual,
+        saving_year_zl=(cost_annual - cost_schedule) if rate is not None else None,
+    )
+
+
+def schedule_table(schedule: SeasonalSchedule) -> List[Dict[str, object]]:
+    """Wiersze do GUI/raportu: okres, Pzam, koszt."""
+    return [
+        {"okres": p.label, "Pzam_kW": round(p.Pzam_kW, 1), "koszt_zl": p.cost_zl}
+        for p in schedule.periods
+    ]
+
+
+if __name__ == "__main__":
+    import math
+
+    from cwu_time_simulation import DEFAULT_AUDIT_PEAKS, build_profile_24h
+
+    # Demo: profil roczny z pikami silniejszymi zimą, woda zimna 6–16 °C
+    day = build_profile_24h(dt_s=60, peaks=DEFAULT_AUDIT_PEAKS)
+    profile: List[float] = []
+    for d in range(365):
+        scale = 1.0 + 0.25 * math.cos(2.0 * math.pi * d / 365.0)
+        profile.extend(x * scale for x in day)
+    t_cold = [6.0, 5.0, 6.0, 8.0, 11.0, 14.0, 16.0, 16.0, 14.0, 11.0, 8.0, 7.0]
+
+    sched = seasonal_pzam_schedule(
+        tank=TankParams(volume_l=800.0, T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=60),
+        demand_lpm=profile,
+        loss_input=LossInput(loss_kw=3.0),
+        T_cold_monthly_C=t_cold,
+        split="season",
+        cost_params=CostParams(cost_per_kw_month_zl=50.0),
+    )
+    for row in schedule_table(sched):
+        print(row)
+    print(f"Pzam roczne: {sched.Pzam_annual_kW:.1f} kW (naruszenia w roku: {sched.annual_violation_minutes} min)")
+    print(f"Koszt: harmonogram {sched.cost_schedule_year_zl:.0f} zł/rok, "
+          f"jedna moc {sched.cost_annual_year_zl:.0f} zł/rok, oszczędność {sched.saving_year_zl:.0f} zł/rok")
+    print(f"Przebiegi przenoszenia stanu: {sched.carry_passes} (zbieżne: {sched.carry_converged})")
@@ -0,0 +1,321 @@
+"""Pula procesów z profilami i wynikami w pamięci współdzielonej.
+
+Zwykła `ProcessPoolExecutor` pakuje (pickle) `demand_lpm` do każdego zadania i
+odsyła serie wyników jako listy – przy profilach rocznych albo z krokiem 1 s
+trwa to dłużej niż sama symulacja. Tutaj:
+
+- profil publikowany jest raz (`publish`) w bloku `SharedMemory`; do procesu
+  roboczego trafia tylko uchwyt `SharedProfile` (nazwa + długość), a proces
+  podłącza blok raz i widzi go jako tablicę numpy tylko do odczytu,
+- serie wyników (time_s, T_primary_C, P_in_kW, T_secondary_C) proces roboczy
+  zapisuje do bloku wyniku zadania; przez pickle wraca tylko wynik bez serii,
+  a proces główny odtwarza serie z bufora i od razu usuwa blok.
+
+Sprzątanie jest deterministyczne: nazwy bloków wyników wynikają z prefiksu
+puli i numeru zadania, więc proces główny usuwa je (unlink) także wtedy, gdy
+proces roboczy padł w trakcie zapisu. Profile usuwa `close()` / wyjście z
+bloku `with` (awaryjnie – finalizator przy odśmiecaniu albo końcu procesu).
+Ostatnią linią obrony jest `resource_tracker`, wspólny dla procesu głównego i
+roboczych – sprząta bloki, gdy padnie także proces główny.
+
+    with SharedMemoryPool(workers=4, backend="fast") as pool:
+        prof = pool.publish(demand_lpm)
+        futs = [pool.submit_compare(prof, tank=t, loss_input=li, allowed_violation_min=0.0) for t in tanks]
+        wyniki = [f.result() for f in futs]
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import secrets
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from cwu_backends import get_backend
+from cwu_time_simulation import (
+    ComparisonResult,
+    DemandProfile,
+    LayeredParams,
+    ModelRunResult,
+    TankParams,
+    compare_models,
+)
+
+# Ile podłączonych profili trzyma proces roboczy (starsze są odłączane)
+WORKER_PROFILE_CACHE = 8
+
+# Serie ModelRunResult przenoszone przez blok wyniku (kolejność zapisu)
+_SERIES = ("time_s", "T_primary_C", "P_in_kW", "T_secondary_C")
+_ABSENT = -1  # długość serii None (T_secondary_C modelu mieszanego)
+
+
+@dataclass(frozen=True)
+class SharedProfile:
+    """Uchwyt opublikowanego profilu – tylko on jest pakowany do zadań."""
+
+    name: str
+    length: int
+
+
+def _unlink_by_name(name: str) -> bool:
+    """Usuwa blok o danej nazwie, jeśli istnieje (podłączenie + unlink)."""
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    shm.unlink()
+    return True
+
+
+# --- Strona procesu roboczego ---
+
+_attached: Dict[str, Tuple[SharedMemory, np.ndarray]] = {}
+
+
+def _profile_array(profile: SharedProfile) -> np.ndarray:
+    """Profil jako tablica tylko do odczytu nad blokiem współdzielonym (bez kopii)."""
+    hit = _attached.get(profile.name)
+    if hit is not None:
+        return hit[1]
+    if len(_attached) >= WORKER_PROFILE_CACHE:
+        old_name = next(iter(_attached))
+        old_shm, _ = _attached.pop(old_name)
+        try:
+            old_shm.close()
+        except BufferError:
+            pass  # widok jeszcze w użyciu – mapowanie zniknie razem z procesem
+    shm = SharedMemory(name=profile.name)
+    arr = np.ndarray((profile.length,), dtype=np.float64, buffer=shm.buf)
+    arr.flags.writeable = False
+    _attached[profile.name] = (shm, arr)
+    return arr
+
+
+def _write_series(block_name: str, runs: Sequence[ModelRunResult]) -> List[ModelRunResult]:
+    """Zapisuje serie wyników do nowego bloku; zwraca wyniki bez serii (do odesłania)."""
+    columns: List[Optional[Sequence[float]]] = [getattr(r, f) for r in runs for f in _SERIES]
+    lengths = np.array([_ABSENT if c is None else len(c) for c in columns], dtype=np.int64)
+    total = int(lengths.clip(min=0).sum())
+    shm = SharedMemory(name=block_name, create=True, size=max(1, 8 * (lengths.size + total)))
+    try:
+        np.ndarray(lengths.shape, dtype=np.int64, buffer=shm.buf)[:] = lengths
+        data = np.ndarray((total,), dtype=np.float64, buffer=shm.buf, offset=8 * lengths.size)
+        pos = 0
+        for c, n in zip(columns, lengths):
+            if n > 0:
+                data[pos : pos + n] = c
+                pos += int(n)
+        del data
+    finally:
+        shm.close()  # bez unlink – blok usuwa proces główny po odczycie
+    empty = {f: ([] if f != "T_secondary_C" else None) for f in _SERIES}
+    return [replace(r, **empty) for r in runs]
+
+
+def _task_compare(block_name: str, profile: SharedProfile, backend: str, kwargs: Dict[str, Any]) -> ComparisonResult:
+    res = compare_models(demand_lpm=_profile_array(profile), backend=backend, **kwargs)
+    mix, layered = _write_series(block_name, (res.mix, res.layered))
+    return replace(res, mix=mix, layered=layered)
+
+
+def _task_simulate(block_name: str, profile: SharedProfile, backend: str, model: str, kwargs: Dict[str, Any]) -> ModelRunResult:
+    sim = get_backend(backend)
+    fn = sim.simulate_mixed if model == "mixed" else sim.simulate_layered_2zone
+    (res,) = _write_series(block_name, (fn(demand_lpm=_profile_array(profile), **kwargs),))
+    return res
+
+
+# --- Strona procesu głównego ---
+
+def _read_series(block_name: str, stubs: Sequence[ModelRunResult]) -> List[ModelRunResult]:
+    """Odtwarza serie z bloku wyniku i usuwa blok."""
+    shm = SharedMemory(name=block_name)
+    try:
+        k = len(stubs) * len(_SERIES)
+        lengths = np.ndarray((k,), dtype=np.int64, buffer=shm.buf).tolist()
+        data = np.ndarray((sum(n for n in lengths if n > 0),), dtype=np.float64, buffer=shm.buf, offset=8 * k)
+        out: List[ModelRunResult] = []
+        pos = 0
+        chunk = None
+        it = iter(lengths)
+        for stub in stubs:
+            fields: Dict[str, Optional[list]] = {}
+            for f in _SERIES:
+                n = next(it)
+                if n == _ABSENT:
+                    fields[f] = None
+                    continue
+                chunk = data[pos : pos + n]
+                fields[f] = chunk.astype(np.int64).tolist() if f == "time_s" else chunk.tolist()
+                pos += n
+            out.append(replace(stub, **fields))
+        del data, chunk
+        return out
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _cleanup(profiles: Dict[str, SharedMemory], pending: Set[str]) -> None:
+    for name in list(pending):
+        _unlink_by_name(name)
+    pending.clear()
+    for shm in profiles.values():
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    profiles.clear()
+
+
+class SharedMemoryPool:
+    """Pula procesów dla `compare_models` i symulatorów z profilami w pamięci współdzielonej.
+
+    workers: liczba procesów (domyślnie liczba rdzeni).
+    backend: silnik symulacji (`cwu_backends`); None – domyślny procesu głównego.
+    """
+
+    def __init__(self, workers: Optional[int] = None, backend: Optional[str] = None):
+        # Tracker przed startem procesów roboczych – wszystkie korzystają z tego samego
+        resource_tracker.ensure_running()
+        # Nazwa ustalona tu, bo procesy robocze nie widzą set_default_backend() procesu głównego
+        self.backend = get_backend(backend).name
+        self._executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self._prefix = f"cwu_{os.getpid()}_{secrets.token_hex(4)}_"
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, SharedMemory] = {}
+        self._pending: Set[str] = set()
+        self._finalizer = weakref.finalize(self, _cleanup, self._profiles, self._pending)
+
+    # --- Profile ---
+
+    def publish(self, demand_lpm: DemandProfile) -> SharedProfile:
+        """Kopiuje profil do pamięci współdzielonej (raz); uchwyt można przekazać do wielu zadań."""
+        values = np.asarray(demand_lpm, dtype=np.float64).ravel()
+        name = f"{self._prefix}p{next(self._ids)}"
+        shm = SharedMemory(name=name, create=True, size=max(1, values.nbytes))
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        with self._lock:
+            self._profiles[name] = shm
+        return SharedProfile(name=name, length=int(values.size))
+
+    def release(self, profile: SharedProfile) -> None:
+        """Usuwa profil, gdy nie jest już potrzebny (zadania w toku muszą być zakończone)."""
+        with self._lock:
+            shm = self._profiles.pop(profile.name, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    # --- Zadania ---
+
+    def _submit(self, fn, profile: SharedProfile, *args: Any) -> Tuple[Future, str]:
+        if profile.name not in self._profiles:
+            raise ValueError(f"Profil {profile.name!r} nie został opublikowany w tej puli.")
+        block = f"{self._prefix}r{next(self._ids)}"
+        with self._lock:
+            self._pending.add(block)
+        return self._executor.submit(fn, block, profile, self.backend, *args), block
+
+    def _chain(self, inner: Future, block: str, restore) -> Future:
+        outer: Future = Future()
+
+        def done(f: Future) -> None:
+            try:
+                if f.cancelled():
+                    outer.cancel()
+                    return
+                exc = f.exception()
+                if exc is not None:
+                    outer.set_exception(exc)
+                    return
+                try:
+                    outer.set_result(restore(f.result(), block))
+                except BaseException as e:  # noqa: BLE001 – błąd odczytu trafia do wywołującego
+                    outer.set_exception(e)
+            finally:
+                # Także po awarii procesu roboczego (BrokenProcessPool): blok mógł już powstać
+                _unlink_by_name(block)
+                with self._lock:
+                    self._pending.discard(block)
+
+        outer.set_running_or_notify_cancel()
+        inner.add_done_callback(done)
+        return outer
+
+    def submit_compare(self, profile: SharedProfile, **kwargs: Any) -> "Future[ComparisonResult]":
+        """`compare_models(demand_lpm=<profil>, **kwargs)` w procesie roboczym."""
+
+        def restore(res: ComparisonResult, block: str) -> ComparisonResult:
+            mix, layered = _read_series(block, (res.mix, res.layered))
+            return replace(res, mix=mix, layered=layered)
+
+        inner, block = self._submit(_task_compare, profile, dict(kwargs))
+        return self._chain(inner, block, restore)
+
+    def submit_simulation(
+        self,
+        profile: SharedProfile,
+        model: str,
+        tank: TankParams,
+        pmax_kW: float,
+        loss_kw: float,
+        allowed_violation_min: float = 0.0,
+        layered: Optional[LayeredParams] = None,
+        **kwargs: Any,
+    ) -> "Future[ModelRunResult]":
+        """Jedna symulacja ("mixed" albo "layered_2zone") w procesie roboczym."""
+        if model not in ("mixed", "layered_2zone"):
+            raise ValueError(f"Nieznany model: {model!r} (dostępne: mixed, layered_2zone)")
+        kwargs = dict(kwargs, tank=tank, pmax_kW=pmax_kW, loss_kw=loss_kw, allowed_violation_min=allowed_violation_min)
+        if model == "layered_2zone":
+            kwargs["layered"] = layered or LayeredParams()
+
+        def restore(res: ModelRunResult, block: str) -> ModelRunResult:
+            return _read_series(block, (res,))[0]
+
+        inner, block = self._submit(_task_simulate, profile, model, kwargs)
+        return self._chain(inner, block, restore)
+
+    # --- Zamykanie ---
+
+    def close(self, wait: bool = True) -> None:
+        """Zamyka pulę i usuwa wszystkie bloki (profile i niedokończone wyniki)."""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        self._finalizer()
+
+    def __enter__(self) -> "SharedMemoryPool":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close(wait=exc[0] is None)
+
+
+if __name__ == "__main__":
+    import time
+
+    from cwu_time_simulation import DEFAULT_AUDIT_PEAKS, RECORD_SUMMARY, LossInput, build_profile_24h
+
+    demand = build_profile_24h(dt_s=1, peaks=DEFAULT_AUDIT_PEAKS) * 7
+    tanks = [TankParams(volume_l=v, T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=1) for v in (300.0, 500.0, 800.0, 1200.0)]
+    t0 = time.perf_counter()
+    with SharedMemoryPool(backend="fast") as pool:
+        prof = pool.publish(demand)
+        futs = [
+            pool.submit_compare(prof, tank=t, loss_input=LossInput(loss_kw=1.0), allowed_violation_min=0.0, recording=RECORD_SUMMARY)
+            for t in tanks
+        ]
+        for t, f in zip(tanks, futs):
+            print(f"V={t.volume_l:.0f} l: Pzam_final={f.result().Pzam_final_kw:.1f} kW")
+    print(f"Czas: {time.perf_counter() - t0:.2f} s")
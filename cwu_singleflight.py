@@ -0,0 +1,86 @@
+"""Łączenie identycznych, równoległych obliczeń (single-flight) w warstwie API.
+
+Pierwsze żądanie o danym kluczu uruchamia obliczenie, kolejne identyczne
+czekają na ten sam wynik. Zasady:
+
+- błąd obliczenia trafia do wszystkich czekających (i nie jest zapamiętywany –
+  następne żądanie liczy od nowa),
+- anulowanie jednego czekającego (np. klient zamknął połączenie) nie przerywa
+  obliczenia pozostałym,
+- gdy odejdą wszyscy czekający, obliczenie jest anulowane – także w wątku
+  roboczym, przez `threading.Event` sprawdzany w callbacku postępu solvera.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Generic, Optional, TypeVar
+
+from cwu_time_simulation import SolverProgress
+
+T = TypeVar("T")
+
+
+class ComputationCancelled(Exception):
+    """Obliczenie przerwane, bo nikt już nie czeka na wynik."""
+
+
+def cancel_checker(cancel: threading.Event) -> Callable[[SolverProgress], None]:
+    """Callback `on_progress` dla `compare_models`, przerywający szukanie Pzam po anulowaniu."""
+
+    def on_progress(_ev: SolverProgress) -> None:
+        if cancel.is_set():
+            raise ComputationCancelled()
+
+    return on_progress
+
+
+@dataclass
+class _Flight(Generic[T]):
+    task: "asyncio.Future[T]"
+    cancel: threading.Event = field(default_factory=threading.Event)
+    waiters: int = 0
+
+
+class SingleFlight(Generic[T]):
+    """Deduplikacja obliczeń po kluczu (w obrębie jednej pętli asyncio / procesu)."""
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, _Flight[T]] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, fn: Callable[[threading.Event], Awaitable[T]]) -> T:
+        """Zwraca wynik `fn(cancel_event)` – wspólny dla równoległych wywołań z tym samym kluczem."""
+        flight: Optional[_Flight[T]] = self._flights.get(key)
+        if flight is None or flight.cancel.is_set():
+            cancel = threading.Event()
+            task = asyncio.ensure_future(fn(cancel))
+            flight = _Flight(task=task, cancel=cancel)
+            self._flights[key] = flight
+            task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # shield: anulowanie tego czekającego nie anuluje wspólnego zadania
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.cancel.set()
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()  # oznacz wyjątek jako odebrany (brak ostrzeżeń asyncio)
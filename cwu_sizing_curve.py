@@ -0,0 +1,385 @@
+"""Krzywa doboru: Pzam (model mieszany i warstwowy) w funkcji pojemności zasobnika.
+
+Odpowiedź na pytanie audytora „co się stanie z mocą zamówioną, jeśli dołożymy
+albo zabierzemy pojemność” – bez `compare_models` od zera dla każdej pojemności.
+
+method="vector" (domyślnie): wszystkie pojemności to tory jednej symulacji
+wektorowej (`cwu_vector_sim`) – jedna bisekcja dla całej krzywej, Pzam
+identyczne z `compare_models` dla każdej pojemności.
+
+method="bracket" (dowolny backend, tryb okresowy): większy zasobnik zwykle nie
+potrzebuje większej mocy, więc dla V_a < V < V_b
+
+    moc niewystarczająca dla V_b  <  Pzam(V)  <=  Pzam(V_a).
+
+Najpierw pełne szukanie dla najmniejszej i największej pojemności, potem
+dziel-i-rządź: środek każdego przedziału szukany jest bisekcją z przedziału
+wyznaczonego przez sąsiadów (`_find_min_pmax(bracket=...)`). Granice tego
+przedziału są sprawdzane (model warstwowy przy małych pojemnościach nie jest
+monotoniczny) – punkt, w którym się nie zgadzają, liczony jest pełnym szukaniem.
+Punkty jednego poziomu są niezależne i liczone równolegle w puli procesów.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cwu_backends import get_backend
+from cwu_time_simulation import (
+    RECORD_SUMMARY,
+    DemandProfile,
+    LayeredParams,
+    LossInput,
+    ModelRunResult,
+    RecordingPolicy,
+    TankParams,
+    _cyclic_runner,
+    _find_min_pmax,
+    analyze_profile,
+    derive_loss_kw,
+)
+from cwu_vector_sim import find_min_pmax_batch, simulate_layered_batch, simulate_mixed_batch
+
+MODELS = ("mixed", "layered_2zone")
+METHODS = ("vector", "bracket")
+
+
+@dataclass(frozen=True)
+class SizingPoint:
+    volume_l: float
+    Pzam_mix_kW: float
+    Pzam_layer_kW: float
+    delta_P_kW: float
+
+
+@dataclass(frozen=True)
+class SizingCurve:
+    points: List[SizingPoint]  # rosnąco wg pojemności
+    loss_kw: float
+    method: str  # "vector" | "bracket"
+    # "vector": liczba symulacji wektorowych (wszystkie pojemności naraz, oba modele);
+    # "bracket": liczba symulacji pojedynczego zasobnika
+    simulations: int
+    cyclic: bool
+
+
+@dataclass(frozen=True)
+class _PointTask:
+    index: int
+    model: str
+    tank: TankParams
+    layered: LayeredParams
+    demand_lpm: List[float]
+    loss_kw: float
+    allowed_violation_min: float
+    bracket: Optional[Tuple[float, float]]
+    pmax_start_kW: float
+    pmax_max_kW: float
+    tol_kW: float
+    backend: Optional[str] = None
+    cyclic: bool = False
+    verify: bool = True
+
+
+@dataclass(frozen=True)
+class _Solved:
+    Pzam_kW: float
+    search_lo_kW: float
+    simulations: int
+
+
+def _simulate(task: _PointTask, pmax_kW: float, rec: RecordingPolicy, state: Optional[List[float]] = None) -> ModelRunResult:
+    sim = get_backend(task.backend)
+    tank = task.tank if state is None else replace(task.tank, T_init_C=state[0])
+    if task.model == "mixed":
+        return sim.simulate_mixed(
+            tank=tank,
+            demand_lpm=task.demand_lpm,
+            pmax_kW=pmax_kW,
+            loss_kw=task.loss_kw,
+            allowed_violation_min=task.allowed_violation_min,
+            recording=rec,
+        )
+    return sim.simulate_layered_2zone(
+        tank=tank,
+        layered=task.layered,
+        demand_lpm=task.demand_lpm,
+        pmax_kW=pmax_kW,
+        loss_kw=task.loss_kw,
+        allowed_violation_min=task.allowed_violation_min,
+        T_init_cold_C=None if state is None else state[1],
+        recording=rec,
+    )
+
+
+def _solve_point(task: _PointTask) -> Tuple[int, str, _Solved]:
+    run = lambda p, rec, state=None: _simulate(task, p, rec, state)  # noqa: E731
+    if task.cyclic:
+        run = _cyclic_runner(run, task.tank, two_zone=task.model != "mixed")
+
+    def ok(p: float) -> bool:
+        return run(p, RECORD_SUMMARY).violation_minutes <= task.allowed_violation_min
+
+    def search(bracket: Optional[Tuple[float, float]]) -> ModelRunResult:
+        return _find_min_pmax(
+            simulate_fn=lambda p: run(p, RECORD_SUMMARY),
+            pmax_start_kW=task.pmax_start_kW,
+            pmax_max_kW=task.pmax_max_kW,
+            tol_kW=task.tol_kW,
+            allowed_violation_min=task.allowed_violation_min,
+            model=task.model,
+            bracket=bracket,
+        )
+
+    sims = 0
+    bracket = task.bracket
+    if bracket is not None and task.verify:
+        # Dolna granica od sąsiada musi tu nadal nie wystarczać (górną sprawdza wynik szukania)
+        sims += 1
+        if ok(bracket[0]):
+            bracket = None
+
+    res = search(bracket)
+    sims += res.search_simulations
+    if bracket is not None and res.violation_minutes > task.allowed_violation_min:
+        # Górna granica od sąsiada jednak nie wystarcza (brak monotoniczności) – pełne szukanie
+        res = search(None)
+        sims += res.search_simulations
+    return task.index, task.model, _Solved(res.Pzam_kW, float(res.search_lo_kW or 0.0), sims)
+
+
+def _bracket_curve(
+    make_task: Callable[[int, str, Optional[Tuple[float, float]]], _PointTask],
+    n: int,
+    tol_kW: float,
+    workers: Optional[int],
+    assume_monotone: bool,
+) -> Tuple[Dict[str, List[float]], int]:
+    """Dziel-i-rządź po pojemnościach; zwraca (Pzam wg modelu, liczba symulacji)."""
+    solved: Dict[str, List[Optional[_Solved]]] = {m: [None] * n for m in MODELS}
+
+    n_workers = 1 if workers == 1 else (workers or os.cpu_count() or 1)
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+
+    def run_level(tasks: List[_PointTask]) -> None:
+        results = executor.map(_solve_point, tasks) if executor is not None else map(_solve_point, tasks)
+        for i, model, sol in results:
+            solved[model][i] = sol
+
+    try:
+        # (1) Skrajne pojemności – pełne szukanie
+        ends = sorted({0, n - 1})
+        run_level([make_task(i, m, None) for m in MODELS for i in ends])
+
+        # (2) Środki przedziałów z przedziałem szukania od sąsiadów; punkty poziomu równolegle
+        spans: List[Tuple[int, int]] = [(0, n - 1)] if n > 2 else []
+        while spans:
+            tasks: List[_PointTask] = []
+            next_spans: List[Tuple[int, int]] = []
+            for a, b in spans:
+                mid = (a + b) // 2
+                for m in MODELS:
+                    lo, hi = solved[m][b].search_lo_kW, solved[m][a].Pzam_kW
+                    if assume_monotone and hi - lo <= tol_kW:
+                        solved[m][mid] = _Solved(hi, lo, 0)
+                    else:
+                        tasks.append(make_task(mid, m, (lo, hi) if lo <= hi else None))
+                next_spans.extend(sp for sp in ((a, mid), (mid, b)) if sp[1] - sp[0] > 1)
+            run_level(tasks)
+            spans = next_spans
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    pzam = {m: [sol.Pzam_kW for sol in solved[m]] for m in MODELS}
+    return pzam, sum(sol.simulations for m in MODELS for sol in solved[m])
+
+
+def _vector_curve(
+    tank: TankParams,
+    layered: LayeredParams,
+    demand: List[float],
+    loss_kw: float,
+    volumes: List[float],
+    allowed_violation_min: float,
+    pmax_start_kW: float,
+    pmax_max_kW: float,
+    tol_kW: float,
+) -> Tuple[Dict[str, List[float]], int]:
+    """Wszystkie pojemności jako tory jednej symulacji wektorowej (ten sam ciąg prób co `_find_min_pmax`)."""
+    common = dict(
+        volume_l=np.asarray(volumes),
+        T_init_C=tank.T_init_C,
+        T_set_C=tank.T_set_C,
+        T_cold_C=tank.T_cold_C,
+        T_min_C=tank.T_min_C,
+        dt_s=tank.dt_s,
+        demand_lpm=np.asarray(demand),
+        loss_kw=loss_kw,
+    )
+    simulate = {
+        "mixed": lambda p: simulate_mixed_batch(**common, pmax_kW=p),
+        "layered_2zone": lambda p: simulate_layered_batch(
+            **common,
+            pmax_kW=p,
+            hot_fraction=layered.hot_fraction,
+            mixing_tau_s=layered.mixing_tau_s,
+            losses_all_hot=layered.losses_split == "all_hot",
+        ),
+    }
+    pzam: Dict[str, List[float]] = {}
+    sims = 0
+    for m in MODELS:
+        p, k = find_min_pmax_batch(
+            simulate[m],
+            len(volumes),
+            pmax_start_kW=pmax_start_kW,
+            pmax_max_kW=pmax_max_kW,
+            tol_kW=tol_kW,
+            allowed_violation_min=allowed_violation_min,
+        )
+        pzam[m] = p.tolist()
+        sims += k
+    return pzam, sims
+
+
+def sizing_curve(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_input: LossInput,
+    volumes_l: Sequence[float],
+    allowed_violation_min: float = 0.0,
+    layered: Optional[LayeredParams] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+    method: Optional[str] = None,
+    workers: Optional[int] = None,
+    backend: Optional[str] = None,
+    cyclic: bool = False,
+    assume_monotone: bool = False,
+) -> SizingCurve:
+    """Pzam_mix i Pzam_layer dla listy pojemności (pozostałe parametry jak w `compare_models`).
+
+    method:
+      "vector" – wszystkie pojemności naraz symulacją wektorową (`cwu_vector_sim`);
+      Pzam identyczne z `compare_models` dla każdej pojemności, ok. 35 symulacji
+      wektorowych na całą krzywą.
+      "bracket" – dziel-i-rządź z przedziałami od sąsiadów, pętle z rejestru
+      backendów, równolegle w puli procesów; Pzam w tol_kW od `compare_models`.
+      None – "vector", chyba że podano backend albo cyclic=True (tych tryb wektorowy
+      nie obsługuje).
+    workers:
+      Liczba procesów dla "bracket" (domyślnie liczba CPU); 1 = liczenie w bieżącym procesie.
+    backend:
+      Silnik symulacji (`cwu_backends`) dla "bracket"; None – domyślny procesu głównego.
+    cyclic:
+      Tryb okresowy jak w `compare_models(cyclic=True)` (tylko "bracket").
+    assume_monotone:
+      Dla "bracket". False (domyślnie) – obie granice przedziału od sąsiadów sprawdzane
+      są symulacją, a przy niezgodności punkt liczony jest pełnym szukaniem. Model
+      warstwowy nie jest monotoniczny przy małych pojemnościach (mała strefa górna).
+      True – granice przyjmowane bez sprawdzania, a punkty z przedziałem węższym niż
+      tol_kW nie kosztują żadnej symulacji (szybki szkic krzywej).
+    """
+    volumes = sorted({float(v) for v in volumes_l})
+    if not volumes:
+        raise ValueError("Podaj co najmniej jedną pojemność.")
+    if volumes[0] <= 0:
+        raise ValueError("Pojemności muszą być > 0.")
+    if tol_kW <= 0:
+        raise ValueError("tol_kW must be > 0")
+    if method is None:
+        method = "bracket" if (cyclic or backend is not None) else "vector"
+    if method not in METHODS:
+        raise ValueError(f"Nieznana metoda: {method!r} (dostępne: {', '.join(METHODS)})")
+    if method == "vector" and cyclic:
+        raise ValueError("Tryb okresowy (cyclic) wymaga method='bracket'.")
+
+    layered_params = layered or LayeredParams()
+    demand = [float(x) for x in demand_lpm]
+
+    # Straty jak w compare_models – zależą od profilu, nie od pojemności
+    P_avg_kW = analyze_profile(
+        demand_lpm=demand,
+        dt_s=tank.dt_s,
+        T_cold_C=tank.T_cold_C,
+        T_delivery_C=tank.T_set_C,
+    ).P_avg_CWU_kW
+    loss_kw = derive_loss_kw(loss_input=loss_input, P_avg_CWU_kW=P_avg_kW)
+
+    if method == "vector":
+        pzam, sims = _vector_curve(
+            tank, layered_params, demand, loss_kw, volumes,
+            allowed_violation_min, pmax_start_kW, pmax_max_kW, tol_kW,
+        )
+    else:
+        # Nazwa ustalona tu, bo procesy robocze nie widzą set_default_backend() procesu głównego
+        backend_name = get_backend(backend).name
+
+        def make_task(i: int, model: str, bracket: Optional[Tuple[float, float]]) -> _PointTask:
+            return _PointTask(
+                index=i,
+                model=model,
+                tank=replace(tank, volume_l=volumes[i]),
+                layered=layered_params,
+                demand_lpm=demand,
+                loss_kw=loss_kw,
+                allowed_violation_min=allowed_violation_min,
+                bracket=bracket,
+                pmax_start_kW=pmax_start_kW,
+                pmax_max_kW=pmax_max_kW,
+                tol_kW=tol_kW,
+                backend=backend_name,
+                cyclic=cyclic,
+                verify=not assume_monotone,
+            )
+
+        pzam, sims = _bracket_curve(make_task, len(volumes), tol_kW, workers, assume_monotone)
+
+    points = [
+        SizingPoint(
+            volume_l=v,
+            Pzam_mix_kW=pzam["mixed"][i],
+            Pzam_layer_kW=pzam["layered_2zone"][i],
+            delta_P_kW=pzam["mixed"][i] - pzam["layered_2zone"][i],
+        )
+        for i, v in enumerate(volumes)
+    ]
+    return SizingCurve(points=points, loss_kw=loss_kw, method=method, simulations=sims, cyclic=cyclic)
+
+
+def curve_table(curve: SizingCurve) -> List[Dict[str, float]]:
+    """Wiersze do GUI/raportu: pojemność, Pzam obu modeli, różnica."""
+    return [
+        {
+            "V_l": p.volume_l,
+            "Pzam_mix_kW": round(p.Pzam_mix_kW, 1),
+            "Pzam_layer_kW": round(p.Pzam_layer_kW, 1),
+            "delta_P_kW": round(p.delta_P_kW, 1),
+        }
+        for p in curve.points
+    ]
+
+
+if __name__ == "__main__":
+    import time
+
+    from cwu_time_simulation import DEFAULT_AUDIT_PEAKS, build_profile_24h
+
+    base = TankParams(volume_l=500.0, T_init_C=55.0, T_set_C=55.0, T_cold_C=10.0, T_min_C=45.0, dt_s=60)
+    t0 = time.perf_counter()
+    curve = sizing_curve(
+        base,
+        build_profile_24h(dt_s=60, peaks=DEFAULT_AUDIT_PEAKS),
+        LossInput(loss_kw=1.0),
+        volumes_l=[200.0 + 40.0 * k for k in range(50)],
+    )
+    print(f"Punkty: {len(curve.points)}, metoda: {curve.method}, symulacje: {curve.simulations}, czas: {time.perf_counter() - t0:.1f} s")
+    for row in curve_table(curve)[::7]:
+        print(row)
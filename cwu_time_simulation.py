@@ -1,11 +1,23 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Optional, Sequence, Tuple
+import math
+import time
+from array import array
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cwu_backends import REFERENCE, SimulationBackend, get_backend, maybe_shadow, register_backend
 
 
 DemandProfile = Sequence[float]  # l/min, w kolejnych krokach dt
 
+# Wersja silnika obliczeń. Podbij przy każdej zmianie, która może zmienić wyniki
+# (fizyka modeli, szukanie Pzam, progi rekomendacji) – unieważnia trwałe cache wyników.
+ENGINE_VERSION = "6.3"
+
 
 @dataclass(frozen=True)
 class TankParams:
@@ -81,6 +93,39 @@ class LossInput:
             raise ValueError("loss_percent_of_pavg musi być >= 0")
 
 
+RECORDING_MODES = ("summary", "every_k", "minmax", "full")
+
+
+@dataclass(frozen=True)
+class RecordingPolicy:
+    """Co symulator zapisuje z przebiegu czasowego.
+
+    mode:
+      "summary" – tylko wartości skalarne (naruszenia, T_min, czasy regeneracji), serie puste,
+      "every_k" – co k-ty krok,
+      "minmax"  – w kubełkach po k kroków próbki z min i max temperatury (w kolejności czasu),
+      "full"    – każdy krok (dotychczasowe zachowanie).
+    float32:
+      Serie temperatur i mocy jako array('f') zamiast list float (4 zamiast ~32 B na próbkę).
+
+    Wartości skalarne (w tym czasy regeneracji) są liczone w locie i nie zależą od trybu.
+    """
+
+    mode: str = "full"
+    k: int = 1
+    float32: bool = False
+
+    def validate(self) -> None:
+        if self.mode not in RECORDING_MODES:
+            raise ValueError(f"Nieznany tryb zapisu: {self.mode!r} (dostępne: {', '.join(RECORDING_MODES)})")
+        if self.k < 1:
+            raise ValueError("k musi być >= 1")
+
+
+RECORD_FULL = RecordingPolicy()
+RECORD_SUMMARY = RecordingPolicy(mode="summary")
+
+
 @dataclass(frozen=True)
 class ModelRunResult:
     model: str
@@ -98,6 +143,37 @@ class ModelRunResult:
     # Dodatkowe serie (opcjonalne)
     T_secondary_C: Optional[List[float]] = None  # layered: T_cold
 
+    # Przebieg szukania Pzam (wypełnia _find_min_pmax)
+    approximate: bool = False  # True => przerwane limitem czasu; Pzam_kW to bezpieczna górna granica
+    search_lo_kW: Optional[float] = None  # największa sprawdzona moc NIEspełniająca warunku
+    search_simulations: int = 0
+
+    # Stan końcowy zasobnika (do kontynuacji symulacji w kolejnym okresie)
+    T_end_primary_C: Optional[float] = None
+    T_end_secondary_C: Optional[float] = None
+
+    # Tryb zapisu serii (RecordingPolicy.mode) – przy innym niż "full" serie są przerzedzone lub puste
+    recording: str = "full"
+
+    # Tryb okresowy (compare_models(cyclic=True)): stan początkowy odtwarzany po jednym okresie profilu
+    cyclic: Optional["CyclicState"] = None
+
+
+@dataclass(frozen=True)
+class CyclicState:
+    """Stan okresowy zasobnika: temperatury na początku okresu, które profil odtwarza na jego końcu.
+
+    T_secondary_C: strefa dolna (tylko model warstwowy).
+    simulations: liczba symulacji okresu zużytych na szukanie stanu (dla danej mocy).
+    residual_C: max |T_koniec - T_początek| dla zwróconego stanu.
+    """
+
+    T_primary_C: float
+    T_secondary_C: Optional[float]
+    simulations: int
+    residual_C: float
+    converged: bool
+
 
 @dataclass(frozen=True)
 class ComparisonResult:
@@ -131,14 +207,33 @@ class ComparisonResult:
     # Dane gotowe pod blok decyzji w GUI
     decision_ui: dict
 
-    # Dane gotowe pod GUI/raport
-    series_for_plot: dict
+    # Dane gotowe pod GUI/raport (series_for_plot – właściwość budowana przy pierwszym odczycie)
     bar_chart: List[dict]
     commentary: str
 
     # Dane pod wykres kosztów (np. rocznych)
     cost_bar_chart_year: List[dict]
 
+    # True, gdy szukanie Pzam przerwał limit czasu (wyniki to bezpieczne górne granice).
+    # ΔP jest wtedy nieustalone: delta_P_kW = 0, a jego zakres to [delta_P_min_kW, delta_P_max_kW].
+    approximate: bool = False
+    delta_P_min_kW: Optional[float] = None
+    delta_P_max_kW: Optional[float] = None
+
+    # True, gdy oba modele liczono w trybie okresowym (powtarzalna doba zamiast pełnego zasobnika na starcie)
+    cyclic: bool = False
+
+    @cached_property
+    def series_for_plot(self) -> dict:
+        return {
+            "time_s": self.mix.time_s,
+            "T_tank_mix_C": self.mix.T_primary_C,
+            "T_hot_layer_C": self.layered.T_primary_C,
+            "T_cold_layer_C": self.layered.T_secondary_C,
+            "P_in_mix_kW": self.mix.P_in_kW,
+            "P_in_layer_kW": self.layered.P_in_kW,
+        }
+
 
 @dataclass(frozen=True)
 class RecommendationThresholds:
@@ -158,6 +253,9 @@ class RecommendationThresholds:
     tank_hours_threshold: float = 1.0  # V_tank / (avg_lpm*60) >= 1h => "duży zasobnik" w relacji do poboru
     stratification_good_tau_s: float = 1800.0
 
+    # Okno „najgorszego poboru”: zasobnik >= maks. objętość pobrana w takim oknie => pokrywa pik z zapasu
+    peak_window_minutes: float = 60.0
+
 
 @dataclass(frozen=True)
 class CostParams:
@@ -254,15 +352,67 @@ def _financial_impact(
     return extra_month, extra_year, extra_total, text, cost_bar_year
 
 
+# Poziom rekomendacji dla wyniku przybliżonego (limit czasu) – A/B/C nie jest wtedy ustalany
+LEVEL_UNDETERMINED = "?"
+
+
 def _decision_color(level: str) -> str:
     # Do GUI: proste mapowanie A/B/C -> zielony/żółty/czerwony
     if level == "A":
         return "green"
     if level == "B":
         return "yellow"
+    if level == LEVEL_UNDETERMINED:
+        return "gray"
     return "red"
 
 
+def _delta_P_bounds(mix_res: ModelRunResult, layered_res: ModelRunResult) -> Tuple[float, float]:
+    """Zakres ΔP [kW] z przedziałów szukania obu modeli: Pzam ∈ (search_lo_kW, Pzam_kW]."""
+    mix_lo = mix_res.search_lo_kW if mix_res.search_lo_kW is not None else 0.0
+    layer_lo = layered_res.search_lo_kW if layered_res.search_lo_kW is not None else 0.0
+    return mix_lo - layered_res.Pzam_kW, mix_res.Pzam_kW - layer_lo
+
+
+def _build_approximate_decision(
+    *,
+    Pzam_mix_kW: float,
+    Pzam_layer_kW: float,
+    delta_P_min_kW: float,
+    delta_P_max_kW: float,
+) -> Tuple[float, str, str, dict]:
+    """Decyzja konserwatywna dla wyniku przerwanego limitem czasu (bez poziomu A/B/C i kosztów).
+
+    Obie moce są tylko górnymi granicami, więc ich różnica nie mówi nic o ΔP –
+    rekomendowana jest górna granica modelu idealnie mieszanego.
+    """
+    P_final = Pzam_mix_kW
+    text = "\n".join([
+        "UWAGA: wynik przybliżony – szukanie mocy zamówionej przerwał limit czasu obliczeń.",
+        "Ze względów bezpieczeństwa rekomenduje się przyjęcie górnej granicy z modelu idealnie mieszanego:",
+        f"Pzam = {P_final:.1f} kW.",
+        "",
+        f"Podane moce są bezpiecznymi górnymi granicami (model warstwowy: ≤ {Pzam_layer_kW:.1f} kW). "
+        f"Różnica między modelami nie została ustalona – mieści się w zakresie od {delta_P_min_kW:.1f} "
+        f"do {delta_P_max_kW:.1f} kW – dlatego nie określono poziomu rekomendacji ani kosztu nadmiarowej mocy.",
+        "Aby ocenić potencjał obniżenia mocy, powtórz obliczenia bez limitu czasu (lub z dłuższym limitem).",
+    ])
+    ui = {
+        "level": LEVEL_UNDETERMINED,
+        "color": _decision_color(LEVEL_UNDETERMINED),
+        "title": "REKOMENDOWANA MOC ZAMÓWIONA (WYNIK PRZYBLIŻONY)",
+        "Pzam_mix_kW": Pzam_mix_kW,
+        "Pzam_layer_kW": Pzam_layer_kW,
+        "Pzam_final_kW": P_final,
+        "rows": [
+            {"label": "Pzam (model idealnie mieszany, górna granica)", "value_kW": Pzam_mix_kW},
+            {"label": "Pzam (model warstwowy, górna granica)", "value_kW": Pzam_layer_kW},
+            {"label": "Pzam (rekomendowana)", "value_kW": P_final},
+        ],
+    }
+    return P_final, "techniczna", text, ui
+
+
 def _build_final_decision(
     *,
     recommendation_level: str,
@@ -352,59 +502,138 @@ def _build_final_decision(
     return P_final, basis, text, ui
 
 
-def _mean(values: Sequence[float]) -> float:
-    if not values:
-        return 0.0
-    return sum(values) / len(values)
+# Okna [min] raportowane w metrykach (maks. objętość pobrana w oknie)
+PEAK_WINDOWS_MIN: Tuple[float, ...] = (10.0, 30.0, 60.0, 120.0, 240.0)
 
 
-def _profile_peak_metrics(
+@dataclass
+class PeakVolumeIndex:
+    """Indeks sum prefiksowych objętości poboru.
+
+    Odpowiada na pytanie „jaka jest maksymalna objętość pobrana w dowolnym
+    oknie o długości w” dla każdego w – jedno zapytanie to O(n) w numpy,
+    wyniki są zapamiętywane.
+    """
+
+    dt_s: int
+    cum_l: np.ndarray  # cum_l[i] = objętość [l] pobrana w krokach 0..i-1 (cum_l[0] = 0)
+    _memo: Dict[int, float] = field(default_factory=dict, repr=False)
+
+    @property
+    def steps(self) -> int:
+        return len(self.cum_l) - 1
+
+    def window_steps(self, window_s: float) -> int:
+        return max(1, int(math.ceil(float(window_s) / self.dt_s - 1e-9)))
+
+    def max_volume_steps(self, w: int) -> float:
+        w = max(1, int(w))
+        if w >= self.steps:
+            return float(self.cum_l[-1])
+        hit = self._memo.get(w)
+        if hit is None:
+            hit = float(np.max(self.cum_l[w:] - self.cum_l[:-w]))
+            self._memo[w] = hit
+        return hit
+
+    def max_volume_l(self, window_s: float) -> float:
+        """Maks. objętość [l] pobrana w dowolnym oknie długości window_s."""
+        return self.max_volume_steps(self.window_steps(window_s))
+
+
+@dataclass(frozen=True)
+class ProfileAnalysis:
+    """Wynik jednego przejścia po profilu: energia, P_avg, metryki pików i indeks okien."""
+
+    E_CWU_kWh: float
+    P_avg_CWU_kW: float
+    metrics: dict
+    window_index: PeakVolumeIndex
+
+
+def analyze_profile(
     demand_lpm: DemandProfile,
     dt_s: int,
-    thresholds: RecommendationThresholds,
-) -> dict:
-    """Metryki profilu poboru (jawne i proste do wyjaśnienia audytorowi)."""
+    T_cold_C: float,
+    T_delivery_C: float,
+    thresholds: Optional[RecommendationThresholds] = None,
+) -> ProfileAnalysis:
+    """Analiza profilu poboru na tablicach (zamiast kilku przejść w pętli Pythona).
 
-    max_lpm = max((float(x) for x in demand_lpm), default=0.0)
-    avg_lpm = _mean([float(x) for x in demand_lpm])
+    Liczy naraz to, co wcześniej robiły osobno pre-pass energii i metryki pików,
+    oraz buduje `PeakVolumeIndex`. Znikomy koszt także dla profili rocznych.
+    """
 
-    peak_thr = max(thresholds.peak_threshold_min_lpm, thresholds.peak_threshold_fraction_of_max * max_lpm)
+    if dt_s <= 0:
+        raise ValueError("dt_s must be > 0")
+    if len(demand_lpm) == 0:
+        raise ValueError("Demand profile cannot be empty.")
+    if T_delivery_C <= T_cold_C:
+        raise ValueError("T_delivery_C musi być > T_cold_C")
 
-    # Segmenty pików (ciągi kroków z demand >= peak_thr)
-    segments_steps: List[int] = []
-    current = 0
-    peak_sum = 0.0
-    total_sum = 0.0
+    thr = thresholds or RecommendationThresholds()
 
-    for x in demand_lpm:
-        v = max(0.0, float(x))
-        total_sum += v
-        if v >= peak_thr:
-            peak_sum += v
-            current += 1
-        else:
-            if current > 0:
-                segments_steps.append(current)
-                current = 0
-    if current > 0:
-        segments_steps.append(current)
+    raw = np.asarray(demand_lpm, dtype=np.float64)
+    v = np.maximum(raw, 0.0)
+    n = raw.shape[0]
+
+    # Energia i P_avg (woda na kranie o T_delivery; rho = 1 kg/l, cp = 4180 J/(kg·K))
+    total_lpm = float(v.sum())
+    total_J = total_lpm * (dt_s / 60.0) * 4180.0 * (T_delivery_C - T_cold_C)
+    total_kWh = total_J / 3_600_000.0
+    total_h = (n * dt_s) / 3600.0
+    p_avg_kW = (total_kWh / total_h) if total_h > 0 else 0.0
+
+    # Metryki pików (jawne i proste do wyjaśnienia audytorowi)
+    max_lpm = float(raw.max())
+    avg_lpm = float(raw.mean())
+    peak_thr = max(thr.peak_threshold_min_lpm, thr.peak_threshold_fraction_of_max * max_lpm)
 
-    max_peak_steps = max(segments_steps, default=0)
-    max_peak_minutes = (max_peak_steps * dt_s) / 60.0
-    peaks_count = len(segments_steps)
+    in_peak = v >= peak_thr
+    peak_sum = float(v[in_peak].sum())
+    # Segmenty pików: ciągi kroków z demand >= peak_thr (granice z różnic maski)
+    edges = np.diff(np.concatenate(([0], in_peak.view(np.int8), [0])))
+    seg_len = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    max_peak_steps = int(seg_len.max()) if seg_len.size else 0
 
     # Udział energii w pikach (przy stałym T_set i T_cold proporcjonalny do sumy lpm w pikach)
-    peak_energy_share = (peak_sum / total_sum) if total_sum > 0 else 0.0
+    peak_energy_share = (peak_sum / total_lpm) if total_lpm > 0 else 0.0
 
-    return {
+    cum_l = np.empty(n + 1, dtype=np.float64)
+    cum_l[0] = 0.0
+    np.cumsum(v * (dt_s / 60.0), out=cum_l[1:])
+    index = PeakVolumeIndex(dt_s=int(dt_s), cum_l=cum_l)
+
+    metrics = {
         "demand_max_lpm": max_lpm,
         "demand_avg_lpm": avg_lpm,
         "peak_threshold_lpm": peak_thr,
-        "peaks_count": peaks_count,
-        "peak_max_duration_min": max_peak_minutes,
+        "peaks_count": int(seg_len.size),
+        "peak_max_duration_min": (max_peak_steps * dt_s) / 60.0,
         "peak_energy_share": peak_energy_share,
+        "peak_window_volume_l": {
+            f"{w:g}": index.max_volume_l(w * 60.0) for w in (*PEAK_WINDOWS_MIN, thr.peak_window_minutes)
+        },
     }
 
+    return ProfileAnalysis(
+        E_CWU_kWh=total_kWh,
+        P_avg_CWU_kW=p_avg_kW,
+        metrics=metrics,
+        window_index=index,
+    )
+
+
+def _profile_peak_metrics(
+    demand_lpm: DemandProfile,
+    dt_s: int,
+    thresholds: RecommendationThresholds,
+) -> dict:
+    """Metryki profilu poboru (jawne i proste do wyjaśnienia audytorowi)."""
+
+    # T_cold/T_delivery nie wpływają na metryki pików – dowolna para T_delivery > T_cold
+    return analyze_profile(demand_lpm, dt_s, T_cold_C=0.0, T_delivery_C=1.0, thresholds=thresholds).metrics
+
 
 def _build_recommendation(
     *,
@@ -429,6 +658,11 @@ def _build_recommendation(
 
     capacity_hours = (tank.volume_l / (avg_lpm * 60.0)) if avg_lpm > 0 else float("inf")
     is_large_tank = capacity_hours >= thresholds.tank_hours_threshold
+
+    # Czy zasobnik mieści najgorszy pobór w oknie peak_window_minutes (z indeksu okien profilu)
+    window_key = f"{thresholds.peak_window_minutes:g}"
+    peak_window_volume_l = profile_metrics.get("peak_window_volume_l", {}).get(window_key)
+    covers_peak_window = peak_window_volume_l is not None and tank.volume_l >= float(peak_window_volume_l)
     is_short_peaks = peak_max_duration_min > 0 and peak_max_duration_min <= thresholds.short_peak_max_minutes
     strat_good = layered_params.mixing_tau_s >= thresholds.stratification_good_tau_s
 
@@ -444,7 +678,7 @@ def _build_recommendation(
         title = "Model idealnie mieszany wystarczający"
     else:
         # "Krytyczny" gdy różnica jest duża i warunki sprzyjają stratyfikacji/pikom
-        if strong_delta and (is_short_peaks or peak_energy_share >= 0.35) and (is_large_tank or strat_good):
+        if strong_delta and (is_short_peaks or peak_energy_share >= 0.35) and (is_large_tank or strat_good or covers_peak_window):
             level = "C"
             title = "Model warstwowy krytyczny"
         else:
@@ -478,6 +712,11 @@ def _build_recommendation(
             reason_parts.append(
                 f"Pojemność zasobnika jest duża w relacji do średniego poboru (≈ {capacity_hours:.2f} h ekwiwalentu)."
             )
+        if covers_peak_window:
+            reason_parts.append(
+                f"Zasobnik mieści największy pobór w oknie {thresholds.peak_window_minutes:.0f} min "
+                f"(≈ {float(peak_window_volume_l):.0f} l)."
+            )
         if strat_good:
             reason_parts.append(
                 f"Założona stratyfikacja jest dobra (mixing_tau_s={layered_params.mixing_tau_s:.0f} s)."
@@ -494,7 +733,7 @@ def _build_recommendation(
             reason_parts.append("Dominują krótkie, intensywne piki poboru.")
         if peak_energy_share > 0:
             reason_parts.append(f"Udział energii pobranej w pikach wynosi około {peak_energy_share*100:.0f}%. ")
-        if is_large_tank:
+        if is_large_tank or covers_peak_window:
             reason_parts.append("Duży zasobnik sprzyja wykorzystaniu stratyfikacji do pokrywania pików.")
         if strat_good:
             reason_parts.append("Dobra stratyfikacja dodatkowo zwiększa różnicę między modelami.")
@@ -515,6 +754,7 @@ def _build_recommendation(
         "stratification_tau_s": layered_params.mixing_tau_s,
         "is_short_peaks": is_short_peaks,
         "is_large_tank": is_large_tank,
+        "tank_covers_peak_window": covers_peak_window,
         "stratification_good": strat_good,
         "thresholds": {
             "deltaP_abs_threshold_kw": thresholds.deltaP_abs_threshold_kw,
@@ -522,6 +762,7 @@ def _build_recommendation(
             "short_peak_max_minutes": thresholds.short_peak_max_minutes,
             "tank_hours_threshold": thresholds.tank_hours_threshold,
             "stratification_good_tau_s": thresholds.stratification_good_tau_s,
+            "peak_window_minutes": thresholds.peak_window_minutes,
         },
     }
 
@@ -542,28 +783,8 @@ def prepass_energy_and_pavg(
     T_delivery ≈ T_set (tu przyjmujemy T_delivery_C = T_set_C).
     """
 
-    if dt_s <= 0:
-        raise ValueError("dt_s must be > 0")
-    if len(demand_lpm) == 0:
-        raise ValueError("Demand profile cannot be empty.")
-    if T_delivery_C <= T_cold_C:
-        raise ValueError("T_delivery_C musi być > T_cold_C")
-
-    rho_kg_per_l = 1.0
-    cp_J_per_kgK = 4180.0
-    dT = T_delivery_C - T_cold_C
-
-    total_J = 0.0
-    for lpm in demand_lpm:
-        v_delivery_l = max(0.0, float(lpm)) * (dt_s / 60.0)
-        m_kg = v_delivery_l * rho_kg_per_l
-        total_J += m_kg * cp_J_per_kgK * dT
-
-    total_kWh = total_J / 3_600_000.0
-    total_h = (len(demand_lpm) * dt_s) / 3600.0
-    p_avg_kW = (total_kWh / total_h) if total_h > 0 else 0.0
-
-    return total_kWh, p_avg_kW
+    res = analyze_profile(demand_lpm, dt_s, T_cold_C=T_cold_C, T_delivery_C=T_delivery_C)
+    return res.E_CWU_kWh, res.P_avg_CWU_kW
 
 
 def derive_loss_kw(loss_input: LossInput, P_avg_CWU_kW: float) -> float:
@@ -599,14 +820,112 @@ def _temp_from_energy_J(E_J: float, volume_l: float, T_cold_C: float) -> float:
     return T_cold_C + (max(0.0, E_J) / (m_kg * cp_J_per_kgK))
 
 
-def _regen_time_s(time_s: List[int], temp_C: List[float], t_min_temp_s: int, threshold_C: float, dt_s: int) -> Optional[int]:
-    if not time_s:
-        return None
-    start_idx = min(len(time_s) - 1, max(0, t_min_temp_s // dt_s))
-    for j in range(start_idx, len(time_s)):
-        if temp_C[j] >= threshold_C:
-            return time_s[j] - t_min_temp_s
-    return None
+class _RegenTracker:
+    """Czasy regeneracji liczone w locie (bez przechowywania serii).
+
+    Odpowiada szukaniu w serii temperatur na początku kroków pierwszego kroku
+    po chwili minimum, w którym temperatura osiąga próg. `observe` wołamy
+    tylko, gdy `pending` – po znalezieniu obu czasów pętla nie płaci nic.
+    """
+
+    __slots__ = ("T_min_C", "T_set_C", "t_min_temp_s", "to_Tmin_s", "to_Tset_s", "pending")
+
+    def __init__(self, T_min_C: float, T_set_C: float):
+        self.T_min_C = T_min_C
+        self.T_set_C = T_set_C
+        self.t_min_temp_s = 0
+        self.to_Tmin_s: Optional[int] = None
+        self.to_Tset_s: Optional[int] = None
+        self.pending = True
+
+    def observe(self, t_s: int, T_C: float) -> None:
+        """Temperatura na początku kroku t_s."""
+        if self.to_Tmin_s is None and T_C >= self.T_min_C:
+            self.to_Tmin_s = t_s - self.t_min_temp_s
+        if self.to_Tset_s is None and T_C >= self.T_set_C:
+            self.to_Tset_s = t_s - self.t_min_temp_s
+        self.pending = self.to_Tmin_s is None or self.to_Tset_s is None
+
+    def new_min(self, t_min_temp_s: int) -> None:
+        self.t_min_temp_s = t_min_temp_s
+        self.to_Tmin_s = None
+        self.to_Tset_s = None
+        self.pending = True
+
+    def finish(self, last_t_s: Optional[int], last_T_C: float) -> Tuple[Optional[int], Optional[int]]:
+        """last_t_s / last_T_C: początek ostatniego kroku i temperatura w nim (None – pusty profil)."""
+        if last_t_s is None:
+            return None, None
+        if self.t_min_temp_s > last_t_s:
+            # Minimum w ostatnim kroku: jak dotąd sprawdzamy tylko ostatnią zapisaną próbkę
+            to_min = (last_t_s - self.t_min_temp_s) if last_T_C >= self.T_min_C else None
+            to_set = (last_t_s - self.t_min_temp_s) if last_T_C >= self.T_set_C else None
+            return to_min, to_set
+        return self.to_Tmin_s, self.to_Tset_s
+
+
+class _SeriesRecorder:
+    """Zapis serii (czas, T_primary, T_secondary, P_in) wg RecordingPolicy."""
+
+    __slots__ = ("mode", "k", "two_zone", "time_s", "T1", "T2", "P", "_bucket")
+
+    def __init__(self, policy: RecordingPolicy, two_zone: bool):
+        policy.validate()
+        self.mode = policy.mode
+        self.k = policy.k
+        self.two_zone = two_zone
+        self.time_s: List[int] = []
+        self.T1 = array("f") if policy.float32 else []
+        self.T2 = (array("f") if policy.float32 else []) if two_zone else None
+        self.P = array("f") if policy.float32 else []
+        # minmax: [próbka z min T1, próbka z max T1, liczba kroków w kubełku]
+        self._bucket: Optional[list] = None
+
+    def _emit(self, t_s: int, T1: float, T2: Optional[float], p: float) -> None:
+        self.time_s.append(t_s)
+        self.T1.append(T1)
+        if self.T2 is not None:
+            self.T2.append(T2)
+        self.P.append(p)
+
+    def add(self, i: int, t_s: int, T1: float, T2: Optional[float], p: float) -> None:
+        mode = self.mode
+        if mode == "full":
+            self._emit(t_s, T1, T2, p)
+        elif mode == "every_k":
+            if i % self.k == 0:
+                self._emit(t_s, T1, T2, p)
+        elif mode == "minmax":
+            sample = (t_s, T1, T2, p)
+            b = self._bucket
+            if b is None:
+                self._bucket = [sample, sample, 1]
+                return
+            if T1 < b[0][1]:
+                b[0] = sample
+            if T1 > b[1][1]:
+                b[1] = sample
+            b[2] += 1
+            if b[2] >= self.k:
+                self._flush()
+
+    def _flush(self) -> None:
+        b = self._bucket
+        if b is None:
+            return
+        lo, hi = b[0], b[1]
+        if lo is hi:
+            self._emit(*lo)
+        else:
+            first, second = (lo, hi) if lo[0] <= hi[0] else (hi, lo)
+            self._emit(*first)
+            self._emit(*second)
+        self._bucket = None
+
+    def finish(self):
+        if self.mode == "minmax":
+            self._flush()
+        return self.time_s, self.T1, self.T2, self.P
 
 
 # --- Model A: idealnie mieszany ---
@@ -618,7 +937,9 @@ def simulate_mixed(
     loss_kw: float,
     allowed_violation_min: float,
     hysteresis_C: float = 0.0,
+    recording: Optional[RecordingPolicy] = None,
 ) -> ModelRunResult:
+    """recording: co zapisywać z przebiegu (domyślnie pełne serie, RECORD_FULL)."""
     if tank.volume_l <= 0:
         raise ValueError("volume_l must be > 0")
     if pmax_kW < 0:
@@ -637,9 +958,9 @@ def simulate_mixed(
     if dT_delivery <= 0:
         raise ValueError("T_set_C musi być > T_cold_C")
 
-    time_s: List[int] = []
-    temps_C: List[float] = []
-    pin_series: List[float] = []
+    policy = recording or RECORD_FULL
+    rec = _SeriesRecorder(policy, two_zone=False) if policy.mode != "summary" else None
+    regen = _RegenTracker(tank.T_min_C, tank.T_set_C)
 
     violation_s = 0
     Tmin_reached = _temp_from_energy_J(E_J, tank.volume_l, tank.T_cold_C)
@@ -650,9 +971,8 @@ def simulate_mixed(
     for i, lpm in enumerate(demand_lpm):
         t_s = i * dt
         T_now = _temp_from_energy_J(E_J, tank.volume_l, tank.T_cold_C)
-
-        time_s.append(t_s)
-        temps_C.append(T_now)
+        if regen.pending:
+            regen.observe(t_s, T_now)
 
         v_delivery_l = max(0.0, float(lpm)) * (dt / 60.0)
         E_draw_J = _energy_capacity_J(v_delivery_l, tank.T_set_C, tank.T_cold_C)
@@ -675,7 +995,8 @@ def simulate_mixed(
             heater_on = T_after < tank.T_set_C
 
         p_in = pmax_kW if heater_on else 0.0
-        pin_series.append(p_in)
+        if rec is not None:
+            rec.add(i, t_s, T_now, None, p_in)
 
         E_J = min(E_cap_J, E_J + p_in * 1000.0 * dt)
 
@@ -686,11 +1007,13 @@ def simulate_mixed(
         if T_end < Tmin_reached:
             Tmin_reached = T_end
             t_min_temp_s = t_s + dt
+            regen.new_min(t_min_temp_s)
 
     violation_minutes = violation_s / 60.0
 
-    regen_to_Tmin_s = _regen_time_s(time_s, temps_C, t_min_temp_s, tank.T_min_C, dt)
-    regen_to_Tset_s = _regen_time_s(time_s, temps_C, t_min_temp_s, tank.T_set_C, dt)
+    last_t_s = (len(demand_lpm) - 1) * dt if len(demand_lpm) else None
+    regen_to_Tmin_s, regen_to_Tset_s = regen.finish(last_t_s, T_now if last_t_s is not None else 0.0)
+    time_s, temps_C, _, pin_series = rec.finish() if rec is not None else ([], [], None, [])
 
     return ModelRunResult(
         model="mixed",
@@ -705,6 +1028,8 @@ def simulate_mixed(
         t_min_temp_s=t_min_temp_s,
         T_min_reached_C=Tmin_reached,
         T_secondary_C=None,
+        T_end_primary_C=_temp_from_energy_J(E_J, tank.volume_l, tank.T_cold_C),
+        recording=policy.mode,
     )
 
 
@@ -718,7 +1043,13 @@ def simulate_layered_2zone(
     loss_kw: float,
     allowed_violation_min: float,
     hysteresis_C: float = 0.0,
+    T_init_cold_C: Optional[float] = None,
+    recording: Optional[RecordingPolicy] = None,
 ) -> ModelRunResult:
+    """T_init_cold_C: temperatura początkowa strefy dolnej (domyślnie tank.T_init_C).
+
+    recording: co zapisywać z przebiegu (domyślnie pełne serie, RECORD_FULL).
+    """
     if tank.volume_l <= 0:
         raise ValueError("volume_l must be > 0")
     if pmax_kW < 0:
@@ -741,14 +1072,15 @@ def simulate_layered_2zone(
     # Pojemność energii do T_set w hot
     E_hot_cap_J = _energy_capacity_J(V_hot, tank.T_set_C, tank.T_cold_C)
 
-    # Start: oba segmenty w tej samej temperaturze początkowej (uproszczenie)
+    # Start: oba segmenty w tej samej temperaturze początkowej (uproszczenie),
+    # chyba że podano stan strefy dolnej z poprzedniego okresu
     E_hot_J = _energy_capacity_J(V_hot, tank.T_init_C, tank.T_cold_C)
-    E_cold_J = _energy_capacity_J(V_cold, tank.T_init_C, tank.T_cold_C)
+    T_init_cold = tank.T_init_C if T_init_cold_C is None else T_init_cold_C
+    E_cold_J = _energy_capacity_J(V_cold, T_init_cold, tank.T_cold_C)
 
-    time_s: List[int] = []
-    Th_series: List[float] = []
-    Tc_series: List[float] = []
-    pin_series: List[float] = []
+    policy = recording or RECORD_FULL
+    rec = _SeriesRecorder(policy, two_zone=True) if policy.mode != "summary" else None
+    regen = _RegenTracker(tank.T_min_C, tank.T_set_C)
 
     violation_s = 0
     Tmin_reached = _temp_from_energy_J(E_hot_J, V_hot, tank.T_cold_C)
@@ -759,11 +1091,9 @@ def simulate_layered_2zone(
     for i, lpm in enumerate(demand_lpm):
         t_s = i * dt
         T_hot = _temp_from_energy_J(E_hot_J, V_hot, tank.T_cold_C)
-        T_cold = _temp_from_energy_J(E_cold_J, V_cold, tank.T_cold_C)
-
-        time_s.append(t_s)
-        Th_series.append(T_hot)
-        Tc_series.append(T_cold)
+        E_cold_J_start = E_cold_J
+        if regen.pending:
+            regen.observe(t_s, T_hot)
 
         # (1) Pobór energii zgodnie z definicją audytową (woda na kranie o T_set)
         v_delivery_l = max(0.0, float(lpm)) * (dt / 60.0)
@@ -822,7 +1152,8 @@ def simulate_layered_2zone(
             heater_on = T_hot_after < tank.T_set_C
 
         p_in = pmax_kW if heater_on else 0.0
-        pin_series.append(p_in)
+        if rec is not None:
+            rec.add(i, t_s, T_hot, _temp_from_energy_J(E_cold_J_start, V_cold, tank.T_cold_C), p_in)
         E_hot_J = min(E_hot_cap_J, E_hot_J + p_in * 1000.0 * dt)
 
         # (5) Komfort dotyczy tylko strefy górnej.
@@ -833,11 +1164,13 @@ def simulate_layered_2zone(
         if T_hot_end < Tmin_reached:
             Tmin_reached = T_hot_end
             t_min_temp_s = t_s + dt
+            regen.new_min(t_min_temp_s)
 
     violation_minutes = violation_s / 60.0
 
-    regen_to_Tmin_s = _regen_time_s(time_s, Th_series, t_min_temp_s, tank.T_min_C, dt)
-    regen_to_Tset_s = _regen_time_s(time_s, Th_series, t_min_temp_s, tank.T_set_C, dt)
+    last_t_s = (len(demand_lpm) - 1) * dt if len(demand_lpm) else None
+    regen_to_Tmin_s, regen_to_Tset_s = regen.finish(last_t_s, T_hot if last_t_s is not None else 0.0)
+    time_s, Th_series, Tc_series, pin_series = rec.finish() if rec is not None else ([], [], [], [])
 
     return ModelRunResult(
         model="layered_2zone",
@@ -852,36 +1185,125 @@ def simulate_layered_2zone(
         t_min_temp_s=t_min_temp_s,
         T_min_reached_C=Tmin_reached,
         T_secondary_C=Tc_series,
+        T_end_primary_C=_temp_from_energy_J(E_hot_J, V_hot, tank.T_cold_C),
+        T_end_secondary_C=_temp_from_energy_J(E_cold_J, V_cold, tank.T_cold_C),
+        recording=policy.mode,
     )
 
 
+# Pętle referencyjne jako backend "reference" (inne silniki: cwu_backends)
+register_backend(SimulationBackend(
+    name=REFERENCE,
+    simulate_mixed=simulate_mixed,
+    simulate_layered_2zone=simulate_layered_2zone,
+    description="Pętle referencyjne (wynik audytowy)",
+))
+
+
 # --- Szukanie minimalnej mocy Pzam ---
 
+@dataclass(frozen=True)
+class SolverProgress:
+    """Zdarzenie postępu szukania Pzam (do logów, API, kolejki zadań).
+
+    phase:
+      "expand" – szukanie pierwszej mocy spełniającej warunek (podwajanie),
+      "bisect" – zawężanie przedziału [p_lo, p_hi],
+      "done"   – koniec (dokładnie albo po limicie czasu, wtedy approximate=True).
+    """
+
+    model: str
+    phase: str
+    p_lo_kW: float
+    p_hi_kW: Optional[float]
+    simulations: int
+    elapsed_s: float
+    approximate: bool = False
+
+
+ProgressCallback = Callable[[SolverProgress], None]
+
+
 def _find_min_pmax(
     simulate_fn,
     pmax_start_kW: float,
     pmax_max_kW: float,
     tol_kW: float,
     allowed_violation_min: float,
+    deadline: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    model: str = "",
+    finalize_fn: Optional[Callable[[float], ModelRunResult]] = None,
+    bracket: Optional[Tuple[float, float]] = None,
 ) -> ModelRunResult:
+    """Bisekcja minimalnej mocy spełniającej kryterium komfortu.
+
+    deadline (time.monotonic()) włącza tryb „anytime”: po jego upływie
+    zwracamy najlepszą dotąd *bezpieczną* górną granicę (moc sprawdzoną
+    symulacją) z flagą approximate=True. Faza podwajania nie jest przerywana –
+    bez niej nie ma żadnej bezpiecznej wartości do zwrócenia.
+
+    finalize_fn: jeśli podane, wynik dla znalezionej mocy liczony jest nim ponownie
+    (próby szukania mogą wtedy iść w trybie zapisu "summary", a serie tylko raz).
+
+    bracket: (moc niespełniająca, moc spełniająca) znane z góry – np. z sąsiednich
+    wariantów, gdy Pzam jest w nich monotoniczne. Faza podwajania jest pomijana,
+    a bisekcja startuje z tego przedziału; górnej granicy nie sprawdzamy osobno
+    (wynik dla niej liczony jest na końcu tylko wtedy, gdy żadna próba się nie udała).
+    """
     if tol_kW <= 0:
         raise ValueError("tol_kW must be > 0")
 
+    t0 = time.monotonic()
+    sims = 0
+
     def ok(p_kW: float) -> Tuple[bool, ModelRunResult]:
+        nonlocal sims
         res = simulate_fn(p_kW)
+        sims += 1
         return (res.violation_minutes <= allowed_violation_min), res
 
-    p_hi = max(0.0, float(pmax_start_kW))
-    hi_ok, res_hi = ok(p_hi)
-    while (not hi_ok) and p_hi < pmax_max_kW:
-        p_hi *= 2.0
+    def emit(phase: str, lo: float, hi: Optional[float], approximate: bool = False) -> None:
+        if on_progress is not None:
+            on_progress(SolverProgress(
+                model=model,
+                phase=phase,
+                p_lo_kW=lo,
+                p_hi_kW=hi,
+                simulations=sims,
+                elapsed_s=time.monotonic() - t0,
+                approximate=approximate,
+            ))
+
+    # p_fail: największa sprawdzona moc niespełniająca warunku (do raportowania przedziału).
+    # Sama bisekcja startuje od 0 jak dotąd, więc wyniki dokładne się nie zmieniają.
+    res_hi: Optional[ModelRunResult]
+    if bracket is not None:
+        p_fail, p_hi = float(bracket[0]), float(bracket[1])
+        if not (0.0 <= p_fail <= p_hi):
+            raise ValueError("bracket musi spełniać 0 <= moc niespełniająca <= moc spełniająca")
+        res_hi = None
+        p_lo = p_fail
+    else:
+        p_fail = 0.0
+        p_hi = max(0.0, float(pmax_start_kW))
         hi_ok, res_hi = ok(p_hi)
+        while (not hi_ok) and p_hi < pmax_max_kW:
+            p_fail = p_hi
+            emit("expand", p_fail, None)
+            p_hi *= 2.0
+            hi_ok, res_hi = ok(p_hi)
 
-    if not hi_ok:
-        raise RuntimeError(f"Nie znaleziono Pmax spełniającego warunek do {pmax_max_kW} kW.")
+        if not hi_ok:
+            raise RuntimeError(f"Nie znaleziono Pmax spełniającego warunek do {pmax_max_kW} kW.")
 
-    p_lo = 0.0
+        p_lo = 0.0
+    approximate = False
     while (p_hi - p_lo) > tol_kW:
+        emit("bisect", max(p_lo, p_fail), p_hi)
+        if deadline is not None and time.monotonic() >= deadline:
+            approximate = True
+            break
         p_mid = 0.5 * (p_lo + p_hi)
         mid_ok, res_mid = ok(p_mid)
         if mid_ok:
@@ -890,82 +1312,170 @@ def _find_min_pmax(
         else:
             p_lo = p_mid
 
-    return res_hi
+    p_lo = max(p_lo, p_fail)
+    emit("done", p_lo, p_hi, approximate)
+    if finalize_fn is not None:
+        res_hi = finalize_fn(p_hi)
+        sims += 1
+    elif res_hi is None:
+        res_hi = simulate_fn(p_hi)
+        sims += 1
+    return replace(res_hi, approximate=approximate, search_lo_kW=p_lo, search_simulations=sims)
+
+
+# --- Stan okresowy (profil powtarzany co okres) ---
+
+CYCLIC_TOL_C = 0.01
+CYCLIC_MAX_SIMULATIONS = 25
+_ANDERSON_DEPTH = 2
+
+
+def _end_state(res: ModelRunResult, two_zone: bool) -> np.ndarray:
+    if two_zone:
+        return np.array([res.T_end_primary_C, res.T_end_secondary_C], dtype=float)
+    return np.array([res.T_end_primary_C], dtype=float)
+
+
+def solve_cyclic_state(
+    run_from: Callable[[List[float]], ModelRunResult],
+    x0: Sequence[float],
+    lo_C: float,
+    hi_C: float,
+    tol_C: float = CYCLIC_TOL_C,
+    max_simulations: int = CYCLIC_MAX_SIMULATIONS,
+) -> Tuple[ModelRunResult, CyclicState]:
+    """Stan początkowy x odtwarzany po jednym okresie: x = F(x), F – stan końcowy symulacji od x.
+
+    run_from(x): symulacja jednego okresu ze stanu x ([T] albo [T_hot, T_cold]).
+    Iteracja Andersona (głębokość 2; w 1D to metoda siecznych / Steffensena) na
+    temperaturach końcowych, iteraty przycinane do [lo_C, hi_C]. Gdy F ma w danym
+    kierunku nachylenie 1 (grzałka pracuje bez przerwy i nie nadąża, albo zasobnik
+    dobija do T_set), krok siecznych jest nieokreślony – skaczemy wtedy na granicę
+    (pusty / pełny zasobnik), do której zmierzałaby zwykła iteracja dzień po dniu.
+
+    Zwraca wynik symulacji okresu rozpoczętego ze znalezionego stanu oraz sam stan.
+    Bez zbieżności w max_simulations – stan o najmniejszej odchyłce (converged=False).
+    """
+    if tol_C <= 0:
+        raise ValueError("tol_C musi być > 0")
+    if max_simulations < 1:
+        raise ValueError("max_simulations musi być >= 1")
+
+    x = np.clip(np.asarray(x0, dtype=float), lo_C, hi_C)
+    two_zone = x.size == 2
+    xs: List[np.ndarray] = []
+    gs: List[np.ndarray] = []
+    best: Optional[Tuple[ModelRunResult, np.ndarray, float]] = None
+
+    for k in range(1, max_simulations + 1):
+        res = run_from(x.tolist())
+        g = _end_state(res, two_zone)
+        f = g - x
+        resid = float(np.max(np.abs(f)))
+        if best is None or resid < best[2]:
+            best = (res, x, resid)
+        if resid <= tol_C:
+            break
+
+        xs.append(x)
+        gs.append(g)
+        del xs[:-(_ANDERSON_DEPTH + 1)], gs[:-(_ANDERSON_DEPTH + 1)]
+
+        x_new = g
+        if len(xs) > 1:
+            fs = [gi - xi for gi, xi in zip(gs, xs)]
+            dF = np.column_stack([fs[i + 1] - fs[i] for i in range(len(fs) - 1)])
+            dG = np.column_stack([gs[i + 1] - gs[i] for i in range(len(gs) - 1)])
+            dX = np.column_stack([xs[i + 1] - xs[i] for i in range(len(xs) - 1)])
+            if np.max(np.abs(dF)) <= 1e-9 * max(1.0, float(np.max(np.abs(dX)))):
+                # F(x) = x + c: przesunięcie o stałą co okres, aż do granicy
+                x_new = np.where(f < 0.0, lo_C, np.where(f > 0.0, hi_C, g))
+            else:
+                gamma = np.linalg.lstsq(dF, f, rcond=None)[0]
+                x_new = g - dG @ gamma
+        if not np.all(np.isfinite(x_new)):
+            x_new = g
+        x = np.clip(x_new, lo_C, hi_C)
+
+    res, x_best, resid = best
+    state = CyclicState(
+        T_primary_C=float(x_best[0]),
+        T_secondary_C=float(x_best[1]) if two_zone else None,
+        simulations=k,
+        residual_C=resid,
+        converged=resid <= tol_C,
+    )
+    return res, state
 
 
-def compare_models(
+def _cyclic_runner(
+    run: Callable[..., ModelRunResult],
     tank: TankParams,
-    demand_lpm: DemandProfile,
-    loss_input: LossInput,
-    allowed_violation_min: float,
-    layered: Optional[LayeredParams] = None,
-    thresholds: Optional[RecommendationThresholds] = None,
-    cost_params: Optional[CostParams] = None,
-    pmax_start_kW: float = 10.0,
-    pmax_max_kW: float = 5000.0,
-    tol_kW: float = 0.1,
-) -> ComparisonResult:
-    """Porównuje model idealnie mieszany vs warstwowy 2-strefowy.
+    two_zone: bool,
+) -> Callable[[float, RecordingPolicy], ModelRunResult]:
+    """Opakowuje run(p, rec, state) tak, by każda moc liczona była od swojego stanu okresowego.
 
-    Zwraca strukturę gotową do GUI/raportu:
-    - serie T(t) i P_in(t)
-    - wartości Pzam w formie danych słupkowych
-    - ΔP i ΔP_%
-    - komentarz inżynierski
+    Stan znaleziony dla poprzedniej próby bisekcji jest punktem startowym kolejnej
+    (moce prób szybko się zbliżają, więc i stany). Dla mocy już rozwiązanej
+    (ponowne liczenie z serią w finalize_fn) stan bierzemy z pamięci – bez iteracji.
     """
+    found: Dict[float, CyclicState] = {}
+    warm: List[float] = [tank.T_init_C] * (2 if two_zone else 1)
+
+    def run_cyclic(p: float, rec: RecordingPolicy) -> ModelRunResult:
+        known = found.get(p)
+        if known is not None:
+            state = [known.T_primary_C] + ([known.T_secondary_C] if two_zone else [])
+            return replace(run(p, rec, state), cyclic=known)
+
+        res, cs = solve_cyclic_state(
+            lambda x: run(p, RECORD_SUMMARY, x),
+            x0=warm,
+            lo_C=tank.T_cold_C,
+            hi_C=tank.T_set_C,
+        )
+        found[p] = cs
+        warm[:] = [cs.T_primary_C] + ([cs.T_secondary_C] if two_zone else [])
+        if rec.mode != "summary":
+            res = run(p, rec, warm)
+        return replace(res, cyclic=cs)
 
-    layered_params = layered or LayeredParams()
-    thr = thresholds or RecommendationThresholds()
-
-    # Pre-pass (obowiązkowy): energia i P_avg_CWU wg definicji demand_lpm
-    E_CWU_kWh, P_avg_CWU_kW = prepass_energy_and_pavg(
-        demand_lpm=demand_lpm,
-        dt_s=tank.dt_s,
-        T_cold_C=tank.T_cold_C,
-        T_delivery_C=tank.T_set_C,
-    )
-
-    loss_kw = derive_loss_kw(loss_input=loss_input, P_avg_CWU_kW=P_avg_CWU_kW)
+    return run_cyclic
 
-    profile_metrics = _profile_peak_metrics(demand_lpm=demand_lpm, dt_s=tank.dt_s, thresholds=thr)
 
-    mix_res = _find_min_pmax(
-        simulate_fn=lambda p: simulate_mixed(
-            tank=tank,
-            demand_lpm=demand_lpm,
-            pmax_kW=p,
-            loss_kw=loss_kw,
-            allowed_violation_min=allowed_violation_min,
-        ),
-        pmax_start_kW=pmax_start_kW,
-        pmax_max_kW=pmax_max_kW,
-        tol_kW=tol_kW,
-        allowed_violation_min=allowed_violation_min,
-    )
+def _assemble_result(
+    tank: TankParams,
+    layered_params: LayeredParams,
+    thresholds: RecommendationThresholds,
+    cost_params: Optional[CostParams],
+    analysis: ProfileAnalysis,
+    mix_res: ModelRunResult,
+    layered_res: ModelRunResult,
+    cyclic: bool = False,
+) -> ComparisonResult:
+    """Wynik porównania z gotowych przebiegów obu modeli: ΔP, rekomendacja, koszty, decyzja.
 
-    layered_res = _find_min_pmax(
-        simulate_fn=lambda p: simulate_layered_2zone(
-            tank=tank,
-            layered=layered_params,
-            demand_lpm=demand_lpm,
-            pmax_kW=p,
-            loss_kw=loss_kw,
-            allowed_violation_min=allowed_violation_min,
-        ),
-        pmax_start_kW=pmax_start_kW,
-        pmax_max_kW=pmax_max_kW,
-        tol_kW=tol_kW,
-        allowed_violation_min=allowed_violation_min,
-    )
+    Wydzielone z `compare_models`, żeby cache (`cwu_cache`) mógł złożyć wynik dla
+    własnych progów i kosztów z przebiegów policzonych wcześniej (np. przeskalowanych).
 
-    delta_P = mix_res.Pzam_kW - layered_res.Pzam_kW
-    delta_pct = (delta_P / layered_res.Pzam_kW * 100.0) if layered_res.Pzam_kW > 0 else 0.0
+    Gdy szukanie któregoś modelu przerwał limit czasu, obie moce są tylko górnymi
+    granicami: ΔP podawane jest jako zakres, a decyzja jest konserwatywna (bez
+    poziomu A/B/C i kosztów – `_build_approximate_decision`).
+    """
+    approximate = mix_res.approximate or layered_res.approximate
+    delta_bounds: Optional[Tuple[float, float]] = None
+    if approximate:
+        delta_bounds = _delta_P_bounds(mix_res, layered_res)
+        delta_P = delta_pct = 0.0
+    else:
+        delta_P = mix_res.Pzam_kW - layered_res.Pzam_kW
+        delta_pct = (delta_P / layered_res.Pzam_kW * 100.0) if layered_res.Pzam_kW > 0 else 0.0
 
     rec_level, rec_title, rec_text, econ_hint, rec_metrics = _build_recommendation(
         tank=tank,
         layered_params=layered_params,
-        thresholds=thr,
-        profile_metrics=profile_metrics,
+        thresholds=thresholds,
+        profile_metrics=analysis.metrics,
         delta_P_kW=delta_P,
         delta_P_percent=delta_pct,
     )
@@ -978,25 +1488,37 @@ def compare_models(
     cost_norm = (cost_params or CostParams()).normalized()
     horizon_years = cost_norm.analysis_horizon_years if (cost_norm.cost_per_kw_year_zl is not None or cost_norm.cost_per_kw_month_zl is not None) else None
 
-    P_final, decision_basis, final_text, decision_ui = _build_final_decision(
-        recommendation_level=rec_level,
-        Pzam_mix_kW=mix_res.Pzam_kW,
-        Pzam_layer_kW=layered_res.Pzam_kW,
-        delta_P_kW=delta_P,
-        delta_P_percent=delta_pct,
-        extra_cost_year_zl=extra_year_zl,
-        extra_cost_total_zl=extra_total_zl,
-        horizon_years=horizon_years,
-    )
-
-    series_for_plot = {
-        "time_s": mix_res.time_s,
-        "T_tank_mix_C": mix_res.T_primary_C,
-        "T_hot_layer_C": layered_res.T_primary_C,
-        "T_cold_layer_C": layered_res.T_secondary_C,
-        "P_in_mix_kW": mix_res.P_in_kW,
-        "P_in_layer_kW": layered_res.P_in_kW,
-    }
+    if delta_bounds is None:
+        P_final, decision_basis, final_text, decision_ui = _build_final_decision(
+            recommendation_level=rec_level,
+            Pzam_mix_kW=mix_res.Pzam_kW,
+            Pzam_layer_kW=layered_res.Pzam_kW,
+            delta_P_kW=delta_P,
+            delta_P_percent=delta_pct,
+            extra_cost_year_zl=extra_year_zl,
+            extra_cost_total_zl=extra_total_zl,
+            horizon_years=horizon_years,
+        )
+    else:
+        d_lo, d_hi = delta_bounds
+        P_final, decision_basis, final_text, decision_ui = _build_approximate_decision(
+            Pzam_mix_kW=mix_res.Pzam_kW,
+            Pzam_layer_kW=layered_res.Pzam_kW,
+            delta_P_min_kW=d_lo,
+            delta_P_max_kW=d_hi,
+        )
+        rec_level = LEVEL_UNDETERMINED
+        rec_title = "Wynik przybliżony – poziom rekomendacji nieustalony"
+        rec_text = (
+            "Szukanie mocy zamówionej przerwał limit czasu; obie moce są bezpiecznymi górnymi granicami. "
+            f"Różnica ΔP mieści się w zakresie od {d_lo:.1f} do {d_hi:.1f} kW, więc nie można jej porównać z progami decyzyjnymi."
+        )
+        econ_hint = None
+        econ_commentary = (
+            "Wynik przybliżony (limit czasu obliczeń): różnica mocy między modelami nie została ustalona "
+            f"(zakres od {d_lo:.1f} do {d_hi:.1f} kW), dlatego nie wyliczono kosztu nadmiarowej mocy."
+        )
+        cost_bar_year = []
 
     bar_chart = [
         {
@@ -1015,11 +1537,12 @@ def compare_models(
         delta_P_kW=delta_P,
         delta_P_percent=delta_pct,
         layered_params=layered_params,
+        delta_bounds=delta_bounds,
     )
 
     return ComparisonResult(
-        P_avg_CWU_kW=P_avg_CWU_kW,
-        E_CWU_kWh=E_CWU_kWh,
+        P_avg_CWU_kW=analysis.P_avg_CWU_kW,
+        E_CWU_kWh=analysis.E_CWU_kWh,
         mix=mix_res,
         layered=layered_res,
         delta_P_kW=delta_P,
@@ -1037,14 +1560,183 @@ def compare_models(
         decision_basis=decision_basis,
         final_decision_text=final_text,
         decision_ui=decision_ui,
-        series_for_plot=series_for_plot,
         bar_chart=bar_chart,
         commentary=commentary,
         cost_bar_chart_year=cost_bar_year,
+        approximate=approximate,
+        delta_P_min_kW=None if delta_bounds is None else delta_bounds[0],
+        delta_P_max_kW=None if delta_bounds is None else delta_bounds[1],
+        cyclic=cyclic,
+    )
+
+
+def compare_models(
+    tank: TankParams,
+    demand_lpm: DemandProfile,
+    loss_input: LossInput,
+    allowed_violation_min: float,
+    layered: Optional[LayeredParams] = None,
+    thresholds: Optional[RecommendationThresholds] = None,
+    cost_params: Optional[CostParams] = None,
+    pmax_start_kW: float = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+    time_budget_s: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    recording: Optional[RecordingPolicy] = None,
+    backend: Optional[str] = None,
+    cyclic: bool = False,
+) -> ComparisonResult:
+    """Porównuje model idealnie mieszany vs warstwowy 2-strefowy.
+
+    Zwraca strukturę gotową do GUI/raportu:
+    - serie T(t) i P_in(t)
+    - wartości Pzam w formie danych słupkowych
+    - ΔP i ΔP_%
+    - komentarz inżynierski
+
+    time_budget_s:
+      Limit czasu szukania Pzam (połowa na model mieszany, reszta na warstwowy).
+      Po jego upływie wynik jest bezpieczną górną granicą z approximate=True
+      (ΔP jako zakres, decyzja konserwatywna – zob. `_assemble_result`).
+    on_progress:
+      Wywoływane ze zdarzeniami `SolverProgress` obu modeli.
+    recording:
+      Zapis serii czasowych wyników (domyślnie pełne). Wywołujący, którym wystarczą
+      wartości skalarne (API), podają RECORD_SUMMARY – wtedy serie w ogóle nie powstają.
+    backend:
+      Silnik symulacji z rejestru `cwu_backends` (None – domyślny dla procesu).
+    cyclic:
+      Powtarzalny okres zamiast startu od pełnego zasobnika: każda próbowana moc liczona
+      jest od stanu, który profil odtwarza po jednym okresie (`solve_cyclic_state`).
+      Zwykle 1–3 symulacje na próbę; stan trafia do `ModelRunResult.cyclic`.
+    """
+
+    layered_params = layered or LayeredParams()
+    thr = thresholds or RecommendationThresholds()
+
+    # Pre-pass (obowiązkowy): energia i P_avg_CWU wg definicji demand_lpm + metryki pików – jedna analiza
+    analysis = analyze_profile(
+        demand_lpm=demand_lpm,
+        dt_s=tank.dt_s,
+        T_cold_C=tank.T_cold_C,
+        T_delivery_C=tank.T_set_C,
+        thresholds=thr,
+    )
+    loss_kw = derive_loss_kw(loss_input=loss_input, P_avg_CWU_kW=analysis.P_avg_CWU_kW)
+
+    t_start = time.monotonic()
+    deadline = (t_start + float(time_budget_s)) if time_budget_s is not None else None
+    mix_deadline = (t_start + 0.5 * float(time_budget_s)) if time_budget_s is not None else None
+
+    # Próby bisekcji zawsze bez serii; serie (wg `recording`) liczone raz, dla znalezionej mocy
+    policy = recording or RECORD_FULL
+    policy.validate()
+    sim = get_backend(backend)
+
+    def run_mixed(p: float, rec: RecordingPolicy, state: Optional[List[float]] = None) -> ModelRunResult:
+        return sim.simulate_mixed(
+            tank=tank if state is None else replace(tank, T_init_C=state[0]),
+            demand_lpm=demand_lpm,
+            pmax_kW=p,
+            loss_kw=loss_kw,
+            allowed_violation_min=allowed_violation_min,
+            recording=rec,
+        )
+
+    def run_layered(p: float, rec: RecordingPolicy, state: Optional[List[float]] = None) -> ModelRunResult:
+        if state is None:
+            return sim.simulate_layered_2zone(
+                tank=tank,
+                layered=layered_params,
+                demand_lpm=demand_lpm,
+                pmax_kW=p,
+                loss_kw=loss_kw,
+                allowed_violation_min=allowed_violation_min,
+                recording=rec,
+            )
+        return sim.simulate_layered_2zone(
+            tank=replace(tank, T_init_C=state[0]),
+            layered=layered_params,
+            demand_lpm=demand_lpm,
+            pmax_kW=p,
+            loss_kw=loss_kw,
+            allowed_violation_min=allowed_violation_min,
+            T_init_cold_C=state[1],
+            recording=rec,
+        )
+
+    if cyclic:
+        run_mixed = _cyclic_runner(run_mixed, tank, two_zone=False)
+        run_layered = _cyclic_runner(run_layered, tank, two_zone=True)
+
+    needs_series = policy.mode != "summary"
+
+    mix_res = _find_min_pmax(
+        simulate_fn=lambda p: run_mixed(p, RECORD_SUMMARY),
+        pmax_start_kW=pmax_start_kW,
+        pmax_max_kW=pmax_max_kW,
+        tol_kW=tol_kW,
+        allowed_violation_min=allowed_violation_min,
+        deadline=mix_deadline,
+        on_progress=on_progress,
+        model="mixed",
+        finalize_fn=(lambda p: run_mixed(p, policy)) if needs_series else None,
+    )
+
+    layered_res = _find_min_pmax(
+        simulate_fn=lambda p: run_layered(p, RECORD_SUMMARY),
+        pmax_start_kW=pmax_start_kW,
+        pmax_max_kW=pmax_max_kW,
+        tol_kW=tol_kW,
+        allowed_violation_min=allowed_violation_min,
+        deadline=deadline,
+        on_progress=on_progress,
+        model="layered_2zone",
+        finalize_fn=(lambda p: run_layered(p, policy)) if needs_series else None,
     )
 
+    result = _assemble_result(
+        tank=tank,
+        layered_params=layered_params,
+        thresholds=thr,
+        cost_params=cost_params,
+        analysis=analysis,
+        mix_res=mix_res,
+        layered_res=layered_res,
+        cyclic=cyclic,
+    )
 
-def _engineering_commentary(delta_P_kW: float, delta_P_percent: float, layered_params: LayeredParams) -> str:
+    # Tryb cienia: próbka wywołań liczona w tle drugim silnikiem i porównywana
+    maybe_shadow(
+        primary_backend=sim.name,
+        primary=result,
+        rerun=lambda name: compare_models(
+            tank=tank,
+            demand_lpm=demand_lpm,
+            loss_input=loss_input,
+            allowed_violation_min=allowed_violation_min,
+            layered=layered,
+            thresholds=thresholds,
+            cost_params=cost_params,
+            pmax_start_kW=pmax_start_kW,
+            pmax_max_kW=pmax_max_kW,
+            tol_kW=tol_kW,
+            recording=RECORD_SUMMARY,
+            backend=name,
+            cyclic=cyclic,
+        ),
+        tol_kW=tol_kW,
+    )
+    return result
+
+
+def _engineering_commentary(
+    delta_P_kW: float,
+    delta_P_percent: float,
+    layered_params: LayeredParams,
+    delta_bounds: Optional[Tuple[float, float]] = None,
+) -> str:
     # Krótko, "raportowo" – gotowe do wklejenia do GUI/raportu.
     lines: List[str] = []
 
@@ -1058,7 +1750,12 @@ def _engineering_commentary(delta_P_kW: float, delta_P_percent: float, layered_p
         "a strefa cold działa jak bufor, dzięki czemu T_hot dłużej utrzymuje się powyżej Tmin."
     )
 
-    if delta_P_kW >= 0:
+    if delta_bounds is not None:
+        lines.append(
+            "Szukanie mocy przerwał limit czasu, więc wielkość zawyżenia nie jest ustalona: "
+            f"ΔP mieści się w zakresie od {delta_bounds[0]:.1f} do {delta_bounds[1]:.1f} kW."
+        )
+    elif delta_P_kW >= 0:
         lines.append(
             f"W tym układzie uproszczenie (mieszanie idealne) zawyża wymaganą moc o około {delta_P_kW:.2f} kW "
             f"(≈ {delta_P_percent:.1f}%)."
@@ -1084,23 +1781,33 @@ def _engineering_commentary(delta_P_kW: float, delta_P_percent: float, layered_p
     return "\n".join(lines)
 
 
+# --- Profile referencyjne ---
+
+# Profil „audytowy demonstracyjny”: dwa krótkie piki rano i wieczorem (start_min, duration_min, lpm).
+DEFAULT_AUDIT_PEAKS: List[Tuple[int, int, float]] = [(7 * 60, 20, 60.0), (19 * 60, 20, 50.0)]
+
+
+def build_profile_24h(dt_s: int, peaks: Sequence[Tuple[int, int, float]]) -> List[float]:
+    """Buduje prosty profil dobowy w krokach dt.
+
+    peaks: lista (start_min, duration_min, lpm)
+    """
+    if dt_s <= 0:
+        raise ValueError("dt_s must be > 0")
+
+    steps = int((24 * 3600) / dt_s)
+    prof = [0.0] * steps
+    for start_min, dur_min, lpm in peaks:
+        start_i = int((start_min * 60) / dt_s)
+        end_i = int(((start_min + dur_min) * 60) / dt_s)
+        for i in range(max(0, start_i), min(steps, end_i)):
+            prof[i] = float(lpm)
+    return prof
+
+
 # --- Minimalny przykład uruchomienia (bez wykresów) ---
 
 if __name__ == "__main__":
-    def build_profile_24h(dt_s: int, peaks: List[Tuple[int, int, float]]) -> List[float]:
-        """Buduje prosty profil dobowy w krokach dt.
-
-        peaks: lista (start_min, duration_min, lpm)
-        """
-        steps = int((24 * 3600) / dt_s)
-        prof = [0.0] * steps
-        for start_min, dur_min, lpm in peaks:
-            start_i = int((start_min * 60) / dt_s)
-            end_i = int(((start_min + dur_min) * 60) / dt_s)
-            for i in range(max(0, start_i), min(steps, end_i)):
-                prof[i] = float(lpm)
-        return prof
-
     thr = RecommendationThresholds(deltaP_abs_threshold_kw=5.0, deltaP_percent_threshold=10.0)
     loss_input = LossInput(loss_percent_of_pavg=30.0)
     layered_params = LayeredParams(hot_fraction=0.3, mixing_tau_s=3600.0)
@@ -0,0 +1,476 @@
+"""Zapis rzeczywistego ruchu API i jego odtwarzanie jako test obciążeniowy.
+
+Syntetyczne benchmarki nie oddają rzeczywistej mieszanki wejść `CWUInput`. Moduł
+ma dwie części:
+
+1. Rejestrator (middleware ASGI, włączany jawnie): zmienna CWU_TRAFFIC_LOG=ruch.jsonl
+   (opcjonalnie CWU_TRAFFIC_SAMPLE=0.1 – ułamek zapisywanych żądań). Zapisywane są
+   tylko żądania POST endpointów obliczeniowych, po jednym wierszu JSON:
+   czas [s], ścieżka, dozwolone parametry zapytania, ciało, status, czas obsługi [ms].
+   Prywatność: bez adresów, nagłówków (cookies, user-agent) i treści odpowiedzi;
+   z ciała zostają wyłącznie pola `CWUInput` o wartościach liczbowych/logicznych,
+   więc tekst wpisany przez klienta nie trafia do pliku. Wiersze dopisywane są jednym
+   `write` na deskryptorze O_APPEND (`TrafficLog`) – kilka workerów może pisać do
+   jednego pliku.
+
+2. Odtwarzanie i porównanie (narzędzie wiersza poleceń). Instancja docelowa musi
+   liczyć każde żądanie, a nie czytać trwały cache wyników – inaczej pomiar dotyczy
+   odczytów SQLite, a porównywane odpowiedzi mogą pochodzić z poprzedniej wersji
+   (ENGINE_VERSION bez zmian). Uruchom ją z wyłączonym cache:
+
+    CWU_CACHE_DB="" uvicorn api:app --port 8000
+
+   `odtworz` sprawdza to przez /healthz i odmawia odtworzenia, gdy cache jest
+   włączony (`--dopusc-cache` – tylko do pomiarów samego serwowania z cache).
+
+    python cwu_traffic.py odtworz ruch.jsonl --url http://127.0.0.1:8000 \\
+        [--wspolbieznosc 8] [--przyspieszenie 10] [--wyjscie raport_a.json]
+    python cwu_traffic.py porownaj raport_a.json raport_b.json [--tolerancja 0.1]
+
+   Żądania wysyłane są w odstępach z zapisu podzielonych przez `--przyspieszenie`
+   (0 – bez odstępów, tak szybko, jak pozwala współbieżność). Opóźnienie liczone jest
+   od planowanego momentu wysłania, więc czekanie na wolny slot klienta też się liczy
+   (bez zaniżania ogona przy przeciążeniu). Raport: przepustowość, percentyle
+   opóźnień p50/p90/p99 (odpowiedzi udane), odsetek błędów i odmów 429/503, podział
+   na endpointy oraz skróty odpowiedzi JSON.
+
+   `porownaj` zestawia dwa raporty z tego samego zapisu (np. przed i po zmianie
+   silnika): kod wyjścia 1, gdy przepustowość spadła lub p99 wzrosło o więcej niż
+   tolerancja, odsetek błędów wzrósł o więcej niż `--tolerancja-bledow`, odpowiedzi
+   JSON różnią się (chyba że `--dopusc-zmiane-wynikow`) albo któryś raport zebrano
+   przy włączonym cache wyników.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+# Endpointy obliczeniowe zapisywane przez rejestrator
+RECORDED_PATHS: Tuple[str, ...] = ("/api/cwu/moc-zamowiona", "/api/cwu/raport")
+# Parametry zapytania przepuszczane do zapisu (reszta pomijana)
+_QUERY_FIELDS = ("format",)
+# Ciała dłuższe nie są zapisywane (CWUInput to kilkadziesiąt bajtów)
+_MAX_BODY_BYTES = 16 * 1024
+
+_REJECTED_STATUSES = (429, 503)
+
+
+# --- Rejestrator ---
+
+def _sanitize_body(raw: bytes, fields: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """Tylko znane pola o wartościach liczbowych/logicznych; None – ciało nie jest obiektem JSON."""
+    if len(raw) > _MAX_BODY_BYTES:
+        return None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {
+        k: v
+        for k, v in data.items()
+        if k in fields and (v is None or isinstance(v, (bool, int, float)))
+    }
+
+
+class TrafficLog:
+    """Plik zapisu ruchu (JSONL, O_APPEND); zamykany przez właściciela (lifespan API)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        fd = self._fd
+        if fd is None:
+            return  # po zamknięciu (żądania kończone przy wyłączaniu) – pomijamy
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        os.write(fd, line.encode("utf-8"))
+
+    def close(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+
+class TrafficRecorder:
+    """Middleware ASGI zapisujące wejścia i czasy żądań obliczeniowych do `TrafficLog`."""
+
+    def __init__(
+        self,
+        app: Callable[..., Any],
+        log: TrafficLog,
+        fields: Sequence[str],
+        sample_rate: float = 1.0,
+        paths: Sequence[str] = RECORDED_PATHS,
+    ):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate musi być w zakresie 0..1")
+        self.app = app
+        self.log = log
+        self.fields = frozenset(fields)
+        self.sample_rate = sample_rate
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+            or (self.sample_rate < 1.0 and random.random() >= self.sample_rate)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        chunks: List[bytes] = []
+        status: Optional[int] = None
+
+        async def receive_recorded():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_recorded(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t_wall = time.time()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            query = {k: v for k, v in parse_qsl(scope.get("query_string", b"").decode("latin-1")) if k in _QUERY_FIELDS}
+            self.log.write({
+                "t": round(t_wall, 3),
+                "path": scope["path"],
+                "query": query,
+                "body": _sanitize_body(b"".join(chunks), self.fields),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+            })
+
+
+
+def read_traffic(path: str) -> List[Dict[str, Any]]:
+    """Zapis ruchu posortowany po czasie (wiersze uszkodzone, np. ucięty ostatni, są pomijane)."""
+    records: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and "t" in rec and "path" in rec:
+                records.append(rec)
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+def traffic_digest(records: Sequence[Dict[str, Any]]) -> str:
+    """Skrót odtwarzanych żądań (bez statusów i czasów) – czy dwa raporty dotyczą tego samego ruchu."""
+    h = hashlib.blake2b(digest_size=12)
+    for r in records:
+        h.update(json.dumps([r["path"], r.get("query"), r.get("body")], sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+# --- Odtwarzanie ---
+
+@dataclass(frozen=True)
+class ReplayResult:
+    path: str
+    status: Optional[int]  # None – błąd transportu (brak odpowiedzi)
+    latency_s: float
+    digest: Optional[str]  # skrót odpowiedzi JSON z kodem 200
+
+
+@dataclass(frozen=True)
+class ReplayReport:
+    source: str
+    traffic: str
+    url: str
+    target: Optional[Dict[str, Any]]  # /healthz instancji (m.in. result_cache, engine); None – brak
+    concurrency: int
+    speedup: float
+    requests: int
+    duration_s: float
+    throughput_rps: float
+    latency_ms: Dict[str, float]
+    error_rate: float
+    rejected_rate: float
+    statuses: Dict[str, int]
+    by_path: Dict[str, Dict[str, float]]
+    digests: List[Optional[str]]
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Percentyl metodą najbliższej rangi (0.0 dla pustej listy)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _latency_summary(latencies_s: Sequence[float]) -> Dict[str, float]:
+    ms = sorted(x * 1000.0 for x in latencies_s)
+    return {
+        "p50": round(_percentile(ms, 50), 2),
+        "p90": round(_percentile(ms, 90), 2),
+        "p99": round(_percentile(ms, 99), 2),
+        "max": round(ms[-1], 2) if ms else 0.0,
+        "mean": round(sum(ms) / len(ms), 2) if ms else 0.0,
+    }
+
+
+def _is_success(status: Optional[int]) -> bool:
+    return status is not None and (200 <= status < 300 or status == 304)
+
+
+def _send(base_url: str, record: Dict[str, Any], timeout_s: float) -> Tuple[Optional[int], Optional[str]]:
+    query = record.get("query") or {}
+    url = base_url.rstrip("/") + record["path"] + (f"?{urlencode(query)}" if query else "")
+    body = json.dumps(record.get("body")).encode("utf-8") if record.get("body") is not None else b""
+    req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
+            content = resp.read()
+            is_json = resp.headers.get("Content-Type", "").startswith("application/json")
+            digest = hashlib.blake2b(content, digest_size=12).hexdigest() if is_json and resp.status == 200 else None
+            return resp.status, digest
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, None
+    except (urllib.error.URLError, OSError):
+        return None, None
+
+
+def target_info(url: str, timeout_s: float = 10.0) -> Optional[Dict[str, Any]]:
+    """Odpowiedź /healthz instancji docelowej (None – niedostępna)."""
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/healthz", timeout=timeout_s) as resp:
+            info = json.loads(resp.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    return info if isinstance(info, dict) else None
+
+
+def replay(
+    records: Sequence[Dict[str, Any]],
+    url: str,
+    concurrency: int = 8,
+    speedup: float = 1.0,
+    timeout_s: float = 120.0,
+    source: str = "",
+    target: Optional[Dict[str, Any]] = None,
+) -> ReplayReport:
+    """Wysyła zapisane żądania do `url`, zachowując (przyspieszone) odstępy z zapisu."""
+    if concurrency < 1:
+        raise ValueError("concurrency musi być >= 1")
+    if speedup < 0:
+        raise ValueError("speedup musi być >= 0 (0 – bez odstępów)")
+
+    results: List[Optional[ReplayResult]] = [None] * len(records)
+    first_t = records[0]["t"] if records else 0.0
+
+    def run(i: int, planned: float) -> None:
+        status, digest = _send(url, records[i], timeout_s)
+        results[i] = ReplayResult(records[i]["path"], status, time.perf_counter() - planned, digest)
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        slots = threading.Semaphore(concurrency)
+        for i, rec in enumerate(records):
+            if speedup > 0:
+                planned = t_start + (rec["t"] - first_t) / speedup
+                delay = planned - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                slots.acquire()
+            else:
+                slots.acquire()
+                planned = time.perf_counter()
+            fut = ex.submit(run, i, planned)
+            fut.add_done_callback(lambda _f: slots.release())
+    duration = time.perf_counter() - t_start
+
+    done = [r for r in results if r is not None]
+    statuses: Dict[str, int] = {}
+    for r in done:
+        key = str(r.status) if r.status is not None else "transport"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    def error_rate(rs: Sequence[ReplayResult]) -> float:
+        return sum(1 for r in rs if not _is_success(r.status)) / len(rs) if rs else 0.0
+
+    by_path: Dict[str, Dict[str, float]] = {}
+    for path in sorted({r.path for r in done}):
+        rs = [r for r in done if r.path == path]
+        ok = [r.latency_s for r in rs if _is_success(r.status)]
+        by_path[path] = {"requests": len(rs), "error_rate": round(error_rate(rs), 4), **_latency_summary(ok)}
+
+    return ReplayReport(
+        source=source,
+        traffic=traffic_digest(records),
+        url=url,
+        target=target,
+        concurrency=concurrency,
+        speedup=speedup,
+        requests=len(done),
+        duration_s=round(duration, 3),
+        throughput_rps=round(len(done) / duration, 3) if duration > 0 else 0.0,
+        latency_ms=_latency_summary([r.latency_s for r in done if _is_success(r.status)]),
+        error_rate=round(error_rate(done), 4),
+        rejected_rate=round(sum(1 for r in done if r.status in _REJECTED_STATUSES) / len(done), 4) if done else 0.0,
+        statuses=statuses,
+        by_path=by_path,
+        digests=[r.digest if r is not None else None for r in results],
+    )
+
+
+# --- Porównanie dwóch raportów ---
+
+def compare_reports(
+    base: Dict[str, Any],
+    new: Dict[str, Any],
+    tolerance: float = 0.10,
+    error_tolerance: float = 0.01,
+    allow_result_changes: bool = False,
+) -> Tuple[List[str], List[str]]:
+    """(wiersze zestawienia, lista regresji) dla raportów `replay` zapisanych jako JSON."""
+    lines = [f"{'miara':18s} {'bazowy':>12s} {'nowy':>12s} {'zmiana':>9s}"]
+
+    def row(name: str, a: float, b: float) -> None:
+        change = f"{(b - a) / a * 100.0:+8.1f}%" if a else f"{'-':>9s}"
+        lines.append(f"{name:18s} {a:12.3f} {b:12.3f} {change}")
+
+    row("przepustowość/s", base["throughput_rps"], new["throughput_rps"])
+    for q in ("p50", "p90", "p99", "max"):
+        row(f"opóźnienie {q} ms", base["latency_ms"][q], new["latency_ms"][q])
+    row("błędy", base["error_rate"], new["error_rate"])
+    row("odmowy 429/503", base["rejected_rate"], new["rejected_rate"])
+
+    regressions: List[str] = []
+    if new["throughput_rps"] < base["throughput_rps"] * (1.0 - tolerance):
+        regressions.append("przepustowość spadła ponad tolerancję")
+    if new["latency_ms"]["p99"] > base["latency_ms"]["p99"] * (1.0 + tolerance):
+        regressions.append("p99 opóźnienia wzrosło ponad tolerancję")
+    if new["error_rate"] > base["error_rate"] + error_tolerance:
+        regressions.append("odsetek błędów wzrósł ponad tolerancję")
+
+    for name, rep in (("bazowy", base), ("nowy", new)):
+        target = rep.get("target") or {}
+        if target.get("result_cache") is not False:
+            regressions.append(
+                f"raport {name} zebrany przy włączonym (albo niesprawdzonym) cache wyników – porównanie niewiarygodne"
+            )
+    if (base["concurrency"], base["speedup"]) != (new["concurrency"], new["speedup"]):
+        lines.append("Uwaga: raporty mają różne ustawienia odtwarzania (współbieżność, przyspieszenie).")
+    if base["traffic"] != new["traffic"]:
+        lines.append("Uwaga: raporty dotyczą różnych zapisów ruchu – odpowiedzi nie są porównywane.")
+    else:
+        pairs = [(a, b) for a, b in zip(base["digests"], new["digests"]) if a is not None and b is not None]
+        differing = sum(1 for a, b in pairs if a != b)
+        lines.append(f"Odpowiedzi JSON: porównano {len(pairs)}, różne {differing}")
+        if differing and not allow_result_changes:
+            regressions.append(f"różne odpowiedzi: {differing}")
+    return lines, regressions
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Odtwarzanie zapisanego ruchu API CWU i porównanie wyników.")
+    sub = parser.add_subparsers(dest="tryb", required=True)
+
+    p_replay = sub.add_parser("odtworz", help="Wyślij zapisany ruch do działającej instancji API")
+    p_replay.add_argument("zapis", help="Plik ruchu .jsonl (CWU_TRAFFIC_LOG)")
+    p_replay.add_argument("--url", default="http://127.0.0.1:8000", help="Adres instancji API")
+    p_replay.add_argument("--wspolbieznosc", type=int, default=8, help="Maks. żądań naraz")
+    p_replay.add_argument("--przyspieszenie", type=float, default=1.0, help="Dzielnik odstępów z zapisu (0 – bez odstępów)")
+    p_replay.add_argument("--limit-czasu", type=float, default=120.0, help="Limit czasu odpowiedzi [s]")
+    p_replay.add_argument("--wyjscie", default=None, help="Zapisz raport do pliku JSON")
+    p_replay.add_argument(
+        "--dopusc-cache", action="store_true", help="Odtwórz mimo włączonego cache wyników instancji (bez porównań silnika)"
+    )
+
+    p_cmp = sub.add_parser("porownaj", help="Porównaj dwa raporty odtworzenia (bazowy, nowy)")
+    p_cmp.add_argument("bazowy")
+    p_cmp.add_argument("nowy")
+    p_cmp.add_argument("--tolerancja", type=float, default=0.10, help="Względna tolerancja przepustowości i p99")
+    p_cmp.add_argument("--tolerancja-bledow", type=float, default=0.01, help="Bezwzględna tolerancja odsetka błędów")
+    p_cmp.add_argument("--dopusc-zmiane-wynikow", action="store_true", help="Nie traktuj różnych odpowiedzi jako regresji")
+
+    args = parser.parse_args(argv)
+
+    if args.tryb == "odtworz":
+        records = read_traffic(args.zapis)
+        if not records:
+            parser.error(f"Brak żądań w pliku {args.zapis!r}")
+        target = target_info(args.url)
+        if target is None:
+            print(f"Uwaga: {args.url}/healthz niedostępne – nie wiadomo, czy cache wyników jest wyłączony.", file=sys.stderr)
+        elif target.get("result_cache") is not False and not args.dopusc_cache:
+            print(
+                "Instancja docelowa ma włączony cache wyników – odpowiedzi nie pochodzą z silnika. "
+                'Uruchom ją z CWU_CACHE_DB="" (albo podaj --dopusc-cache).',
+                file=sys.stderr,
+            )
+            return 2
+        report = replay(
+            records,
+            args.url,
+            concurrency=args.wspolbieznosc,
+            speedup=args.przyspieszenie,
+            timeout_s=args.limit_czasu,
+            source=os.path.basename(args.zapis),
+            target=target,
+        )
+        lat = report.latency_ms
+        print(
+            f"Żądania {report.requests} w {report.duration_s:.1f} s → {report.throughput_rps:.1f}/s; "
+            f"p50 {lat['p50']:.1f} ms, p90 {lat['p90']:.1f} ms, p99 {lat['p99']:.1f} ms, max {lat['max']:.1f} ms; "
+            f"błędy {report.error_rate:.1%} (odmowy 429/503 {report.rejected_rate:.1%}); statusy {report.statuses}"
+        )
+        for path, st in report.by_path.items():
+            print(f"  {path}: {int(st['requests'])} żądań, p50 {st['p50']:.1f} ms, p99 {st['p99']:.1f} ms, błędy {st['error_rate']:.1%}")
+        if args.wyjscie:
+            with open(args.wyjscie, "w", encoding="utf-8") as f:
+                json.dump(asdict(report), f, ensure_ascii=False, indent=2)
+        return 0
+
+    with open(args.bazowy, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.nowy, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    lines, regressions = compare_reports(
+        base,
+        new,
+        tolerance=args.tolerancja,
+        error_tolerance=args.tolerancja_bledow,
+        allow_result_changes=args.dopusc_zmiane_wynikow,
+    )
+    print("\n".join(lines))
+    if regressions:
+        print("Regresje: " + "; ".join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
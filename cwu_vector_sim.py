@@ -0,0 +1,384 @@
+"""Wektorowe (numpy) wersje symulatorów: wiele zasobników naraz w układzie struct-of-arrays.
+
+Każdy parametr to tablica o długości N (lub skalar rozgłaszany na N). Krok czasu
+`dt_s` jest wspólny, pętla idzie po czasie, a wszystkie zasobniki liczone są jedną
+operacją na tablicy. Kolejność działań zmiennoprzecinkowych odpowiada
+`simulate_mixed` / `simulate_layered_2zone`, więc dla pojedynczego zasobnika
+wyniki (minuty naruszeń, T_min) są identyczne z pętlami referencyjnymi.
+
+Opcjonalny `node_limit_kW` to wspólny limit mocy węzła: gdy suma żądań grzałek
+go przekracza, moc każdej grzałki jest proporcjonalnie obcinana.
+
+Moc węzła (`P_total_kW`) to energia faktycznie dodana w kroku / dt – w pętlach
+referencyjnych P_in_kW zapisuje Pmax także wtedy, gdy zasobnik jest już prawie
+pełny, co dla sumy wielu budynków zawyżałoby moc jednoczesną.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+_CP = 4180.0  # J/(kg·K), rho = 1 kg/l – jak w cwu_time_simulation
+
+# Wielkości zależne tylko od profilu liczone z góry dla bloku kroków (ogranicza pamięć dla profili rocznych)
+_CHUNK_STEPS = 1024
+
+
+@dataclass(frozen=True)
+class BatchRunResult:
+    """Wynik wektorowej symulacji N zasobników (tablice o długości N)."""
+
+    model: str
+    pmax_kW: np.ndarray
+    violation_minutes: np.ndarray
+    T_min_reached_C: np.ndarray
+    t_min_temp_s: np.ndarray
+    # Stan końcowy (do wznowienia symulacji: sezony, stan okresowy)
+    T_end_primary_C: np.ndarray
+    T_end_secondary_C: Optional[np.ndarray]
+    # Suma mocy faktycznie dostarczonej przez grzałki w każdym kroku [kW] (długość T) – moc jednoczesna węzła
+    P_total_kW: np.ndarray
+
+
+def _lanes(n: int, value: ArrayLike, name: str) -> np.ndarray:
+    arr = np.asarray(value, dtype=np.float64)
+    if arr.ndim == 0:
+        return np.full(n, float(arr))
+    if arr.shape != (n,):
+        raise ValueError(f"{name}: oczekiwano skalara lub tablicy o długości {n}, jest {arr.shape}")
+    return arr.astype(np.float64, copy=True)
+
+
+def _demand_matrix(demand_lpm, n: int) -> np.ndarray:
+    """Profil (T,) wspólny lub (N, T) per zasobnik → tablica (T, N) czytana wierszami w pętli."""
+    d = np.asarray(demand_lpm, dtype=np.float64)
+    if d.ndim == 1:
+        return np.ascontiguousarray(np.broadcast_to(d[:, None], (d.shape[0], n)))
+    if d.ndim == 2 and d.shape[0] == n:
+        return np.ascontiguousarray(d.T)
+    raise ValueError(f"demand_lpm: oczekiwano (T,) lub ({n}, T), jest {d.shape}")
+
+
+def _lane_count(*values) -> int:
+    n = 1
+    for v in values:
+        shape = np.shape(v)
+        if len(shape) == 1 and shape[0] != 1:
+            if n not in (1, shape[0]):
+                raise ValueError("Niezgodne długości tablic parametrów.")
+            n = shape[0]
+    return n
+
+
+def _heat(
+    E: np.ndarray,
+    E_cap: np.ndarray,
+    heater_on: np.ndarray,
+    p_J: np.ndarray,
+    dt: float,
+    node_limit_kW: Optional[float],
+) -> Tuple[np.ndarray, float]:
+    """Dogrzewanie w kroku: zwraca (energia po dogrzaniu, suma mocy faktycznie dostarczonej [kW]).
+
+    Bez limitu węzła – dokładnie jak w pętlach referencyjnych (min(E_cap, E + P·dt)).
+    Z limitem – każda grzałka żąda tyle, ile brakuje do pełnego naładowania (≤ Pmax),
+    a przy przekroczeniu limitu żądania są skalowane proporcjonalnie.
+    """
+    if node_limit_kW is None:
+        E_new = np.minimum(E_cap, E + np.where(heater_on, p_J, 0.0))
+    else:
+        req = np.where(heater_on, np.minimum(p_J, np.maximum(0.0, E_cap - E)), 0.0)
+        total = float(req.sum())
+        limit_J = float(node_limit_kW) * 1000.0 * dt
+        if total > limit_J:
+            req = req * (limit_J / total)
+        E_new = np.minimum(E_cap, E + req)
+    return E_new, float(np.maximum(0.0, E_new - E).sum()) / (1000.0 * dt)
+
+
+def _chunks(total: int, size: int = _CHUNK_STEPS):
+    for c0 in range(0, total, size):
+        yield c0, min(total, c0 + size)
+
+
+def simulate_mixed_batch(
+    *,
+    volume_l: ArrayLike,
+    T_init_C: ArrayLike,
+    T_set_C: ArrayLike,
+    T_cold_C: ArrayLike,
+    T_min_C: ArrayLike,
+    dt_s: int,
+    demand_lpm,
+    pmax_kW: ArrayLike,
+    loss_kw: ArrayLike,
+    hysteresis_C: float = 0.0,
+    node_limit_kW: Optional[float] = None,
+) -> BatchRunResult:
+    """Model idealnie mieszany dla N zasobników naraz (odpowiednik `simulate_mixed`)."""
+
+    n = _lane_count(volume_l, T_init_C, T_set_C, T_cold_C, T_min_C, pmax_kW, loss_kw)
+    if np.ndim(demand_lpm) == 2:
+        n = max(n, np.shape(demand_lpm)[0])
+    V = _lanes(n, volume_l, "volume_l")
+    T_init = _lanes(n, T_init_C, "T_init_C")
+    T_set = _lanes(n, T_set_C, "T_set_C")
+    T_cold = _lanes(n, T_cold_C, "T_cold_C")
+    T_min = _lanes(n, T_min_C, "T_min_C")
+    pmax = _lanes(n, pmax_kW, "pmax_kW")
+    loss = _lanes(n, loss_kw, "loss_kw")
+
+    if np.any(V <= 0):
+        raise ValueError("volume_l must be > 0")
+    if np.any(pmax < 0):
+        raise ValueError("pmax_kW must be >= 0")
+    if np.any(loss < 0):
+        raise ValueError("loss_kw must be >= 0")
+    if dt_s <= 0:
+        raise ValueError("dt_s must be > 0")
+    dT_delivery = T_set - T_cold
+    if np.any(dT_delivery <= 0):
+        raise ValueError("T_set_C musi być > T_cold_C")
+
+    D = _demand_matrix(demand_lpm, n)
+    dt = float(dt_s)
+
+    mcp = V * 1.0 * _CP
+    E_cap = mcp * np.maximum(0.0, T_set - T_cold)
+    E = mcp * np.maximum(0.0, T_init - T_cold)
+    dT_draw = np.maximum(0.0, dT_delivery)
+    E_loss = loss * 1000.0 * dt
+    p_J = pmax * 1000.0 * dt
+    T_on = T_set - hysteresis_C
+
+    viol_s = np.zeros(n)
+    Tmin_reached = T_cold + np.maximum(0.0, E) / mcp
+    t_min_temp = np.zeros(n)
+    heater_on = Tmin_reached < T_set
+    P_total = np.empty(D.shape[0])
+
+    for c0, c1 in _chunks(D.shape[0]):
+        draw_J = (np.maximum(0.0, D[c0:c1]) * (dt / 60.0) * _CP) * dT_draw
+        for k in range(c1 - c0):
+            i = c0 + k
+            E = np.maximum(0.0, E - draw_J[k])
+            E = np.maximum(0.0, E - E_loss)
+
+            T_after = T_cold + np.maximum(0.0, E) / mcp
+            if hysteresis_C > 0:
+                heater_on = np.where(heater_on, T_after < T_set, T_after <= T_on)
+            else:
+                heater_on = T_after < T_set
+
+            E, P_total[i] = _heat(E, E_cap, heater_on, p_J, dt, node_limit_kW)
+
+            T_end = T_cold + np.maximum(0.0, E) / mcp
+            viol_s += (T_end < T_min) * dt
+            lower = T_end < Tmin_reached
+            Tmin_reached = np.where(lower, T_end, Tmin_reached)
+            t_min_temp = np.where(lower, (i + 1) * dt, t_min_temp)
+
+    return BatchRunResult(
+        model="mixed",
+        pmax_kW=pmax,
+        violation_minutes=viol_s / 60.0,
+        T_min_reached_C=Tmin_reached,
+        t_min_temp_s=t_min_temp,
+        T_end_primary_C=T_cold + np.maximum(0.0, E) / mcp,
+        T_end_secondary_C=None,
+        P_total_kW=P_total,
+    )
+
+
+def simulate_layered_batch(
+    *,
+    volume_l: ArrayLike,
+    T_init_C: ArrayLike,
+    T_set_C: ArrayLike,
+    T_cold_C: ArrayLike,
+    T_min_C: ArrayLike,
+    dt_s: int,
+    demand_lpm,
+    pmax_kW: ArrayLike,
+    loss_kw: ArrayLike,
+    hot_fraction: ArrayLike = 0.3,
+    mixing_tau_s: ArrayLike = 3600.0,
+    losses_all_hot: Union[bool, Sequence[bool], np.ndarray] = False,
+    T_init_cold_C: Optional[ArrayLike] = None,
+    hysteresis_C: float = 0.0,
+    node_limit_kW: Optional[float] = None,
+) -> BatchRunResult:
+    """Model warstwowy 2-strefowy dla N zasobników naraz (odpowiednik `simulate_layered_2zone`).
+
+    losses_all_hot odpowiada `LayeredParams.losses_split == "all_hot"` (inaczej "by_volume").
+    """
+
+    n = _lane_count(
+        volume_l, T_init_C, T_set_C, T_cold_C, T_min_C, pmax_kW, loss_kw, hot_fraction, mixing_tau_s
+    )
+    if np.ndim(demand_lpm) == 2:
+        n = max(n, np.shape(demand_lpm)[0])
+    V = _lanes(n, volume_l, "volume_l")
+    T_init = _lanes(n, T_init_C, "T_init_C")
+    T_init_cold = _lanes(n, T_init_C if T_init_cold_C is None else T_init_cold_C, "T_init_cold_C")
+    T_set = _lanes(n, T_set_C, "T_set_C")
+    T_cold = _lanes(n, T_cold_C, "T_cold_C")
+    T_min = _lanes(n, T_min_C, "T_min_C")
+    pmax = _lanes(n, pmax_kW, "pmax_kW")
+    loss = _lanes(n, loss_kw, "loss_kw")
+    hf = _lanes(n, hot_fraction, "hot_fraction")
+    tau = _lanes(n, mixing_tau_s, "mixing_tau_s")
+    all_hot = np.broadcast_to(np.asarray(losses_all_hot, dtype=bool), (n,))
+
+    if np.any(V <= 0):
+        raise ValueError("volume_l must be > 0")
+    if np.any(pmax < 0):
+        raise ValueError("pmax_kW must be >= 0")
+    if np.any(loss < 0):
+        raise ValueError("loss_kw must be >= 0")
+    if dt_s <= 0:
+        raise ValueError("dt_s must be > 0")
+    if np.any((hf < 0.05) | (hf > 0.95)):
+        raise ValueError("hot_fraction powinno być w rozsądnym zakresie (np. 0.05..0.95)")
+
+    D = _demand_matrix(demand_lpm, n)
+    dt = float(dt_s)
+
+    V_hot = V * hf
+    V_cold = V - V_hot
+    mcp_hot = V_hot * 1.0 * _CP
+    mcp_cold = V_cold * 1.0 * _CP
+
+    E_hot_cap = mcp_hot * np.maximum(0.0, T_set - T_cold)
+    E_hot = mcp_hot * np.maximum(0.0, T_init - T_cold)
+    E_cold = mcp_cold * np.maximum(0.0, T_init_cold - T_cold)
+    dT_draw = np.maximum(0.0, T_set - T_cold)
+
+    E_loss_total = loss * 1000.0 * dt
+    E_loss_hot = np.where(all_hot, E_loss_total, E_loss_total * (V_hot / V))
+    E_loss_cold = np.where(all_hot, 0.0, E_loss_total * (V_cold / V))
+
+    mixing = tau > 0
+    mix_any, mix_all = bool(mixing.any()), bool(mixing.all())
+    alpha = np.where(mixing, np.clip(dt / np.where(mixing, tau, 1.0), 0.0, 1.0), 0.0)
+    p_J = pmax * 1000.0 * dt
+    T_on = T_set - hysteresis_C
+
+    viol_s = np.zeros(n)
+    Tmin_reached = T_cold + np.maximum(0.0, E_hot) / mcp_hot
+    t_min_temp = np.zeros(n)
+    heater_on = Tmin_reached < T_set
+    P_total = np.empty(D.shape[0])
+
+    for c0, c1 in _chunks(D.shape[0]):
+        v_l = np.maximum(0.0, D[c0:c1]) * (dt / 60.0)
+        draw_J = (v_l * _CP) * dT_draw
+        moved = v_l > 0
+        frac = np.minimum(1.0, v_l / V_cold)
+        for k in range(c1 - c0):
+            i = c0 + k
+            # (1) pobór z górnej strefy + (1b) dopływ z dolnej (plug-flow)
+            E_hot = np.maximum(0.0, E_hot - draw_J[k])
+            E_tr = E_cold * frac[k]
+            E_cold = np.where(moved[k], np.maximum(0.0, E_cold - E_tr), E_cold)
+            E_hot = np.where(moved[k], np.minimum(E_hot_cap, E_hot + E_tr), E_hot)
+
+            # (2) straty stałą mocą
+            E_hot = np.maximum(0.0, E_hot - E_loss_hot)
+            E_cold = np.maximum(0.0, E_cold - E_loss_cold)
+
+            # (3) powolne mieszanie (relaksacja do Teq)
+            if mix_any:
+                Th = T_cold + np.maximum(0.0, E_hot) / mcp_hot
+                Tc = T_cold + np.maximum(0.0, E_cold) / mcp_cold
+                Teq = (Th * V_hot + Tc * V_cold) / V
+                E_hot_mix = np.minimum(E_hot_cap, mcp_hot * np.maximum(0.0, Th + alpha * (Teq - Th) - T_cold))
+                E_cold_mix = mcp_cold * np.maximum(0.0, Tc + alpha * (Teq - Tc) - T_cold)
+                if mix_all:
+                    E_hot, E_cold = E_hot_mix, E_cold_mix
+                else:
+                    E_hot = np.where(mixing, E_hot_mix, E_hot)
+                    E_cold = np.where(mixing, E_cold_mix, E_cold)
+
+            # (4) sterowanie i dogrzewanie strefy górnej
+            T_hot_after = T_cold + np.maximum(0.0, E_hot) / mcp_hot
+            if hysteresis_C > 0:
+                heater_on = np.where(heater_on, T_hot_after < T_set, T_hot_after <= T_on)
+            else:
+                heater_on = T_hot_after < T_set
+
+            E_hot, P_total[i] = _heat(E_hot, E_hot_cap, heater_on, p_J, dt, node_limit_kW)
+
+            # (5) komfort dotyczy strefy górnej
+            T_hot_end = T_cold + np.maximum(0.0, E_hot) / mcp_hot
+            viol_s += (T_hot_end < T_min) * dt
+            lower = T_hot_end < Tmin_reached
+            Tmin_reached = np.where(lower, T_hot_end, Tmin_reached)
+            t_min_temp = np.where(lower, (i + 1) * dt, t_min_temp)
+
+    return BatchRunResult(
+        model="layered_2zone",
+        pmax_kW=pmax,
+        violation_minutes=viol_s / 60.0,
+        T_min_reached_C=Tmin_reached,
+        t_min_temp_s=t_min_temp,
+        T_end_primary_C=T_cold + np.maximum(0.0, E_hot) / mcp_hot,
+        T_end_secondary_C=T_cold + np.maximum(0.0, E_cold) / mcp_cold,
+        P_total_kW=P_total,
+    )
+
+
+def find_min_pmax_batch(
+    simulate_fn: Callable[[np.ndarray], BatchRunResult],
+    n: int,
+    pmax_start_kW: ArrayLike = 10.0,
+    pmax_max_kW: float = 5000.0,
+    tol_kW: float = 0.1,
+    allowed_violation_min: ArrayLike = 0.0,
+) -> Tuple[np.ndarray, int]:
+    """Bisekcja Pzam dla N zasobników naraz – ten sam ciąg prób co `_find_min_pmax` w każdym torze.
+
+    Jedna symulacja wektorowa na krok (zamiast N osobnych wyszukiwań).
+    Zwraca (Pzam_kW, liczba symulacji wektorowych).
+    """
+    if tol_kW <= 0:
+        raise ValueError("tol_kW must be > 0")
+
+    allowed = _lanes(n, allowed_violation_min, "allowed_violation_min")
+    p_hi = np.maximum(0.0, _lanes(n, pmax_start_kW, "pmax_start_kW"))
+    sims = 1
+    ok = simulate_fn(p_hi).violation_minutes <= allowed
+
+    while True:
+        grow = (~ok) & (p_hi < pmax_max_kW)
+        if not grow.any():
+            break
+        p_try = np.where(grow, p_hi * 2.0, p_hi)
+        sims += 1
+        ok_try = simulate_fn(p_try).violation_minutes <= allowed
+        p_hi = p_try
+        ok = np.where(grow, ok_try, ok)
+
+    if not ok.all():
+        bad = np.flatnonzero(~ok)
+        raise RuntimeError(
+            f"Nie znaleziono Pmax spełniającego warunek do {pmax_max_kW} kW (zasobniki: {bad.tolist()[:10]})."
+        )
+
+    p_lo = np.zeros(n)
+    while True:
+        active = (p_hi - p_lo) > tol_kW
+        if not active.any():
+            break
+        p_mid = np.where(active, 0.5 * (p_lo + p_hi), p_hi)
+        sims += 1
+        mid_ok = simulate_fn(p_mid).violation_minutes <= allowed
+        p_hi = np.where(active & mid_ok, p_mid, p_hi)
+        p_lo = np.where(active & ~mid_ok, p_mid, p_lo)
+
+    return p_hi, sims
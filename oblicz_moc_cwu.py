@@ -1,7 +1,38 @@
+import argparse
+import os
+import sys
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 
+# ========================================
+# STAŁE (PN-B-02377:2015 — MOC ZAMÓWIONA NA POTRZEBY CWU)
+# ========================================
+ZUZYCIE_L_NA_OSOBE = 100   # [l/(os·doba)] → [kg] (1 l = 1 kg)
+CIEPLO_WL = 4186           # [J/(kg·K)] = 4,186 kJ/(kg·K)
+TEMP_WODY = 60.0           # [°C] — temperatura wody w CWU
+SEKUNDY_DOBY = 86400
+
+# Kolumny tabeli portfela budynków
+KOLUMNA_OSOBY = "liczba_osob"
+KOLUMNA_TEMP_ZEW = "temp_zew"
+KOLUMNA_SKUTECZNOSC = "skutecznosc"
+KOLUMNA_MOC_CWU = "moc_cwu_W"
+KOLUMNA_MOC_ZAM = "moc_zam_mpec_W"
+
+
+def _moc_cwu_W(liczba_osob, temp_zew):
+    """Moc ciepła na potrzeby CWU [W].
+
+    Działa zarówno na liczbach, jak i na całych kolumnach (numpy/pandas),
+    więc ten sam wzór obsługuje pojedynczy budynek i cały portfel.
+    """
+    masa_wody = ZUZYCIE_L_NA_OSOBE * liczba_osob
+    return (masa_wody * CIEPLO_WL * (TEMP_WODY - temp_zew)) / SEKUNDY_DOBY
+
+
 def oblicz_moc_cwu(
     liczba_mieszkan=120,
     liczba_osob=400,
@@ -14,13 +45,11 @@ def oblicz_moc_cwu(
     # DANE WEJŚCIOWE (dla bloku wielorodzinnego)
     # ========================================
     # Dane standardowe z PN-B-02377:2015 — MOC ZAMÓWIONA NA POTRZEBY CWU
-    masa_wody = 100 * liczba_osob  # [l] → [kg] (1 l = 1 kg)
-    cieplo_wl = 4186               # [J/(kg·K)] = 4,186 kJ/(kg·K)
-    temp_wody = 60.0               # [°C] — temperatura wody w CWU
+    temp_wody = TEMP_WODY          # [°C] — temperatura wody w CWU
     delta_T = temp_wody - temp_zew # [K]
 
     # Moc ciepła na potrzeby CWU
-    moc_cwu = (masa_wody * cieplo_wl * delta_T) / 86400  # [W]
+    moc_cwu = _moc_cwu_W(liczba_osob, temp_zew)  # [W]
     # Moc zamówiona MPEC
     moc_zam_mpec = moc_cwu / skutecznosc
 
@@ -45,7 +74,7 @@ def oblicz_moc_cwu(
     # WYKRES (dla różnych temperatur zewnętrznych)
     # ========================================
     temperatury_zew = np.linspace(-15, 5, 100)
-    moc_cwu_array = (masa_wody * cieplo_wl * (temp_wody - temperatury_zew)) / 86400
+    moc_cwu_array = _moc_cwu_W(liczba_osob, temperatury_zew)
     moc_zam_mpec_array = moc_cwu_array / skutecznosc
 
     plt.figure(figsize=(10, 6))
@@ -77,5 +106,153 @@ def oblicz_moc_cwu(
     df.to_csv("moc_zamowiona_mpec_cwu.csv", index=False, encoding='utf-8')
     print("\n💾 Dane zapisano do pliku: 'moc_zamowiona_mpec_cwu.csv'")
 
+
+# ========================================
+# PORTFEL BUDYNKÓW (obliczenia kolumnowe, bez print/wykresów)
+# ========================================
+
+def oblicz_moc_cwu_portfel(budynki, skutecznosc=0.85, temp_zew=-5.0):
+    """Moc CWU i moc zamówiona MPEC dla wielu budynków naraz.
+
+    `budynki` to DataFrame z kolumną `liczba_osob` oraz opcjonalnie
+    `temp_zew` (obliczeniowa temperatura zewnętrzna) i `skutecznosc`.
+    Brakujące kolumny przyjmują wartości domyślne z argumentów.
+
+    Liczy wyłącznie operacjami na całych kolumnach (bez pętli po wierszach),
+    nic nie drukuje i nie rysuje. Zwraca nowy DataFrame: kolumny wejściowe
+    + `moc_cwu_W` i `moc_zam_mpec_W`.
+    """
+    if KOLUMNA_OSOBY not in budynki.columns:
+        raise ValueError(f"Brak wymaganej kolumny '{KOLUMNA_OSOBY}'")
+
+    osoby = budynki[KOLUMNA_OSOBY].to_numpy(dtype=np.float64)
+    if KOLUMNA_TEMP_ZEW in budynki.columns:
+        t_zew = budynki[KOLUMNA_TEMP_ZEW].to_numpy(dtype=np.float64)
+    else:
+        t_zew = np.full(osoby.shape, float(temp_zew))
+    if KOLUMNA_SKUTECZNOSC in budynki.columns:
+        eta = budynki[KOLUMNA_SKUTECZNOSC].to_numpy(dtype=np.float64)
+    else:
+        eta = np.full(osoby.shape, float(skutecznosc))
+
+    if np.any(osoby < 0):
+        raise ValueError("liczba_osob musi być >= 0")
+    if np.any((eta <= 0) | (eta > 1)):
+        raise ValueError("skutecznosc musi być w zakresie (0, 1]")
+
+    moc_cwu = _moc_cwu_W(osoby, t_zew)
+
+    wynik = budynki.copy()
+    wynik[KOLUMNA_MOC_CWU] = moc_cwu
+    wynik[KOLUMNA_MOC_ZAM] = moc_cwu / eta
+    return wynik
+
+
+def _czytaj_partie(sciezka, rozmiar_partii):
+    """Czyta tabelę budynków partiami (CSV lub Parquet)."""
+    if sciezka.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        plik = pq.ParquetFile(sciezka)
+        for batch in plik.iter_batches(batch_size=rozmiar_partii):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(sciezka, chunksize=rozmiar_partii)
+
+
+def przelicz_plik_portfela(
+    wejscie,
+    wyjscie,
+    skutecznosc=0.85,
+    temp_zew=-5.0,
+    rozmiar_partii=200_000,
+):
+    """Strumieniowo przelicza plik portfela i zapisuje wyniki (CSV lub Parquet).
+
+    Wejście i wyjście są przetwarzane partiami, więc pamięć nie rośnie
+    z liczbą budynków. Zapis idzie przez pyarrow (wielokrotnie szybszy od
+    `DataFrame.to_csv`); bez pyarrow CSV zapisuje pandas. Zwraca liczbę
+    przeliczonych wierszy.
+    """
+    parquet_out = wyjscie.endswith(".parquet")
+    try:
+        import pyarrow as pa
+    except ImportError:
+        if parquet_out:
+            raise
+        pa = None
+
+    writer = None
+    schemat = None
+    wiersze = 0
+
+    try:
+        for i, partia in enumerate(_czytaj_partie(wejscie, rozmiar_partii)):
+            wynik = oblicz_moc_cwu_portfel(partia, skutecznosc=skutecznosc, temp_zew=temp_zew)
+            if pa is None:
+                wynik.to_csv(
+                    wyjscie,
+                    mode="w" if i == 0 else "a",
+                    header=(i == 0),
+                    index=False,
+                    encoding="utf-8",
+                )
+            else:
+                tabela = pa.Table.from_pandas(wynik, preserve_index=False)
+                if writer is None:
+                    schemat = tabela.schema
+                    if parquet_out:
+                        import pyarrow.parquet as pq
+
+                        writer = pq.ParquetWriter(wyjscie, tabela.schema)
+                    else:
+                        import pyarrow.csv as pacsv
+
+                        writer = pacsv.CSVWriter(wyjscie, tabela.schema)
+                else:
+                    # Partie CSV mogą mieć różne typy (np. int vs float) – ujednolicamy do schematu
+                    # pierwszej partii (pyarrow.csv.CSVWriter nie udostępnia `.schema`)
+                    tabela = tabela.cast(schemat)
+                writer.write_table(tabela)
+            wiersze += len(wynik)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return wiersze
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Moc zamówiona MPEC na potrzeby CWU (pojedynczy budynek lub portfel)."
+    )
+    parser.add_argument("--wejscie", help="Plik CSV/Parquet z kolumnami liczba_osob[, temp_zew, skutecznosc]")
+    parser.add_argument("--wyjscie", help="Plik wynikowy .csv lub .parquet")
+    parser.add_argument("--skutecznosc", type=float, default=0.85, help="Domyślna skuteczność, gdy brak kolumny")
+    parser.add_argument("--temp-zew", type=float, default=-5.0, help="Domyślna temp. zewnętrzna, gdy brak kolumny")
+    parser.add_argument("--partia", type=int, default=200_000, help="Liczba wierszy w jednej partii")
+    args = parser.parse_args(argv)
+
+    if args.wejscie is None:
+        # Tryb demonstracyjny: jeden budynek z wydrukiem i wykresem
+        oblicz_moc_cwu()
+        return 0
+
+    if args.wyjscie is None:
+        root, _ = os.path.splitext(args.wejscie)
+        args.wyjscie = root + "_moc_cwu.csv"
+
+    t0 = time.perf_counter()
+    wiersze = przelicz_plik_portfela(
+        args.wejscie,
+        args.wyjscie,
+        skutecznosc=args.skutecznosc,
+        temp_zew=args.temp_zew,
+        rozmiar_partii=args.partia,
+    )
+    print(f"Przeliczono {wiersze} budynków w {time.perf_counter() - t0:.2f} s → {args.wyjscie}", file=sys.stderr)
+    return 0
+
+
 if __name__ == "__main__":
-    oblicz_moc_cwu()
+    sys.exit(main())
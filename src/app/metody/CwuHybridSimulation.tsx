@@ -30,7 +30,11 @@ export type CWUApiResult = {
   cost_year: number;
   cost_horizon: number;
   decision: string;
-  level: "A" | "B" | "C";
+  // null – wynik przybliżony (limit czasu), zob. approximate i delta_P_min/delta_P_max
+  level: "A" | "B" | "C" | null;
+  approximate?: boolean;
+  delta_P_min?: number | null;
+  delta_P_max?: number | null;
 };
 
 async function calculateCWU(payload: CWUPayload): Promise<CWUApiResult> {